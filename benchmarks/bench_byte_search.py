@@ -0,0 +1,56 @@
+"""
+Compares the CPU cost of searching a log file line by line in text mode, as `search_in_file`
+used to, against the bytes-level search that only decodes the lines that match.
+
+Usage: python benchmarks/bench_byte_search.py [size_in_mb]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parser.byte_search import iter_matching_lines, keyword_finder
+
+
+def text_search(file_path: str, keyword: str) -> list:
+    found = []
+    with open(file_path, 'r') as file:
+        for line in file:
+            if keyword in line:
+                found.append(line.strip('\n'))
+    return found
+
+
+def bytes_search(file_path: str, keyword: str) -> list:
+    with open(file_path, 'rb') as file:
+        return list(iter_matching_lines(file, keyword_finder(keyword)))
+
+
+def write_log_file(file_path: str, size_in_mb: int) -> None:
+    lines = [f'Jan 12 03:14:{i % 60:02d} host app[{i}]: request {i} served in {i % 997} ms\n' for i in range(10000)]
+    lines[5000] = 'Jan 12 03:14:15 host app[1]: ERROR connection refused\n'
+    block = ''.join(lines).encode()
+    with open(file_path, 'wb') as f:
+        for _ in range(size_in_mb * 1024 * 1024 // len(block)):
+            f.write(block)
+
+
+def measure(name: str, search, file_path: str) -> None:
+    size = os.path.getsize(file_path)
+    start = time.process_time()
+    matches = len(search(file_path, 'ERROR'))
+    elapsed = time.process_time() - start
+    print(f"{name:>6}: {elapsed:8.3f} CPU s  {elapsed / (size / 1e9):8.3f} CPU s/GB  {matches} matches")
+
+
+if __name__ == '__main__':
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'bench.log')
+        write_log_file(file_path, size_in_mb)
+        print(f"Searching a {size_in_mb} MB file with few matches")
+        measure('text', text_search, file_path)
+        measure('bytes', bytes_search, file_path)
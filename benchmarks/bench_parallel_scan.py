@@ -0,0 +1,57 @@
+"""
+Compares searching a single large file through the threaded path, where the file is
+scanned by one thread, against the process pool path, where newline-aligned byte ranges
+of the file are scanned in parallel worker processes.
+
+Usage: python benchmarks/bench_parallel_scan.py [size_in_mb] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parser import search_directory
+from parser.parallel_scan import scan_pool
+
+
+def write_log_file(file_path: str, size_in_mb: int) -> None:
+    lines = [
+        f'Jan 12 03:14:{i % 60:02d} host program[{i}]: request {i} served in {i % 997} ms\n'.encode()
+        for i in range(1000)
+    ]
+    lines[500] = b'Jan 12 03:14:15 host program[1]: ERROR connection refused\n'
+    block = b''.join(lines)
+    with open(file_path, 'wb') as f:
+        for _ in range(size_in_mb * 1024 * 1024 // len(block)):
+            f.write(block)
+
+
+def measure(name: str, size: int) -> None:
+    start = time.perf_counter()
+    results = search_directory('ERROR')
+    elapsed = time.perf_counter() - start
+    matches = sum(len(lines) for lines in results.values())
+    print(f"{name:>9}: {elapsed:8.3f} s  {size / elapsed / 1e6:10.1f} MB/s  {matches} matches")
+
+
+if __name__ == '__main__':
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    workers = sys.argv[2] if len(sys.argv) > 2 else str(os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'big.log')
+        write_log_file(file_path, size_in_mb)
+        size = os.path.getsize(file_path)
+        os.environ['LOG_DIRECTORY'] = directory
+        os.environ['PARALLEL_SCAN_WORKERS'] = workers
+        print(f"Searching a {size_in_mb} MB file with {workers} workers")
+
+        os.environ['PARALLEL_SCAN_THRESHOLD'] = str(size + 1)
+        measure('threaded', size)
+
+        # Start the workers before timing, the pool is reused across requests in the server.
+        scan_pool().submit(len, '').result()
+        os.environ['PARALLEL_SCAN_THRESHOLD'] = '0'
+        measure('parallel', size)
@@ -0,0 +1,42 @@
+"""
+Measures how the scan time of a query grows with the number of literal patterns it
+has, comparing the compiled `Query` against checking each pattern separately.
+
+Usage: python benchmarks/bench_query.py [number_of_lines]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parser.query import Query
+
+WORDS = ['connection', 'request', 'user', 'session', 'worker', 'cache', 'disk', 'socket', 'queue', 'thread']
+
+
+def make_lines(n_lines: int) -> list:
+    generator = random.Random(42)
+    return [' '.join(generator.choice(WORDS) for _ in range(12)) for _ in range(n_lines)]
+
+
+def measure(lines: list, patterns: list) -> None:
+    query = Query(' OR '.join(patterns))
+    start = time.perf_counter()
+    compiled_matches = sum(1 for line in lines if query.matches(line))
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    separate_matches = sum(1 for line in lines if any(pattern in line for pattern in patterns))
+    separate = time.perf_counter() - start
+
+    assert compiled_matches == separate_matches
+    print(f"{len(patterns):>3} patterns: compiled {compiled:7.3f} s   separate {separate:7.3f} s")
+
+
+if __name__ == '__main__':
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = make_lines(n_lines)
+    for n_patterns in (1, 2, 4, 8, 16, 32):
+        measure(lines, [f'error-{i}' for i in range(n_patterns)])
@@ -0,0 +1,68 @@
+"""
+Compares the original 1 KB reverse reader with the adaptive chunk reader in
+`parser.reverse_reader`, reporting MB/s and lines/s for a full reverse read
+of a generated log file.
+
+Usage: python benchmarks/bench_reverse_reader.py [size_in_mb]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parser.reverse_reader import reverse_lines
+
+
+def legacy_read_log_lines(file_path: str):
+    """The reverse reader as it was before the adaptive chunk reader replaced it."""
+    chunk_size = 1024
+    with open(file_path, 'rb') as f:
+        f.seek(0, 2)
+        position = f.tell()
+        buffer = b''
+
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+
+            while b'\n' in buffer:
+                line_end = buffer.rfind(b'\n')
+                yield buffer[line_end + 1:].decode('utf-8')
+                buffer = buffer[:line_end]
+
+        if buffer:
+            yield buffer.decode('utf-8')
+
+
+def current_read_log_lines(file_path: str):
+    with open(file_path, 'rb') as f:
+        yield from reverse_lines(f)
+
+
+def write_log_file(file_path: str, size_in_mb: int) -> None:
+    line = b'Jan 12 03:14:15 host program[1234]: a fairly typical log line with some payload\n'
+    with open(file_path, 'wb') as f:
+        f.write(line * (size_in_mb * 1024 * 1024 // len(line)))
+
+
+def measure(name: str, reader, file_path: str) -> None:
+    size = os.path.getsize(file_path)
+    start = time.perf_counter()
+    lines = sum(1 for _ in reader(file_path))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed:8.3f} s  {size / elapsed / 1e6:10.1f} MB/s  {lines / elapsed:12.0f} lines/s")
+
+
+if __name__ == '__main__':
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'bench.log')
+        write_log_file(file_path, size_in_mb)
+        print(f"Reverse read of a {size_in_mb} MB file")
+        measure('before', legacy_read_log_lines, file_path)
+        measure('after', current_read_log_lines, file_path)
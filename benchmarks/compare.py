@@ -0,0 +1,72 @@
+"""
+Compares two result files written by `benchmarks/run_benchmarks.py --output` and prints, for
+every benchmark in both, the change of its p50 latency and throughput. Exits with status 1
+when the p50 of any benchmark regressed by more than the threshold, so it can gate a change.
+
+Usage: python benchmarks/compare.py <baseline.json> <candidate.json> [--threshold 10]
+"""
+import argparse
+import json
+import sys
+from typing import Optional
+
+
+def change(baseline: Optional[float], candidate: Optional[float]) -> Optional[float]:
+    """Returns the relative change from the baseline to the candidate in percent."""
+    if not baseline or candidate is None:
+        return None
+    return (candidate - baseline) / baseline * 100
+
+
+def _format(value: Optional[float]) -> str:
+    return '-' if value is None else f'{value:+.1f}%'
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """
+    Prints the comparison of two benchmark reports.
+
+    Parameters:
+      - baseline (dict): The report of the reference commit.
+      - candidate (dict): The report of the commit being checked.
+      - threshold (float): The p50 slowdown, in percent, above which a benchmark is a regression.
+
+    Returns:
+      - list: The names of the benchmarks that regressed.
+    """
+    print(f"baseline {baseline.get('commit')} -> candidate {candidate.get('commit')}")
+    if baseline.get("corpus", {}).get("config") != candidate.get("corpus", {}).get("config"):
+        print("Warning: the reports were measured on different corpora")
+
+    regressions = []
+    print(f"{'benchmark':<20} {'p50 ms':>10} {'->':>2} {'p50 ms':>10} {'p50':>9} {'MB/s':>9}")
+    for name, before in baseline["results"].items():
+        after = candidate["results"].get(name)
+        if after is None:
+            continue
+        p50 = change(before["p50_ms"], after["p50_ms"])
+        throughput = change(before.get("mb_per_s"), after.get("mb_per_s"))
+        regressed = p50 is not None and p50 > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<20} {before['p50_ms']:>10.2f} {'->':>2} {after['p50_ms']:>10.2f} {_format(p50):>9} "
+              f"{_format(throughput):>9}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline', help='results of the reference commit')
+    parser.add_argument('candidate', help='results of the commit being checked')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='p50 slowdown in percent that counts as a regression')
+    arguments = parser.parse_args()
+
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    with open(arguments.candidate) as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, arguments.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {arguments.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
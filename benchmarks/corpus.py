@@ -0,0 +1,143 @@
+"""
+Generates a deterministic synthetic log corpus for the benchmarks. The same arguments and
+seed always produce byte-identical files, so results can be compared between commits.
+
+Each file is named `app<N>.log` and holds syslog-style lines with increasing ISO-8601
+timestamps. Line lengths follow a log-normal distribution around the requested mean, and
+the given fraction of lines contains the keyword. Optional rotations (`app<N>.log.1.gz`, ...)
+hold older entries and are gzip-compressed.
+
+Usage: python benchmarks/corpus.py <directory> [--files 4] [--size-mb 8] [--line-length 120]
+                                   [--line-jitter 0.5] [--match-density 0.001] [--rotations 1]
+                                   [--keyword ERROR] [--seed 0]
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+WORDS = ('request', 'served', 'connection', 'user', 'session', 'cache', 'timeout', 'retry', 'upstream',
+         'latency', 'worker', 'queue', 'accepted', 'closed', 'token', 'refresh', 'disk', 'sync', 'ok')
+SERVICES = ('nginx', 'sshd', 'cron', 'kernel', 'app', 'db')
+
+# Time covered by each file. Rotations cover the same span just before it.
+FILE_SPAN = timedelta(days=1)
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def corpus_config(files: int = 4, size_mb: float = 8, line_length: int = 120, line_jitter: float = 0.5,
+                  match_density: float = 0.001, rotations: int = 1, keyword: str = 'ERROR', seed: int = 0) -> dict:
+    """Returns the shape of a corpus, as accepted by `generate_corpus`."""
+    return {
+        "files": files, "size_mb": size_mb, "line_length": line_length, "line_jitter": line_jitter,
+        "match_density": match_density, "rotations": rotations, "keyword": keyword, "seed": seed,
+    }
+
+
+def _lines(rng: random.Random, config: dict, target_bytes: int, start: datetime):
+    """Yields the encoded lines of one file until it reaches `target_bytes`."""
+    mean = config["line_length"]
+    sigma = config["line_jitter"]
+    # The mean of a log-normal distribution is exp(mu + sigma^2 / 2).
+    mu = math.log(mean) - sigma * sigma / 2
+    n_lines = max(1, target_bytes // mean)
+    step = FILE_SPAN / n_lines
+    written = 0
+    index = 0
+    while written < target_bytes:
+        moment = start + step * index
+        prefix = (f"{moment.strftime('%Y-%m-%dT%H:%M:%S')}.{moment.microsecond // 1000:03d}Z "
+                  f"host{rng.randrange(8)} {rng.choice(SERVICES)}[{rng.randrange(1, 65536)}]: ")
+        words = []
+        if rng.random() < config["match_density"]:
+            words.append(config["keyword"])
+        length = max(len(prefix) + 8, int(rng.lognormvariate(mu, sigma)))
+        size = len(prefix) + sum(len(word) + 1 for word in words)
+        while size < length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        line = (prefix + ' '.join(words) + '\n').encode('ascii')
+        written += len(line)
+        index += 1
+        yield line
+
+
+def generate_corpus(directory: str, config: dict) -> dict:
+    """
+    Writes a corpus into a directory and returns its manifest.
+
+    Parameters:
+      - directory (str): The directory to write the files to. It is created if needed.
+      - config (dict): The shape of the corpus, see `corpus_config`.
+
+    Returns:
+      - dict: The configuration, and the paths, sizes, line counts and keyword matches of the files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(config["seed"])
+    target_bytes = int(config["size_mb"] * 1024 * 1024)
+    keyword = config["keyword"].encode('ascii')
+
+    files = []
+    for number in range(config["files"]):
+        base_path = os.path.join(directory, f"app{number}.log")
+        # The newest file comes last in time, each rotation covers the span before the previous one.
+        for rotation in range(config["rotations"], -1, -1):
+            start = START + FILE_SPAN * (config["rotations"] - rotation)
+            file_path = base_path if rotation == 0 else f"{base_path}.{rotation}.gz"
+            # A fixed mtime keeps the gzip header, and so the file, identical between runs.
+            opener = open if rotation == 0 else (lambda path, mode: gzip.GzipFile(path, mode, mtime=0))
+            lines = matches = data_bytes = 0
+            with opener(file_path, 'wb') as f:
+                for line in _lines(rng, config, target_bytes, start):
+                    f.write(line)
+                    lines += 1
+                    data_bytes += len(line)
+                    matches += keyword in line
+            files.append({
+                "path": file_path, "bytes": os.path.getsize(file_path), "data_bytes": data_bytes,
+                "lines": lines, "matches": matches, "compressed": rotation != 0,
+                "start": start.timestamp(), "end": (start + FILE_SPAN).timestamp(),
+            })
+
+    return {
+        "config": config,
+        "files": files,
+        "bytes": sum(file["bytes"] for file in files),
+        "data_bytes": sum(file["data_bytes"] for file in files),
+        "lines": sum(file["lines"] for file in files),
+        "matches": sum(file["matches"] for file in files),
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = corpus_config()
+    parser.add_argument('--files', type=int, default=defaults["files"], help='number of log files')
+    parser.add_argument('--size-mb', type=float, default=defaults["size_mb"], help='size of each file in MB')
+    parser.add_argument('--line-length', type=int, default=defaults["line_length"], help='mean line length in bytes')
+    parser.add_argument('--line-jitter', type=float, default=defaults["line_jitter"],
+                        help='sigma of the log-normal line length distribution')
+    parser.add_argument('--match-density', type=float, default=defaults["match_density"],
+                        help='fraction of lines that contain the keyword')
+    parser.add_argument('--rotations', type=int, default=defaults["rotations"],
+                        help='number of gzip-compressed rotations per file')
+    parser.add_argument('--keyword', default=defaults["keyword"], help='keyword written in matching lines')
+    parser.add_argument('--seed', type=int, default=defaults["seed"], help='random seed')
+
+
+def config_from_arguments(arguments: argparse.Namespace) -> dict:
+    return corpus_config(arguments.files, arguments.size_mb, arguments.line_length, arguments.line_jitter,
+                         arguments.match_density, arguments.rotations, arguments.keyword, arguments.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory to write the corpus to')
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    manifest = generate_corpus(arguments.directory, config_from_arguments(arguments))
+    print(json.dumps({key: value for key, value in manifest.items() if key != 'files'}, indent=2))
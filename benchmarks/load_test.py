@@ -0,0 +1,173 @@
+"""
+Load test of the pre-fork launcher. Starts `parser.serve` on a synthetic corpus with each of
+the given numbers of worker processes, keeps it busy with concurrent clients for a fixed time,
+and reports the requests/s and the p50/p99 latency for each, so that the scaling with the
+number of cores can be read off the table.
+
+The clients run in their own processes, so that they are not limited by the GIL either. By
+default the search cache is turned off, so that every search parses and matches the files.
+
+Usage: python benchmarks/load_test.py [--workers 1,2,4] [--clients 16] [--client-processes 4]
+                                      [--duration 10] [--path /search?keyword=ERROR ...] [--cache]
+                                      [--output results.json] [--corpus directory] [corpus options]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import add_arguments, config_from_arguments
+from run_benchmarks import SRC, _commit, _corpus, percentile
+
+
+def run_clients(base_url: str, paths: list, threads: int, duration: float) -> dict:
+    """
+    Sends requests from several threads, each over its own keep-alive connection, until the
+    time is up. This is meant to run in a client process.
+
+    Returns:
+      - dict: The number of requests that succeeded and failed, and their latencies in seconds.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset: int) -> None:
+        session = requests.Session()
+        for path in itertools.islice(itertools.cycle(paths), offset, None):
+            if time.monotonic() >= deadline:
+                break
+            started = time.perf_counter()
+            try:
+                response = session.get(base_url + path)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    workers = [threading.Thread(target=client, args=(offset,)) for offset in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return {"latencies": latencies, "errors": errors[0]}
+
+
+def start_server(workers: int, log_directory: str, cache_directory: str, cache: bool) -> tuple:
+    """Starts the launcher on a free port and returns the process and its base URL."""
+    environment = dict(os.environ, PYTHONPATH=SRC, LOG_DIRECTORY=log_directory, CACHE_DIRECTORY=cache_directory)
+    if not cache:
+        environment['SEARCH_CACHE_BYTES'] = '0'
+    server = subprocess.Popen([sys.executable, '-m', 'parser.serve', '--port', '0', '--workers', str(workers),
+                               '--no-access-log'], env=environment, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    match = re.search(r'http://\S+', line)
+    if match is None:
+        server.kill()
+        raise SystemExit(f"The server did not start: {line}")
+    # Keep reading what the server prints, so that it never blocks on a full pipe.
+    threading.Thread(target=server.stdout.read, daemon=True).start()
+    return server, match.group(0)
+
+
+def measure(workers: int, arguments: argparse.Namespace, log_directory: str, paths: list) -> dict:
+    with tempfile.TemporaryDirectory() as cache_directory:
+        server, base_url = start_server(workers, log_directory, cache_directory, arguments.cache)
+        try:
+            # Warm up every worker, so that loading and the first scans are not measured.
+            run_clients(base_url, paths, max(workers, 2), arguments.warmup)
+
+            threads = max(1, arguments.clients // arguments.client_processes)
+            with ProcessPoolExecutor(max_workers=arguments.client_processes) as clients:
+                started = time.perf_counter()
+                tasks = [clients.submit(run_clients, base_url, paths, threads, arguments.duration)
+                         for _ in range(arguments.client_processes)]
+                results = [task.result() for task in tasks]
+                elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies = [latency for result in results for latency in result["latencies"]]
+    if not latencies:
+        raise SystemExit(f"No request succeeded with {workers} workers.")
+    return {
+        "requests": len(latencies),
+        "errors": sum(result["errors"] for result in results),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main(arguments: argparse.Namespace) -> dict:
+    counts = [int(count) for count in arguments.workers.split(',')]
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = arguments.corpus or temporary
+        manifest = _corpus(directory, config_from_arguments(arguments))
+        keyword = manifest["config"]["keyword"]
+        name = os.path.basename(next(file for file in manifest["files"] if not file["compressed"])["path"])
+        paths = arguments.path or [f'/search?keyword={keyword}', f'/log/{name}?entries=100']
+
+        results = {}
+        print(f"{'workers':>8} {'requests/s':>12} {'speedup':>8} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+        for count in counts:
+            result = measure(count, arguments, os.path.join(directory, 'logs'), paths)
+            results[str(count)] = result
+            speedup = result["requests_per_s"] / results[str(counts[0])]["requests_per_s"]
+            print(f"{count:>8} {result['requests_per_s']:>12.1f} {speedup:>7.2f}x {result['p50_ms']:>10.2f} "
+                  f"{result['p99_ms']:>10.2f} {result['errors']:>8}")
+
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": {key: value for key, value in manifest.items() if key != 'files'},
+        "paths": paths,
+        "clients": arguments.clients,
+        "duration": arguments.duration,
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default=','.join(str(count) for count in sorted({1, 2, 4, cpus}) if count <= cpus),
+                        help='comma-separated numbers of worker processes to measure')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent connections')
+    parser.add_argument('--client-processes', type=int, default=min(4, cpus), help='processes the clients run in')
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured for each number of workers')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of load before measuring')
+    parser.add_argument('--path', action='append', help='path to request, can be repeated (requests cycle through them)')
+    parser.add_argument('--cache', action='store_true', help='keep the search cache on')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--corpus', help='directory to keep the corpus in between runs')
+    add_arguments(parser)
+    arguments = parser.parse_args()
+
+    report = main(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {arguments.output}")
@@ -0,0 +1,255 @@
+"""
+Runs the micro and end-to-end benchmarks on a synthetic log corpus and reports, for each one,
+the p50/p99 latency, the throughput in MB/s and the peak RSS. End-to-end benchmarks go through
+the Flask test client. Every benchmark runs in a fresh process, so its peak RSS is its own.
+
+Results are printed as a table and can be written as JSON with `--output`, to be compared
+between commits with `benchmarks/compare.py`.
+
+Usage: python benchmarks/run_benchmarks.py [--output results.json] [--repeat 5] [--warmup 1]
+                                           [--only name,...] [--corpus directory] [corpus options]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import add_arguments, config_from_arguments, generate_corpus
+
+
+def _plain_file(manifest: dict) -> dict:
+    return next(file for file in manifest["files"] if not file["compressed"])
+
+
+def _get(client, url: str) -> None:
+    # Consume streamed bodies, and close the response as a server would, which records its metrics.
+    with client.get(url) as response:
+        response.get_data()
+    # Fail loudly if an endpoint is broken rather than timing an error.
+    if response.status_code not in (200, 404):
+        raise RuntimeError(f"GET {url} returned status {response.status_code}")
+
+
+def _window(manifest: dict, minutes: int = 5) -> str:
+    file = _plain_file(manifest)
+    middle = (file["start"] + file["end"]) / 2
+    return f"since={middle}&until={middle + minutes * 60}"
+
+
+# Each benchmark takes the corpus manifest and returns a function to time, along with the
+# number of bytes one call processes (None when a throughput would not be meaningful).
+def bench_read_log_lines(manifest):
+    from parser.parse_logs import _read_log_lines
+    file = _plain_file(manifest)
+    return lambda: sum(1 for _ in _read_log_lines(file["path"])), file["bytes"]
+
+
+def bench_search_in_file(manifest):
+    from parser import search_in_file
+    file = _plain_file(manifest)
+    keyword = manifest["config"]["keyword"]
+    return lambda: search_in_file(file["path"], keyword, {}), file["bytes"]
+
+
+def bench_read_all_log_files(manifest):
+    from parser import read_all_log_files
+    return read_all_log_files, manifest["bytes"]
+
+
+def bench_search_directory(manifest):
+    from parser import search_directory
+    keyword = manifest["config"]["keyword"]
+    return lambda: search_directory(keyword), manifest["bytes"]
+
+
+def bench_time_window(manifest):
+    from parser import read_single_file
+    file = _plain_file(manifest)
+    middle = (file["start"] + file["end"]) / 2
+    return lambda: read_single_file(file["path"], {}, since=middle, until=middle + 300), None
+
+
+def _client():
+    from log_server import app
+    return app.test_client()
+
+
+def bench_http_logs(manifest):
+    client = _client()
+    return lambda: _get(client, '/logs'), manifest["bytes"]
+
+
+def bench_http_search(manifest):
+    client = _client()
+    return lambda: _get(client, f'/search?keyword={manifest["config"]["keyword"]}'), manifest["bytes"]
+
+
+def bench_http_search_limit(manifest):
+    client = _client()
+    return lambda: _get(client, f'/search?keyword={manifest["config"]["keyword"]}&limit=10'), None
+
+
+def bench_http_entries(manifest):
+    client = _client()
+    name = os.path.basename(_plain_file(manifest)["path"])
+    return lambda: _get(client, f'/log/{name}?entries=100'), None
+
+
+def bench_http_window(manifest):
+    client = _client()
+    name = os.path.basename(_plain_file(manifest)["path"])
+    return lambda: _get(client, f'/log?file={name}&{_window(manifest)}'), None
+
+
+def bench_http_files(manifest):
+    client = _client()
+    return lambda: _get(client, '/files'), None
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "read_log_lines": bench_read_log_lines,
+    "search_in_file": bench_search_in_file,
+    "read_all_log_files": bench_read_all_log_files,
+    "search_directory": bench_search_directory,
+    "time_window": bench_time_window,
+    "http_logs": bench_http_logs,
+    "http_search": bench_http_search,
+    "http_search_limit": bench_http_search_limit,
+    "http_entries": bench_http_entries,
+    "http_window": bench_http_window,
+    "http_files": bench_http_files,
+}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Returns the nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_benchmark(name: str, manifest: dict, log_directory: str, repeat: int, warmup: int) -> dict:
+    """
+    Runs a single benchmark in the current process. This is meant to run in a fresh process.
+    """
+    os.environ['LOG_DIRECTORY'] = log_directory
+    sys.path.insert(0, os.path.join(SRC, 'parser'))
+    run, n_bytes = BENCHMARKS[name](manifest)
+
+    for _ in range(warmup):
+        run()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+
+    p50 = percentile(latencies, 0.5)
+    return {
+        "runs": repeat,
+        "p50_ms": round(p50 * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "mb_per_s": round(n_bytes / p50 / 1e6, 3) if n_bytes and p50 > 0 else None,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == 'darwin' else 1024), 3),
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _corpus(directory: str, config: dict) -> dict:
+    """Generates the corpus in `directory`, unless it already holds one with the same configuration."""
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["config"] == config:
+            return manifest
+    # The manifest is kept outside of the log directory, so that it is not read as a log file.
+    manifest = generate_corpus(os.path.join(directory, 'logs'), config)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def main(arguments: argparse.Namespace) -> dict:
+    names = arguments.only.split(',') if arguments.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown benchmarks: {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = arguments.corpus or temporary
+        manifest = _corpus(directory, config_from_arguments(arguments))
+        log_directory = os.path.join(directory, 'logs')
+
+        results = {}
+        print(f"{'benchmark':<20} {'p50 ms':>10} {'p99 ms':>10} {'MB/s':>10} {'peak RSS MB':>12}")
+        for name in names:
+            # A separate interpreter rather than a multiprocessing child, whose exit would wait
+            # on the process pools used for decompression and parallel scans.
+            worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', name,
+                                     '--corpus', directory, '--repeat', str(arguments.repeat),
+                                     '--warmup', str(arguments.warmup)], capture_output=True, text=True)
+            if worker.returncode != 0:
+                raise SystemExit(f"Benchmark {name} failed:\n{worker.stderr}")
+            result = json.loads(worker.stdout.strip().splitlines()[-1])
+            results[name] = result
+            mb_per_s = '-' if result["mb_per_s"] is None else f'{result["mb_per_s"]:.1f}'
+            print(f"{name:<20} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {mb_per_s:>10} "
+                  f"{result['peak_rss_mb']:>12.1f}")
+
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": {key: value for key, value in manifest.items() if key != 'files'},
+        "repeat": arguments.repeat,
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs before the timed ones')
+    parser.add_argument('--only', help='comma-separated benchmarks to run')
+    parser.add_argument('--corpus', help='directory to keep the corpus in between runs')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    add_arguments(parser)
+    arguments = parser.parse_args()
+
+    if arguments.worker:
+        # Runs a single benchmark on an existing corpus and prints its result as JSON.
+        with open(os.path.join(arguments.corpus, 'manifest.json')) as f:
+            manifest = json.load(f)
+        print(json.dumps(run_benchmark(arguments.worker, manifest, os.path.join(arguments.corpus, 'logs'),
+                                       arguments.repeat, arguments.warmup)))
+        sys.exit(0)
+
+    report = main(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {arguments.output}")
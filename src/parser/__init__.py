@@ -1,3 +1,3 @@
-from .parse_logs import  read_single_file, read_n_log_entries, read_all_log_files
-from .search_logs import search_in_file, search_directory
-from .remote_logs import make_remote_call
\ No newline at end of file
+from .parse_logs import  read_single_file, read_n_log_entries, read_all_log_files, read_log_page, read_log_lines, iter_single_file, iter_all_log_entries
+from .search_logs import search_in_file, search_directory, iter_search_directory, search_newest_first, search_fields, iter_search_fields
+from .remote_logs import make_remote_call, iter_remote_call
\ No newline at end of file
@@ -0,0 +1,182 @@
+import os
+import re
+import time
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+from . import metrics
+
+# Bytes read from the file per `read` call while searching.
+SEARCH_CHUNK_SIZE = 1024 * 1024
+
+# Error handlers accepted for lines that are not valid UTF-8. `skip` leaves such lines out,
+# the others are the standard handlers of `bytes.decode`.
+DECODE_POLICIES = ('strict', 'replace', 'ignore', 'backslashreplace', 'skip')
+
+Finder = Callable[[bytes, int, int], int]
+
+
+def decode_errors() -> str:
+    """
+    Returns how matching lines that are not valid UTF-8 are decoded. It is set through the
+    `DECODE_ERRORS` environment variable to one of `DECODE_POLICIES` and defaults to `replace`.
+
+    Returns:
+      - str: The decoding policy.
+    """
+    policy = os.environ.get('DECODE_ERRORS', 'replace')
+    return policy if policy in DECODE_POLICIES else 'replace'
+
+
+def decode_line(line: bytes, errors: str) -> Optional[str]:
+    """
+    Decodes a single line according to the decoding policy.
+
+    Parameters:
+      - line (bytes): The raw line, without its newline.
+      - errors (str): One of `DECODE_POLICIES`.
+
+    Returns:
+      - str: The decoded line, without a trailing carriage return.
+      - None: If the line is not valid UTF-8 and the policy is `skip`.
+
+    Raises:
+      - UnicodeDecodeError: If the line is not valid UTF-8 and the policy is `strict`.
+    """
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    if errors == 'skip':
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    return line.decode('utf-8', errors)
+
+
+def keyword_finder(keyword: str) -> Finder:
+    """
+    Returns a finder that locates a keyword in raw bytes. The keyword is encoded only once.
+    """
+    needle = keyword.encode('utf-8')
+    return lambda buffer, position, end: buffer.find(needle, position, end)
+
+
+def query_finder(query) -> Optional[Finder]:
+    """
+    Returns a finder that locates the candidate lines of a compiled query in raw bytes. Every
+    line that can match the query contains a hit. Only literal terms are searched as bytes:
+    in a bytes pattern, `\\w`, `.` and case-insensitive matching only cover ASCII, so a regex
+    term could miss lines that it matches once they are decoded.
+
+    Returns:
+      - Finder: The finder for the query.
+      - None: If the query has no prefilter or has regex terms, so every line is a candidate.
+    """
+    if query.prefilter is None or any(kind != 'lit' for kind, _ in query.terms):
+        return None
+    pattern = re.compile(b'|'.join(re.escape(term.encode('utf-8')) for _, term in query.terms))
+
+    def find(buffer: bytes, position: int, end: int) -> int:
+        match = pattern.search(buffer, position, end)
+        return match.start() if match else -1
+
+    return find
+
+
+def matcher_for(keyword: str, query=None) -> Tuple[Optional[Finder], Optional[Callable[[str], bool]]]:
+    """
+    Returns the finder and the line check to search for a keyword, or for a compiled query
+    when one is given.
+
+    Parameters:
+      - keyword (str): The keyword to search for.
+      - query (Query, optional): A compiled query to match lines with instead of the keyword.
+
+    Returns:
+      - tuple: The finder and the check each candidate line must pass (None when every hit is a match).
+    """
+    if query is not None:
+        return query_finder(query), query.matches
+    return keyword_finder(keyword), None
+
+
+def iter_matching_lines(f: BinaryIO, finder: Optional[Finder], limit: Optional[int] = None,
+                        predicate: Optional[Callable[[str], bool]] = None,
+                        errors: Optional[str] = None) -> Iterator[str]:
+    """
+    Searches a binary stream from its current position and yields the matching lines in order.
+    The raw bytes are searched with the finder. Line boundaries are only located around a
+    hit, and only those lines are decoded, so non-matching data is never turned into strings.
+
+    Parameters:
+      - f (BinaryIO): A binary file object, positioned where the search should start.
+      - finder (Finder, optional): Returns the index of the next hit in a buffer between two positions, or -1.
+                                   Without a finder, every line is a candidate.
+      - limit (int, optional): The number of bytes to search. Defaults to the rest of the stream.
+      - predicate (Callable, optional): A check that each decoded candidate line must pass.
+      - errors (str, optional): The decoding policy. Defaults to `decode_errors()`.
+
+    Yields:
+      - str: Each matching line, without its line terminator.
+    """
+    errors = errors or decode_errors()
+    remaining = limit
+    # The unterminated line at the end of the previous chunk, searched with the next one.
+    carry = b''
+
+    while True:
+        started = time.perf_counter()
+        size = SEARCH_CHUNK_SIZE if remaining is None else min(SEARCH_CHUNK_SIZE, remaining)
+        chunk = f.read(size) if size > 0 else b''
+        if remaining is not None:
+            remaining -= len(chunk)
+        at_end = not chunk
+        read = time.perf_counter()
+        metrics.record_phase('read', read - started)
+
+        buffer = carry + chunk if carry else chunk
+        if at_end:
+            searchable = len(buffer)
+        else:
+            searchable = buffer.rfind(b'\n') + 1
+            if searchable == 0:
+                carry = buffer
+                metrics.record_scan(len(chunk))
+                continue
+        # The matches of a chunk are collected before they are yielded, so that the time spent 
+        # matching is measured apart from the time the caller spends on each line.
+        matches = []
+        n_lines = 0
+        for line in _matching_lines(buffer, searchable, finder):
+            n_lines += 1
+            decoded = decode_line(line, errors)
+            if decoded is not None and (predicate is None or predicate(decoded)):
+                matches.append(decoded)
+        metrics.record_phase('match', time.perf_counter() - read)
+        metrics.record_scan(len(chunk), n_lines)
+        yield from matches
+
+        if at_end:
+            return
+        carry = buffer[searchable:]
+
+
+def _matching_lines(buffer: bytes, end: int, finder: Optional[Finder]) -> Iterator[bytes]:
+    """
+    Yields the raw lines that contain a hit of the finder in `buffer[:end]`, which holds
+    complete lines. The buffer is searched in place, without copying it.
+    """
+    if finder is None:
+        lines = buffer[:end].split(b'\n')
+        if lines and not lines[-1]:
+            lines.pop()
+        yield from lines
+        return
+
+    position = finder(buffer, 0, end)
+    while position != -1:
+        line_start = buffer.rfind(b'\n', 0, position) + 1
+        line_end = buffer.find(b'\n', position, end)
+        if line_end == -1:
+            line_end = end
+        yield buffer[line_start:line_end]
+        position = finder(buffer, line_end + 1, end) if line_end < end else -1
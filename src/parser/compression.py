@@ -0,0 +1,147 @@
+import os
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from . import metrics
+
+# Encodings that responses can be compressed with, in order of preference, and the `wbits`
+# that makes zlib write their format. HTTP `deflate` is the zlib format (RFC 1950).
+ENCODINGS = {'gzip': 31, 'deflate': 15}
+
+# Bodies smaller than this are sent as they are, since compressing them saves little.
+DEFAULT_MIN_BYTES = 1024
+DEFAULT_LEVEL = 6
+
+# A compressed stream is flushed to the client once this much input was buffered, or this much
+# time passed since the last flush, so that slow streams are not held back by the compressor.
+# The time is only checked when the next chunk arrives, so record streams are flushed after
+# every chunk instead, see `compress_stream`.
+STREAM_FLUSH_BYTES = 64 * 1024
+STREAM_FLUSH_SECONDS = 1.0
+
+# Streams of records, which are flushed as soon as each chunk is compressed. The producer may
+# block for a long time before the next record, such as a search of a slow file or host.
+RECORD_STREAM_TYPES = ('application/x-ndjson',)
+
+# Content types that are compressed. Event streams are latency-bound and flushing every event
+# leaves nothing to compress, so they are sent as they are.
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/html')
+
+
+def min_bytes() -> int:
+    """
+    Returns the body size, in bytes, from which responses are compressed. It is set through
+    the `COMPRESS_MIN_BYTES` environment variable. Streamed responses have no known size and
+    are always compressed.
+
+    Returns:
+      - int: The size threshold in bytes.
+    """
+    return int(os.environ.get('COMPRESS_MIN_BYTES', DEFAULT_MIN_BYTES))
+
+
+def level() -> int:
+    """
+    Returns the compression level, from 1 (fastest) to 9 (smallest). It is set through the
+    `COMPRESS_LEVEL` environment variable, and 0 disables compression.
+
+    Returns:
+      - int: The compression level.
+    """
+    return int(os.environ.get('COMPRESS_LEVEL', DEFAULT_LEVEL))
+
+
+def compressible(mimetype: Optional[str]) -> bool:
+    """
+    Checks whether a response with this content type should be compressed.
+
+    Parameters:
+      - mimetype (str, optional): The content type of the response, without parameters.
+
+    Returns:
+      - bool: True if it is one of `COMPRESSIBLE_TYPES`.
+    """
+    return mimetype in COMPRESSIBLE_TYPES
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """
+    Picks the encoding to compress a response with, from the `Accept-Encoding` of the request.
+
+    Parameters:
+      - accept_encodings: The parsed `Accept-Encoding` header, as `request.accept_encodings`.
+
+    Returns:
+      - str: `gzip` or `deflate`.
+      - None: If the client accepts neither, or compression is disabled.
+    """
+    if level() <= 0:
+        return None
+    return accept_encodings.best_match(list(ENCODINGS))
+
+
+def _compressor(encoding: str, compression_level: int):
+    return zlib.compressobj(compression_level, zlib.DEFLATED, ENCODINGS[encoding])
+
+
+def compress(data: bytes, encoding: str, compression_level: Optional[int] = None) -> bytes:
+    """
+    Compresses a whole body.
+
+    Parameters:
+      - data (bytes): The body.
+      - encoding (str): `gzip` or `deflate`.
+      - compression_level (int, optional): Defaults to `level()`.
+
+    Returns:
+      - bytes: The compressed body.
+    """
+    with metrics.timed('compress'):
+        compressor = _compressor(encoding, compression_level or level())
+        return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable, encoding: str, compression_level: Optional[int] = None,
+                    flush_every_chunk: bool = False) -> Iterator[bytes]:
+    """
+    Compresses a streamed body incrementally, one chunk at a time, so that the whole body is
+    never held in memory. Compressed data is flushed to the client every `STREAM_FLUSH_BYTES`
+    of input or `STREAM_FLUSH_SECONDS`, whichever comes first, or after every chunk with
+    `flush_every_chunk`. Closing the compressed stream closes the body, which stops the work behind it.
+
+    Parameters:
+      - chunks (Iterable): The chunks of the body, as bytes or strings.
+      - encoding (str): `gzip` or `deflate`.
+      - compression_level (int, optional): Defaults to `level()`.
+      - flush_every_chunk (bool): Flush each chunk as soon as it is compressed, for streams whose
+                                  next chunk may be long in coming. Later chunks still compress
+                                  against the earlier ones.
+
+    Yields:
+      - bytes: The compressed body.
+    """
+    compressor = _compressor(encoding, compression_level or level())
+    pending = 0
+    flushed = time.monotonic()
+    compressing = 0.0
+    try:
+        for chunk in chunks:
+            started = time.perf_counter()
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            output = compressor.compress(chunk)
+            pending += len(chunk)
+            if (flush_every_chunk or pending >= STREAM_FLUSH_BYTES
+                    or time.monotonic() - flushed >= STREAM_FLUSH_SECONDS):
+                output += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+                flushed = time.monotonic()
+            compressing += time.perf_counter() - started
+            if output:
+                yield output
+        yield compressor.flush()
+    finally:
+        metrics.record_phase('compress', compressing)
+        if hasattr(chunks, 'close'):
+            chunks.close()
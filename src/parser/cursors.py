@@ -0,0 +1,38 @@
+import base64
+import binascii
+import json
+from typing import Optional
+
+
+def encode_cursor(state: dict) -> str:
+    """
+    Encodes the state needed to resume a read into an opaque, URL-safe string 
+    that can be handed to clients and passed back as a `cursor` query parameter.
+
+    Parameters:
+      - state (dict): JSON-serializable values that describe where reading stopped.
+
+    Returns:
+      - str: The opaque cursor.
+    """
+    payload = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[dict]:
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    Parameters:
+      - cursor (str): The opaque cursor received from a client.
+
+    Returns:
+      - dict: The state stored in the cursor.
+      - None: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeEncodeError):
+        return None
+    return state if isinstance(state, dict) else None
@@ -0,0 +1,660 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import compress, repeat
+from operator import not_
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .byte_search import decode_errors, decode_line
+from .log_readers import iter_line_batches, open_log
+from .timestamps import line_timestamp, parse_time
+
+# Parsers that extract the fields of a line, tried in order until one of them returns fields.
+FIELD_PARSERS: Dict[str, Callable[[str], Optional[Dict[str, str]]]] = {}
+
+# Rows in each batch. Filters are evaluated a batch at a time, and a batch is skipped whole
+# when it does not have any of the values a filter asks for.
+BATCH_ROWS = 64 * 1024
+
+# Bytes read at a time while parsing a file.
+PARSE_CHUNK_SIZE = 1024 * 1024
+
+# Bytes kept from right before the parsed end of a file, to tell an append from a rewrite.
+CHECK_BYTES = 64
+
+# Keys that hold the time of a JSON line. The time is kept as a number rather than as a field.
+TIME_KEYS = ('timestamp', '@timestamp', 'time', 'ts')
+
+# Keys of JSON lines that are not kept as fields, since they are different on nearly every line.
+# They are still matched by a keyword or query.
+MESSAGE_KEYS = ('message', 'msg')
+
+# Keys that hold the level of a JSON line.
+LEVEL_KEYS = ('level', 'severity', 'lvl', 'loglevel')
+
+# Levels are stored under one name each, so that `level=warn` and `level=WARNING` match the same lines.
+LEVELS = {
+    'EMERG': 'EMERGENCY', 'EMERGENCY': 'EMERGENCY', 'ALERT': 'ALERT', 'CRIT': 'CRITICAL',
+    'CRITICAL': 'CRITICAL', 'FATAL': 'FATAL', 'ERR': 'ERROR', 'ERROR': 'ERROR', 'WARN': 'WARNING',
+    'WARNING': 'WARNING', 'NOTICE': 'NOTICE', 'INFO': 'INFO', 'DEBUG': 'DEBUG', 'TRACE': 'TRACE',
+}
+
+# The syslog severities of the priority, `<PRI>`, at the start of a line.
+SEVERITIES = ('EMERGENCY', 'ALERT', 'CRITICAL', 'ERROR', 'WARNING', 'NOTICE', 'INFO', 'DEBUG')
+
+SYSLOG_PATTERN = re.compile(
+    r'(?:<(?P<priority>\d{1,3})>)?\[?'
+    r'(?P<timestamp>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+    r'|[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2})\]? '
+    r'(?P<host>\S+) (?P<program>[^\s\[\]:]+)(?:\[(?P<pid>\d+)\])?: ?(?P<message>.*)'
+)
+
+# `key=value` pairs in a message, with the value optionally quoted.
+PAIR_PATTERN = re.compile(r'(?<![^\s,;])([A-Za-z_][\w.-]*)=("(?:[^"\\]|\\.)*"|[^\s,;"]+)')
+
+# A level written as an upper-case word in a message, such as `ERROR` or `[WARN]`.
+LEVEL_PATTERN = re.compile(r'\b(' + '|'.join(sorted(LEVELS, key=len, reverse=True)) + r')\b')
+
+FieldFilter = Tuple[str, frozenset, bool]
+
+
+def register_field_parser(name: str, parse: Callable[[str], Optional[Dict[str, str]]]) -> None:
+    """
+    Registers a parser that extracts fields from log lines. Parsers are tried in the order
+    they were registered, and the first one that returns fields is used for the line.
+
+    Parameters:
+      - name (str): The name of the parser. Registering an existing name replaces it.
+      - parse (Callable): A function that takes a decoded line and returns its fields as a
+                          dictionary of strings, or None if the line is not in its format.
+                          A `timestamp` field is used as the time of the line.
+    """
+    FIELD_PARSERS[name] = parse
+
+
+def normalize_level(level: str) -> str:
+    """
+    Returns the name a level is stored under, such as `WARNING` for `warn`.
+
+    Parameters:
+      - level (str): The level as written in a line or a filter.
+
+    Returns:
+      - str: The normalized level, or the level in upper case if it is not a known one.
+    """
+    level = level.strip().upper()
+    return LEVELS.get(level, level)
+
+
+def _parse_json(line: str) -> Optional[Dict[str, str]]:
+    if not line.startswith('{'):
+        return None
+    try:
+        document = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(document, dict):
+        return None
+
+    fields = {}
+    _flatten(document, '', fields)
+    for key in TIME_KEYS:
+        if key in fields:
+            fields['timestamp'] = fields.pop(key)
+            break
+    for key in MESSAGE_KEYS:
+        fields.pop(key, None)
+    for key in LEVEL_KEYS:
+        if key in fields:
+            fields['level'] = normalize_level(fields.pop(key))
+            break
+    return fields
+
+
+def _flatten(document: dict, prefix: str, fields: Dict[str, str]) -> None:
+    # Nested objects become dotted names, such as `http.status`. Lists are not kept.
+    for key, value in document.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            _flatten(value, name + '.', fields)
+        elif isinstance(value, bool):
+            fields[name] = 'true' if value else 'false'
+        elif isinstance(value, (str, int, float)):
+            fields[name] = str(value)
+
+
+def _parse_syslog(line: str) -> Optional[Dict[str, str]]:
+    match = SYSLOG_PATTERN.match(line)
+    if match is None:
+        return None
+
+    fields = _message_fields(match.group('message'))
+    for name in ('timestamp', 'host', 'program', 'pid'):
+        if match.group(name):
+            fields[name] = match.group(name)
+    if match.group('priority') and int(match.group('priority')) < 192:
+        fields['level'] = SEVERITIES[int(match.group('priority')) % 8]
+    return fields
+
+
+def _parse_logfmt(line: str) -> Optional[Dict[str, str]]:
+    return _message_fields(line) or None
+
+
+def _message_fields(message: str) -> Dict[str, str]:
+    """
+    Extracts the `key=value` pairs of a message, and its level from a `level` pair or from
+    the first level written in upper case.
+    """
+    fields = {}
+    if '=' in message:
+        for key, value in PAIR_PATTERN.findall(message):
+            if value.startswith('"'):
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            fields.setdefault(key, value)
+    for key in LEVEL_KEYS:
+        if key in fields:
+            fields['level'] = normalize_level(fields.pop(key))
+            break
+    else:
+        match = LEVEL_PATTERN.search(message)
+        if match:
+            fields['level'] = LEVELS[match.group(1)]
+    return fields
+
+
+register_field_parser('json', _parse_json)
+register_field_parser('syslog', _parse_syslog)
+register_field_parser('logfmt', _parse_logfmt)
+
+
+def parse_fields(line: str) -> Dict[str, str]:
+    """
+    Extracts the fields of a line with the first registered parser that recognizes it.
+
+    Parameters:
+      - line (str): The decoded line.
+
+    Returns:
+      - dict: The fields of the line, empty if no parser recognized it.
+    """
+    for parse in FIELD_PARSERS.values():
+        fields = parse(line)
+        if fields is not None:
+            return fields
+    return {}
+
+
+def field_filters(arguments: Iterable[Tuple[str, str]]) -> List[FieldFilter]:
+    """
+    Builds the field filters of a search from its query parameters. `field.NAME=VALUE` keeps the
+    lines where the field has that value, and `field.NAME!=VALUE` the lines where it does not.
+    Repeating a field keeps the lines with any of the values, and different fields must all match.
+
+    Parameters:
+      - arguments (Iterable): The (name, value) pairs of the query parameters.
+
+    Returns:
+      - list: The (field, values, negated) filters, empty if there are no `field.` parameters.
+
+    Raises:
+      - ValueError: If a filter has no field name.
+    """
+    values: Dict[Tuple[str, bool], set] = {}
+    for key, value in arguments:
+        if not key.startswith('field.'):
+            continue
+        name, negated = key[len('field.'):], key.endswith('!')
+        if negated:
+            name = name[:-1]
+        if not name:
+            raise ValueError(f"Invalid field filter '{key}'. Use field.NAME=VALUE.")
+        if name == 'level':
+            value = normalize_level(value)
+        values.setdefault((name, negated), set()).add(value)
+    return [(name, frozenset(wanted), negated) for (name, negated), wanted in values.items()]
+
+
+class FieldColumn:
+    """
+    The values of one field in a batch, dictionary-encoded: each distinct value is stored once
+    and every row holds the code of its value, with 0 for rows that do not have the field.
+    Codes take one byte per row until there are more than 255 distinct values.
+    """
+
+    __slots__ = ('values', 'index', 'codes')
+
+    def __init__(self):
+        self.values: List[Optional[str]] = [None]
+        self.index: Dict[str, int] = {}
+        self.codes = array('B')
+
+    def set(self, row: int, value: str) -> None:
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            if code == 256:
+                self.codes = array('I', self.codes)
+            self.index[value] = code
+            self.values.append(value)
+        if len(self.codes) < row:
+            # The rows before it did not have the field.
+            self.codes.extend(repeat(0, row - len(self.codes)))
+        self.codes.append(code)
+
+    def mask(self, wanted: frozenset, negated: bool, size: int) -> Optional[bytes]:
+        """
+        Compares the whole column with the wanted values at once.
+
+        Returns:
+          - bytes: One byte per row, 1 for the rows that pass the filter and 0 for the others.
+          - None: If no row can pass it.
+        """
+        codes = {self.index[value] for value in wanted if value in self.index}
+        if not codes and not negated:
+            return None
+        if self.codes.typecode == 'B':
+            table = bytes((code in codes) != negated for code in range(256))
+            mask = self.codes.tobytes().translate(table)
+        elif negated:
+            mask = bytes(map(not_, map(codes.__contains__, self.codes)))
+        else:
+            mask = bytes(map(codes.__contains__, self.codes))
+        # The rows past the last one with the field do not have it either.
+        return mask + (b'\x01' if negated else b'\x00') * (size - len(self.codes))
+
+    def copy(self) -> 'FieldColumn':
+        column = FieldColumn()
+        column.values = list(self.values)
+        column.index = dict(self.index)
+        column.codes = array(self.codes.typecode, self.codes)
+        return column
+
+    @property
+    def cost(self) -> int:
+        return self.codes.itemsize * len(self.codes) + sum(len(value) + 100 for value in self.index)
+
+
+class FieldBatch:
+    """
+    The fields of up to `BATCH_ROWS` lines, stored by column: the offset where each line starts,
+    its time in seconds since the epoch (NaN until a line with a time was seen) and one
+    `FieldColumn` per field.
+    """
+
+    __slots__ = ('offsets', 'times', 'columns', 'min_time', 'max_time')
+
+    def __init__(self):
+        self.offsets = array('Q')
+        self.times = array('d')
+        self.columns: Dict[str, FieldColumn] = {}
+        self.min_time = math.inf
+        self.max_time = -math.inf
+
+    @property
+    def size(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def cost(self) -> int:
+        return 16 * len(self.offsets) + sum(column.cost for column in self.columns.values()) + 200
+
+    def append(self, offset: int, moment: float, fields: Dict[str, str]) -> None:
+        row = len(self.offsets)
+        self.offsets.append(offset)
+        self.times.append(moment)
+        if moment < self.min_time:
+            self.min_time = moment
+        if moment > self.max_time:
+            self.max_time = moment
+        for name, value in fields.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = FieldColumn()
+            column.set(row, value)
+
+    def select(self, filters: List[FieldFilter], since: Optional[float], until: Optional[float]) -> List[int]:
+        """
+        Returns the offsets of the lines that pass all the filters and are in the time window.
+        """
+        if (since is not None and self.max_time < since) or (until is not None and self.min_time > until):
+            return []
+
+        masks = []
+        for name, wanted, negated in filters:
+            column = self.columns.get(name)
+            if column is None:
+                if negated:
+                    continue
+                return []
+            mask = column.mask(wanted, negated, self.size)
+            if mask is None:
+                return []
+            masks.append(mask)
+        if since is not None:
+            masks.append(bytes(map(float(since).__le__, self.times)))
+        if until is not None:
+            masks.append(bytes(map(float(until).__ge__, self.times)))
+        if not masks:
+            return list(self.offsets)
+
+        # The masks hold only 0 and 1, so they are combined as integers, a machine word at a time.
+        combined = int.from_bytes(masks[0], 'little')
+        for mask in masks[1:]:
+            combined &= int.from_bytes(mask, 'little')
+        return list(compress(self.offsets, combined.to_bytes(self.size, 'little')))
+
+    def copy(self) -> 'FieldBatch':
+        batch = FieldBatch()
+        batch.offsets = array('Q', self.offsets)
+        batch.times = array('d', self.times)
+        batch.columns = {name: column.copy() for name, column in self.columns.items()}
+        batch.min_time, batch.max_time = self.min_time, self.max_time
+        return batch
+
+
+class FieldTable:
+    """
+    The parsed fields of the lines of a file, in batches of `BATCH_ROWS` lines.
+    """
+
+    __slots__ = ('batches', 'last_time')
+
+    def __init__(self, last_time: float = math.nan):
+        self.batches: List[FieldBatch] = []
+        # Lines without a time, such as the continuation of a multi-line entry, get the time of the line before.
+        self.last_time = last_time
+
+    @property
+    def cost(self) -> int:
+        return sum(batch.cost for batch in self.batches)
+
+    def append(self, offset: int, raw: bytes, line: str) -> None:
+        fields = parse_fields(line)
+        text = fields.pop('timestamp', None)
+        moment = _timestamp(text) if text is not None else line_timestamp(raw)
+        if moment is not None:
+            self.last_time = moment
+
+        if not self.batches or self.batches[-1].size >= BATCH_ROWS:
+            self.batches.append(FieldBatch())
+        self.batches[-1].append(offset, self.last_time, fields)
+
+    def select(self, filters: List[FieldFilter], since: Optional[float] = None,
+               until: Optional[float] = None) -> List[int]:
+        """
+        Returns the offsets of the lines that pass all the filters and are in the time window.
+        """
+        offsets = []
+        for batch in self.batches:
+            offsets.extend(batch.select(filters, since, until))
+        return offsets
+
+    def extended(self) -> 'FieldTable':
+        """
+        Returns a table to append lines to, leaving this one untouched for the requests using it.
+        Only the last batch, which the new lines go into, is copied.
+        """
+        table = FieldTable(self.last_time)
+        table.batches = self.batches[:-1] + [batch.copy() for batch in self.batches[-1:]]
+        return table
+
+
+class _FileFields:
+    """
+    The parsed fields of a file, up to the end of its last complete line, and of the incomplete
+    line after it, along with the fingerprint of the file when it was parsed.
+    """
+
+    __slots__ = ('inode', 'size', 'mtime', 'end', 'check', 'table', 'tail')
+
+    def __init__(self, inode: int, size: int, mtime: float, end: int, check: bytes,
+                 table: FieldTable, tail: FieldTable):
+        self.inode = inode
+        self.size = size
+        self.mtime = mtime
+        self.end = end
+        self.check = check
+        self.table = table
+        self.tail = tail
+
+    @property
+    def cost(self) -> int:
+        return self.table.cost + self.tail.cost
+
+
+class FieldCache:
+    """
+    In-process LRU cache of the parsed fields of log files, bounded by an approximate memory
+    budget. Entries are validated against the (inode, size, mtime) fingerprint of the file.
+    When a file only grew, the lines appended to it are parsed into the cached table instead
+    of parsing the file again. Rotated and truncated files are parsed again from the start.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def search_file(self, file_path: str, filters: List[FieldFilter], since: Optional[float] = None,
+                    until: Optional[float] = None) -> List[str]:
+        """
+        Returns the lines of a file whose fields pass all the filters, in file order.
+
+        Parameters:
+          - file_path (str): The path to the log file.
+          - filters (list): The filters, as returned by `field_filters`.
+          - since (float, optional): Only return the lines from this time on, in seconds since the epoch.
+          - until (float, optional): Only return the lines up to this time, in seconds since the epoch.
+
+        Returns:
+          - list: The matching lines, without their newlines.
+        """
+        entry = self._fields(file_path)
+        started = time.perf_counter()
+        offsets = entry.table.select(filters, since, until) + entry.tail.select(filters, since, until)
+        metrics.record_phase('match', time.perf_counter() - started)
+        if not offsets:
+            return []
+
+        errors = decode_errors()
+        lines = []
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            for offset in offsets:
+                f.seek(offset)
+                line = decode_line(f.readline().rstrip(b'\n'), errors)
+                if line is not None:
+                    lines.append(line)
+        metrics.record_phase('read', time.perf_counter() - started)
+        return lines
+
+    def stats(self) -> dict:
+        """
+        Returns the hit, miss and extension counters of the cache and its current size.
+
+        Returns:
+          - dict: The counters, the number of cached files and the approximate bytes used.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "extensions": self.extensions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _fields(self, file_path: str) -> _FileFields:
+        """
+        Returns the up-to-date parsed fields of a file, parsing only what changed since they were cached.
+        """
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None:
+                self._entries.move_to_end(file_path)
+
+        stat = os.stat(file_path)
+        if (entry is not None and entry.inode == stat.st_ino and entry.size == stat.st_size
+                and entry.mtime == stat.st_mtime):
+            self._count('hits')
+            return entry
+
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            stat = os.fstat(f.fileno())
+            if entry is not None and _continues(f, stat, entry):
+                self._count('extensions')
+                table, start = entry.table.extended(), entry.end
+            else:
+                self._count('misses')
+                table, start = FieldTable(), 0
+
+            end = _parse_lines(f, start, stat.st_size, table)
+            tail = FieldTable(table.last_time)
+            if end < stat.st_size:
+                f.seek(end)
+                raw = f.read(stat.st_size - end)
+                line = decode_line(raw, decode_errors())
+                if line:
+                    tail.append(end, raw, line)
+            f.seek(max(0, end - CHECK_BYTES))
+            check = f.read(end - max(0, end - CHECK_BYTES))
+        metrics.record_phase('read', time.perf_counter() - started)
+
+        entry = _FileFields(stat.st_ino, stat.st_size, stat.st_mtime, end, check, table, tail)
+        self._store(file_path, entry)
+        return entry
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _store(self, file_path: str, entry: _FileFields) -> None:
+        """
+        Caches the fields of a file and evicts the least recently used ones until the cache fits its budget.
+        """
+        cost = entry.cost
+        with self._lock:
+            previous = self._entries.pop(file_path, None)
+            if previous is not None:
+                self._size -= previous.cost
+            if cost > self.max_bytes:
+                return
+            self._entries[file_path] = entry
+            self._size += cost
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.cost
+
+
+def select_compressed(file_path: str, filters: List[FieldFilter], since: Optional[float] = None,
+                      until: Optional[float] = None) -> List[str]:
+    """
+    Returns the lines of a compressed file whose fields pass all the filters. The file is
+    decompressed as a stream and parsed a chunk at a time, so only the matching lines are
+    kept. This is meant to run in a worker process through `decompression_pool`, and the
+    fields are not cached.
+
+    Parameters:
+      - file_path (str): The path to the compressed log file.
+      - filters (list): The filters, as returned by `field_filters`.
+      - since (float, optional): Only return the lines from this time on, in seconds since the epoch.
+      - until (float, optional): Only return the lines up to this time, in seconds since the epoch.
+
+    Returns:
+      - list: The matching lines, in order.
+    """
+    errors = decode_errors()
+    found = []
+    table = FieldTable()
+    with open_log(file_path) as f:
+        for raw_lines in iter_line_batches(f, since, until):
+            # Each chunk gets its own table, which carries on the time of the last entry.
+            table = FieldTable(table.last_time)
+            lines = [decode_line(raw, errors) if raw else None for raw in raw_lines]
+            for position, line in enumerate(lines):
+                if line:
+                    table.append(position, raw_lines[position], line)
+            found.extend(lines[position] for position in table.select(filters))
+    return found
+
+
+@lru_cache(maxsize=4096)
+def _timestamp(text: str) -> Optional[float]:
+    # Consecutive lines often have the same timestamp, which is then only parsed once.
+    try:
+        return parse_time(text)
+    except ValueError:
+        return None
+
+
+def _continues(f: BinaryIO, stat: os.stat_result, entry: _FileFields) -> bool:
+    """
+    Checks whether a file is the one that was parsed, and still has the same bytes right
+    before the parsed end, so that only what comes after it has to be parsed.
+    """
+    if entry.inode != stat.st_ino or stat.st_size < entry.size:
+        return False
+    f.seek(entry.end - len(entry.check))
+    return f.read(len(entry.check)) == entry.check
+
+
+def _parse_lines(f: BinaryIO, start: int, stop: int, table: FieldTable) -> int:
+    """
+    Parses the complete lines between `start` and `stop` into the table. Empty lines and
+    lines that cannot be decoded under the decoding policy are left out.
+
+    Returns:
+      - int: The offset right after the last complete line.
+    """
+    errors = decode_errors()
+    f.seek(start)
+    position = end = start
+    pending = b''
+    n_lines = 0
+    while position < stop:
+        chunk = f.read(min(PARSE_CHUNK_SIZE, stop - position))
+        if not chunk:
+            break
+        position += len(chunk)
+        last = chunk.rfind(b'\n')
+        if last == -1:
+            pending += chunk
+            continue
+
+        offset = end
+        for raw in (pending + chunk[:last]).split(b'\n'):
+            if raw:
+                line = decode_line(raw, errors)
+                if line:
+                    table.append(offset, raw, line)
+            offset += len(raw) + 1
+            n_lines += 1
+        end = offset
+        pending = chunk[last + 1:]
+    metrics.record_scan(end - start, n_lines)
+    return end
+
+
+field_cache = FieldCache(int(os.environ.get('FIELD_CACHE_BYTES', 64 * 1024 * 1024)))
+metrics.register_cache('fields', field_cache.stats)
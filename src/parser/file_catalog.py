@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics, shared_store
+from .log_readers import compression_of
+
+# Bytes read from the start of a file to detect whether it is text.
+SAMPLE_SIZE = 8 * 1024
+
+# A directory modified this recently may still change within the same mtime tick, so its
+# listing is not trusted and it is scanned again on the next request.
+RACY_SECONDS = 1.0
+
+# The kinds of files the catalog tells apart. Only text and compressed files are read and searched.
+TEXT, COMPRESSED, BINARY, EMPTY, UNREADABLE = 'text', 'compressed', 'binary', 'empty', 'unreadable'
+LOG_KINDS = (TEXT, COMPRESSED)
+# The kinds that can change without the directory changing, for example when a file is written
+# to or its permissions are changed. Files of these kinds are checked with their own `stat`.
+RECHECKED_KINDS = (BINARY, EMPTY, UNREADABLE)
+
+_catalogs: Dict[str, 'FileCatalog'] = {}
+_catalogs_lock = threading.Lock()
+
+
+class FileInfo:
+    """
+    The cached metadata of a file in the log directory.
+    """
+
+    __slots__ = ('path', 'size', 'mtime', 'inode', 'kind', 'encoding', 'ctime')
+
+    def __init__(self, path: str, size: int, mtime: float, inode: int, kind: str, encoding: Optional[str],
+                 ctime: float = 0.0):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.inode = inode
+        self.kind = kind
+        # `ascii` or `utf-8` when the start of a text file is valid in that encoding, `unknown` otherwise.
+        self.encoding = encoding
+        # Changes with the permissions of the file as well as its contents.
+        self.ctime = ctime
+
+    @property
+    def readable(self) -> bool:
+        return self.kind != UNREADABLE
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path, "size": self.size, "mtime": self.mtime, "inode": self.inode,
+            "kind": self.kind, "encoding": self.encoding, "readable": self.readable,
+        }
+
+
+class _Directory:
+    """
+    The cached listing of a single directory: its files and subdirectories, and the mtime
+    of the directory when it was scanned.
+    """
+
+    def __init__(self, mtime_ns: int, stable: bool, files: List[FileInfo], subdirectories: List[str]):
+        self.mtime_ns = mtime_ns
+        self.stable = stable
+        self.files = files
+        self.subdirectories = subdirectories
+
+
+class FileCatalog:
+    """
+    Catalog of the files in a log directory and its subdirectories, built with `os.scandir`.
+    The listing and the metadata of every directory are cached and only scanned again when
+    the mtime of that directory changes, which happens when files are created, removed or
+    renamed in it. A request therefore costs one `stat` per directory instead of a walk of
+    the whole tree. The type of each file is detected once, so binary, empty and unreadable
+    files are skipped before they are ever submitted for reading. When the caches are shared
+    between worker processes, the detected types are kept in the shared store, so the workers
+    do not each read the start of every file again.
+    """
+
+    def __init__(self, log_directory: str):
+        self.log_directory = log_directory
+        self.scans = 0
+        self._directories: Dict[str, _Directory] = {}
+        self._lock = threading.Lock()
+
+    def files(self, fresh: bool = False) -> List[FileInfo]:
+        """
+        Returns the metadata of every file in the log directory, in path order.
+
+        Parameters:
+          - fresh (bool): Refresh the size and mtime of every file. Otherwise they are the
+                          values from when the directory was last scanned.
+
+        Returns:
+          - list: The metadata of every file.
+        """
+        with metrics.timed('walk'):
+            with self._lock:
+                infos = []
+                seen = set()
+                self._collect(self.log_directory, infos, seen)
+                # Drop the directories that no longer exist.
+                for directory in list(self._directories):
+                    if directory not in seen:
+                        del self._directories[directory]
+
+            if fresh:
+                infos = [self._refresh(info) for info in infos]
+            return sorted(infos, key=lambda info: info.path)
+
+    def log_files(self) -> List[str]:
+        """
+        Returns the paths of the files that can be read as logs, plain text or compressed, in path order.
+
+        Returns:
+          - list: The paths of the log files.
+        """
+        return [info.path for info in self.files() if info.kind in LOG_KINDS]
+
+    def _collect(self, directory: str, infos: List[FileInfo], seen: set) -> None:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        seen.add(directory)
+
+        cached = self._directories.get(directory)
+        if cached is None or not cached.stable or cached.mtime_ns != mtime_ns:
+            cached = self._scan(directory, mtime_ns, cached)
+            self._directories[directory] = cached
+        else:
+            # An empty file can be written to and an unreadable one made readable without changing
+            # the directory, so they are checked again, and detected again if their stat changed.
+            cached.files = [self._recheck(info) if info.kind in RECHECKED_KINDS else info for info in cached.files]
+
+        infos.extend(cached.files)
+        for subdirectory in cached.subdirectories:
+            self._collect(subdirectory, infos, seen)
+
+    def _scan(self, directory: str, mtime_ns: int, previous: Optional[_Directory]) -> _Directory:
+        self.scans += 1
+        known = {info.path: info for info in previous.files} if previous else {}
+        shared = _load_shared_kinds(directory)
+        for path, (inode, size, kind, encoding) in shared.items():
+            known.setdefault(path, FileInfo(path, size, 0.0, inode, kind, encoding))
+        files, subdirectories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        elif entry.is_file():
+                            files.append(_file_info(entry.path, entry.stat(), known.get(entry.path)))
+                    except OSError:
+                        files.append(FileInfo(entry.path, 0, 0.0, 0, UNREADABLE, None))
+        except OSError as e:
+            print(f"Error listing {directory}: {e}")
+        _save_shared_kinds(directory, files, shared)
+
+        stable = mtime_ns / 1e9 < time.time() - RACY_SECONDS
+        return _Directory(mtime_ns, stable, files, sorted(subdirectories))
+
+    def _refresh(self, info: FileInfo) -> FileInfo:
+        try:
+            return _file_info(info.path, os.stat(info.path), info)
+        except OSError:
+            return FileInfo(info.path, info.size, info.mtime, info.inode, UNREADABLE, None)
+
+    def _recheck(self, info: FileInfo) -> FileInfo:
+        try:
+            stat = os.stat(info.path)
+        except OSError:
+            return info if info.kind == UNREADABLE else FileInfo(info.path, info.size, info.mtime, info.inode,
+                                                                 UNREADABLE, None)
+        if (stat.st_ino, stat.st_size, stat.st_mtime, stat.st_ctime) == (info.inode, info.size, info.mtime, info.ctime):
+            return info
+        kind, encoding = detect_kind(info.path, stat.st_size)
+        return FileInfo(info.path, stat.st_size, stat.st_mtime, stat.st_ino, kind, encoding, stat.st_ctime)
+
+
+def _file_info(file_path: str, stat: os.stat_result, previous: Optional[FileInfo]) -> FileInfo:
+    """
+    Builds the metadata of a file, reusing the detected type of the previous metadata when
+    it is still the same file and its type could not have changed.
+    """
+    if (previous is not None and previous.inode == stat.st_ino and previous.kind not in (EMPTY, UNREADABLE)
+            and stat.st_size >= previous.size):
+        kind, encoding = previous.kind, previous.encoding
+    else:
+        kind, encoding = detect_kind(file_path, stat.st_size)
+    return FileInfo(file_path, stat.st_size, stat.st_mtime, stat.st_ino, kind, encoding, stat.st_ctime)
+
+
+def _load_shared_kinds(directory: str) -> dict:
+    """
+    Returns the kinds of the files of a directory that any worker process already detected,
+    when the caches are shared, so that each worker does not read the start of every file again.
+    """
+    if not shared_store.is_enabled():
+        return {}
+    try:
+        return shared_store.load_file_kinds(directory)
+    except sqlite3.Error as e:
+        print(f"Error loading the shared file kinds of {directory}: {e}")
+        return {}
+
+
+def _save_shared_kinds(directory: str, files: List[FileInfo], shared: dict) -> None:
+    """
+    Stores the kinds of the files of a directory that changed since they were last stored, when the caches are shared.
+    """
+    if not shared_store.is_enabled():
+        return
+    changed = [(info.path, info.inode, info.size, info.kind, info.encoding) for info in files
+               if info.kind != UNREADABLE and shared.get(info.path) != (info.inode, info.size, info.kind, info.encoding)]
+    if not changed:
+        return
+    try:
+        shared_store.save_file_kinds(directory, changed)
+    except sqlite3.Error as e:
+        print(f"Error storing the shared file kinds of {directory}: {e}")
+
+
+def detect_kind(file_path: str, size: int) -> Tuple[str, Optional[str]]:
+    """
+    Detects the kind of a file from its extension and the first bytes of its contents.
+    Files with NUL bytes are binary, as `grep` considers them.
+
+    Parameters:
+      - file_path (str): The path to the file.
+      - size (int): The size of the file.
+
+    Returns:
+      - tuple: The kind of the file and, for text files, its detected encoding.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            sample = f.read(SAMPLE_SIZE)
+    except OSError:
+        return UNREADABLE, None
+
+    if size == 0 or not sample:
+        return EMPTY, None
+    if compression_of(file_path):
+        return COMPRESSED, None
+    if b'\x00' in sample:
+        return BINARY, None
+    if sample.isascii():
+        return TEXT, 'ascii'
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a character.
+        if e.start < len(sample) - 3:
+            return TEXT, 'unknown'
+    return TEXT, 'utf-8'
+
+
+def catalog_for(log_directory: str) -> FileCatalog:
+    """
+    Returns the catalog of a log directory, creating it the first time it is needed.
+
+    Parameters:
+      - log_directory (str): The log directory.
+
+    Returns:
+      - FileCatalog: The shared catalog of the directory.
+    """
+    with _catalogs_lock:
+        catalog = _catalogs.get(log_directory)
+        if catalog is None:
+            catalog = _catalogs[log_directory] = FileCatalog(log_directory)
+        return catalog
+
@@ -0,0 +1,322 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .byte_search import decode_errors, decode_line
+
+# Events buffered for each follower. A follower that falls this far behind is disconnected
+# instead of making the watcher hold an unbounded backlog for it.
+FOLLOWER_QUEUE_EVENTS = 1024
+
+# Bytes read from a followed file per `read` call.
+FOLLOW_CHUNK_SIZE = 1024 * 1024
+
+# inotify flags, from <sys/inotify.h>.
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_watchers: Dict[str, 'FileWatcher'] = {}
+_watchers_lock = threading.Lock()
+
+
+def poll_interval() -> float:
+    """
+    Returns how often, in seconds, a followed file is checked for changes. It is set through
+    the `FOLLOW_POLL_INTERVAL` environment variable and defaults to 1 second. With inotify,
+    it only bounds how long a missed notification can go unnoticed.
+
+    Returns:
+      - float: The interval in seconds.
+    """
+    return float(os.environ.get('FOLLOW_POLL_INTERVAL', '1'))
+
+
+def heartbeat_interval() -> float:
+    """
+    Returns how often, in seconds, an idle follower is sent a comment to keep the connection
+    open. It is set through the `FOLLOW_HEARTBEAT` environment variable and defaults to 15 seconds.
+
+    Returns:
+      - float: The interval in seconds.
+    """
+    return float(os.environ.get('FOLLOW_HEARTBEAT', '15'))
+
+
+class _Inotify:
+    """
+    Minimal inotify binding through ctypes that reports activity in a directory. The events
+    themselves are not parsed, any of them wakes the watcher up to check its file.
+    """
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, directory.encode('utf-8'), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> None:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # Drain the pending events, only the wake-up matters.
+            try:
+                while os.read(self.fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _directory_notifier(directory: str) -> Optional[_Inotify]:
+    """
+    Returns an inotify watch on a directory, or None where inotify is not available, in
+    which case the file is polled. Setting `FOLLOW_INOTIFY` to `0` always polls.
+    """
+    if os.environ.get('FOLLOW_INOTIFY', '1') == '0':
+        return None
+    try:
+        return _Inotify(directory)
+    except (OSError, AttributeError):
+        return None
+
+
+class Follower:
+    """
+    A single client following a file. It receives the events of the file's watcher through
+    a bounded queue.
+    """
+
+    def __init__(self, watcher: 'FileWatcher'):
+        self.watcher = watcher
+        self.events = queue.Queue(maxsize=FOLLOWER_QUEUE_EVENTS)
+        self.overflowed = False
+
+    def push(self, event: str) -> bool:
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+
+class FileWatcher(threading.Thread):
+    """
+    Daemon thread that follows a single file for all of its followers. It tracks the byte
+    offset it read up to and, whenever the file changes, reads only the appended bytes once
+    and pushes the same formatted event to every follower. Rotation is detected by a change
+    of inode and truncation by the file becoming smaller than the offset.
+    """
+
+    def __init__(self, file_path: str):
+        super().__init__(name=f'follow:{file_path}', daemon=True)
+        self.file_path = file_path
+        self.followers: List[Follower] = []
+        self.stopped = threading.Event()
+        self.reads = 0
+        self._lock = threading.Lock()
+        self._errors = decode_errors()
+        # The unterminated line at the end of the file, sent once its newline is written.
+        self._carry = b''
+        self._file = open(file_path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._inode = stat.st_ino
+        # Followers start with the lines appended after they subscribed, like `tail -f`.
+        self.offset = stat.st_size
+        self._notifier = _directory_notifier(os.path.dirname(os.path.abspath(file_path)))
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._notifier is not None
+
+    def add(self) -> Follower:
+        follower = Follower(self)
+        with self._lock:
+            self.followers.append(follower)
+        return follower
+
+    def remove(self, follower: Follower) -> int:
+        with self._lock:
+            if follower in self.followers:
+                self.followers.remove(follower)
+            return len(self.followers)
+
+    def run(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                if self._notifier is not None:
+                    self._notifier.wait(poll_interval())
+                else:
+                    self.stopped.wait(poll_interval())
+                if self.stopped.is_set():
+                    break
+                try:
+                    self.check()
+                except OSError as e:
+                    print(f"Error following {self.file_path}: {e}")
+        finally:
+            self._file.close()
+            if self._notifier is not None:
+                self._notifier.close()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def check(self) -> None:
+        """
+        Reads what was appended to the file since the last check and sends it to the followers.
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            # The file was rotated away and the new one does not exist yet. Finish the old one.
+            self._read_appended()
+            return
+
+        if stat.st_ino != self._inode:
+            # Send the lines written to the old file before it was rotated, then switch to the new one.
+            self._read_appended()
+            self._flush_carry()
+            self._file.close()
+            self._file = open(self.file_path, 'rb')
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self.offset = 0
+            self._broadcast(_event('rotated', {"file": self.file_path}))
+        elif stat.st_size < self.offset:
+            self._carry = b''
+            self.offset = 0
+            self._broadcast(_event('truncated', {"file": self.file_path}))
+
+        self._read_appended()
+
+    def _read_appended(self) -> None:
+        self._file.seek(self.offset)
+        while True:
+            chunk = self._file.read(FOLLOW_CHUNK_SIZE)
+            if not chunk:
+                return
+            self.reads += 1
+            self.offset += len(chunk)
+            buffer = self._carry + chunk if self._carry else chunk
+            complete = buffer.rfind(b'\n') + 1
+            self._carry = buffer[complete:]
+            if complete:
+                self._send_lines(buffer[:complete - 1].split(b'\n'))
+
+    def _flush_carry(self) -> None:
+        if self._carry:
+            self._send_lines([self._carry])
+            self._carry = b''
+
+    def _send_lines(self, raw_lines: List[bytes]) -> None:
+        # Every event is formatted once and shared by all the followers.
+        events = []
+        for raw_line in raw_lines:
+            line = decode_line(raw_line, self._errors)
+            if line:
+                events.append(_event(None, {"file": self.file_path, "line": line}))
+        if events:
+            self._broadcast(''.join(events))
+
+    def _broadcast(self, event: str) -> None:
+        with self._lock:
+            followers = list(self.followers)
+        for follower in followers:
+            follower.push(event)
+
+
+def _event(name: Optional[str], data: dict) -> str:
+    """Formats a Server-Sent Event."""
+    prefix = f"event: {name}\n" if name else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def subscribe(file_path: str) -> Follower:
+    """
+    Starts following a file, sharing the watcher of the file with its other followers.
+    The watcher is started for the first follower.
+
+    Parameters:
+      - file_path (str): The path to the file to follow.
+
+    Returns:
+      - Follower: The new follower.
+
+    Raises:
+      - OSError: If the file cannot be opened.
+    """
+    key = os.path.abspath(file_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None or watcher.stopped.is_set():
+            watcher = FileWatcher(key)
+            _watchers[key] = watcher
+            watcher.start()
+        return watcher.add()
+
+
+def unsubscribe(follower: Follower) -> None:
+    """
+    Stops following a file. The watcher of the file is stopped with its last follower.
+
+    Parameters:
+      - follower (Follower): The follower returned by `subscribe`.
+    """
+    watcher = follower.watcher
+    with _watchers_lock:
+        if watcher.remove(follower) == 0:
+            watcher.stop()
+            if _watchers.get(watcher.file_path) is watcher:
+                del _watchers[watcher.file_path]
+
+
+def follow(file_path: str) -> Iterator[str]:
+    """
+    Follows a file and yields the lines appended to it as Server-Sent Events, like `tail -f`.
+    Each line is a `{"file": ..., "line": ...}` message, rotations and truncations are sent as
+    `rotated` and `truncated` events, and idle periods are filled with comments so that the
+    connection stays open. Closing the generator stops following the file.
+
+    Parameters:
+      - file_path (str): The path to the file to follow.
+
+    Yields:
+      - str: Server-Sent Events, starting with a comment once the file is being followed.
+
+    Raises:
+      - OSError: If the file cannot be opened.
+    """
+    follower = subscribe(file_path)
+    try:
+        yield f": following {follower.watcher.file_path}\n\n"
+        heartbeat = heartbeat_interval()
+        while True:
+            try:
+                yield follower.events.get(timeout=heartbeat)
+            except queue.Empty:
+                if follower.overflowed:
+                    break
+                yield ": keepalive\n\n"
+                continue
+            if follower.overflowed and follower.events.empty():
+                break
+        yield _event('overflow', {"file": follower.watcher.file_path,
+                                  "ERROR": "The client fell too far behind and was disconnected."})
+    finally:
+        unsubscribe(follower)
@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, count
+from operator import add
+from typing import BinaryIO, List, Tuple
+
+from . import metrics
+from .byte_search import decode_errors, decode_line
+
+# Bytes read at a time while building or extending an index.
+INDEX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Bytes kept from right before the indexed end of a file, to tell an append from a file that
+# was truncated and written again while keeping its inode.
+CHECK_BYTES = 64
+
+# Rough cost of an index on top of its offsets: the object and its check bytes.
+INDEX_OVERHEAD = 200
+
+
+class LineIndex:
+    """
+    The offsets of the lines of a file, up to the end of its last complete line. Each line
+    costs a single 8-byte slot of `ends`, which holds the offset right after its newline, so
+    line `i` (from 0) spans from `ends[i - 1]` (or 0) to `ends[i]`. Only the first `n_ends`
+    slots belong to this index: when the file grows, the offsets of the appended lines are
+    added to the same array for the next index, which leaves this one unchanged.
+    """
+
+    __slots__ = ('inode', 'size', 'mtime', 'ends', 'n_ends', 'check')
+
+    def __init__(self, inode: int, size: int, mtime: float, ends: array, check: bytes):
+        self.inode = inode
+        # The size of the file when it was indexed, which may end with an incomplete line.
+        self.size = size
+        self.mtime = mtime
+        self.ends = ends
+        self.n_ends = len(ends)
+        self.check = check
+
+    @property
+    def end(self) -> int:
+        """The offset right after the last complete line, up to which the file is indexed."""
+        return self.ends[self.n_ends - 1] if self.n_ends else 0
+
+    @property
+    def line_count(self) -> int:
+        """The number of lines, counting an incomplete last line."""
+        return self.n_ends + (1 if self.size > self.end else 0)
+
+    @property
+    def cost(self) -> int:
+        return self.ends.itemsize * self.n_ends + INDEX_OVERHEAD
+
+    def span(self, first: int, n_lines: int) -> Tuple[int, int]:
+        """
+        Returns the byte range of `n_lines` lines starting at line `first` (from 0), with the
+        incomplete last line included when the range reaches it.
+        """
+        start = self.ends[first - 1] if first > 0 else 0
+        last = first + n_lines - 1
+        stop = self.ends[last] if last < self.n_ends else self.size
+        return start, stop
+
+
+class LineIndexCache:
+    """
+    In-process LRU cache of the line indexes of log files, bounded by the memory of their
+    offsets. An index is built with one sequential pass over a file, then extended with only
+    the appended bytes when the file grew, and built again when the file was rotated (a new
+    inode) or truncated (smaller, or different bytes before the indexed end).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def index(self, file_path: str) -> LineIndex:
+        """
+        Returns the up-to-date line index of a file, building or extending it as needed.
+
+        Parameters:
+          - file_path (str): The path to the log file.
+
+        Returns:
+          - LineIndex: The index of the file as it is now.
+
+        Raises:
+          - OSError: If the file cannot be read.
+        """
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None:
+                self._entries.move_to_end(file_path)
+
+        stat = os.stat(file_path)
+        if (entry is not None and entry.inode == stat.st_ino and entry.size == stat.st_size
+                and entry.mtime == stat.st_mtime):
+            self._count('hits')
+            return entry
+
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            stat = os.fstat(f.fileno())
+            extending = entry is not None and _continues(f, stat, entry)
+            self._count('extensions' if extending else 'misses')
+            start = entry.end if extending else 0
+
+            started = time.perf_counter()
+            ends = array('Q')
+            end = _index_lines(f, start, stat.st_size, ends)
+            metrics.record_phase('read', time.perf_counter() - started)
+            f.seek(max(0, end - CHECK_BYTES))
+            check = f.read(end - max(0, end - CHECK_BYTES))
+
+        if extending:
+            ends = self._append(entry, ends)
+        entry = LineIndex(stat.st_ino, stat.st_size, stat.st_mtime, ends, check)
+        self._store(file_path, entry)
+        return entry
+
+    def line_count(self, file_path: str) -> int:
+        """
+        Returns the number of lines of a file, from its index.
+
+        Parameters:
+          - file_path (str): The path to the log file.
+
+        Returns:
+          - int: The number of lines, counting empty lines and an incomplete last line.
+        """
+        return self.index(file_path).line_count
+
+    def read_lines(self, file_path: str, first: int, n_lines: int) -> Tuple[List[str], int]:
+        """
+        Reads a range of lines of a file, oldest first, with a single seek to where the first
+        one starts.
+
+        Parameters:
+          - file_path (str): The path to the log file.
+          - first (int): The number of the first line to read, counting from 1.
+          - n_lines (int): The maximum number of lines to read.
+
+        Returns:
+          - tuple: The lines, without their newlines, and the number of lines of the file.
+                   There are fewer lines than asked for when the range goes past the end of the file.
+        """
+        entry = self.index(file_path)
+        total = entry.line_count
+        if first > total:
+            return [], total
+
+        start, stop = entry.span(first - 1, min(n_lines, total - first + 1))
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            f.seek(start)
+            data = f.read(stop - start)
+        metrics.record_phase('read', time.perf_counter() - started)
+
+        raw_lines = data.split(b'\n')
+        if data.endswith(b'\n'):
+            raw_lines.pop()
+        errors = decode_errors()
+        # Under the `skip` policy, an undecodable line is returned empty to keep the numbering.
+        lines = [decode_line(line, errors) or '' for line in raw_lines]
+        return lines, total
+
+    def stats(self) -> dict:
+        """
+        Returns the hit, miss and extension counters of the cache and its current size.
+
+        Returns:
+          - dict: The counters, the number of indexed files and the bytes their offsets use.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "extensions": self.extensions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _append(self, entry: LineIndex, appended: array) -> array:
+        """
+        Adds the offsets of appended lines after those of an index, in place, so that extending
+        an index costs as much as the appended lines rather than all of them. The array is only
+        copied if another thread already extended it past this index.
+        """
+        with self._lock:
+            if len(entry.ends) == entry.n_ends:
+                entry.ends.extend(appended)
+                return entry.ends
+        return entry.ends[:entry.n_ends] + appended
+
+    def _store(self, file_path: str, entry: LineIndex) -> None:
+        """
+        Caches an index and evicts the least recently used ones until the cache fits its budget.
+        """
+        with self._lock:
+            previous = self._entries.pop(file_path, None)
+            if previous is not None:
+                self._size -= previous.cost
+            if entry.cost > self.max_bytes:
+                return
+            self._entries[file_path] = entry
+            self._size += entry.cost
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.cost
+
+
+def _continues(f: BinaryIO, stat: os.stat_result, entry: LineIndex) -> bool:
+    """
+    Checks whether a file is the one that was indexed, and still has the same bytes right
+    before the indexed end, so that only what comes after it has to be indexed.
+    """
+    if entry.inode != stat.st_ino or stat.st_size < entry.size:
+        return False
+    f.seek(entry.end - len(entry.check))
+    return f.read(len(entry.check)) == entry.check
+
+
+def _index_lines(f: BinaryIO, start: int, stop: int, ends: array) -> int:
+    """
+    Appends the offset right after every newline between `start` and `stop` to `ends`.
+    The offsets are computed from the lengths of the split lines, so that the loop over
+    the lines runs in C rather than in Python.
+
+    Returns:
+      - int: The offset right after the last newline, or `start` if there is none.
+    """
+    f.seek(start)
+    position = start
+    n_lines = len(ends)
+    while position < stop:
+        chunk = f.read(min(INDEX_CHUNK_SIZE, stop - position))
+        if not chunk:
+            break
+        parts = chunk.split(b'\n')
+        # The last part is not followed by a newline in this chunk.
+        parts.pop()
+        ends.extend(map(add, accumulate(map(len, parts)), count(position + 1)))
+        position += len(chunk)
+    metrics.record_scan(position - start, len(ends) - n_lines)
+    return ends[-1] if len(ends) > n_lines else start
+
+
+line_index_cache = LineIndexCache(int(os.environ.get('LINE_INDEX_BYTES', 64 * 1024 * 1024)))
+metrics.register_cache('line_index', line_index_cache.stats)
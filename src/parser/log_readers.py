@@ -0,0 +1,429 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .byte_search import decode_errors, decode_line, iter_matching_lines, matcher_for
+from .process_pools import ProcessPool
+from .reverse_reader import reverse_line_spans
+from .timestamps import MAX_PROBE_BYTES, TIMESTAMP_PREFIX, first_timestamp, line_timestamp, time_window
+
+# Openers for compressed log files, keyed by file extension. Each one takes a path
+# and returns a binary file object that yields the decompressed bytes as a stream.
+READERS: Dict[str, Callable[[str], BinaryIO]] = {
+    '.gz': lambda file_path: gzip.open(file_path, 'rb'),
+    '.bz2': lambda file_path: bz2.open(file_path, 'rb'),
+    '.xz': lambda file_path: lzma.open(file_path, 'rb'),
+}
+
+# Bytes decompressed at a time while reading a compressed file as a stream.
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Lines of a compressed file sent back by a worker at a time while it is read backwards. The
+# first page is small, since most reads stop early, and each next one is twice as big up to
+# the maximum, as every page is decompressed from the start of the file again.
+REVERSE_PAGE_LINES = 4096
+MAX_REVERSE_PAGE_LINES = 256 * 1024
+
+_pool = ProcessPool('decompression', lambda: int(os.environ.get('DECOMPRESS_WORKERS', os.cpu_count() or 1)))
+
+def register_reader(extension: str, opener: Callable[[str], BinaryIO]) -> None:
+    """
+    Registers an opener for compressed log files with the given extension. Worker processes
+    import this module on their own, so openers must be registered when a module is imported
+    rather than in response to a request.
+
+    Parameters:
+      - extension (str): The file extension, including the leading dot.
+      - opener (Callable): A function that takes a path and returns a binary file object with the decompressed data.
+    """
+    READERS[extension] = opener
+
+
+def compression_of(file_path: str) -> Optional[str]:
+    """
+    Returns the extension of a compressed log file, if it has one of the registered extensions.
+
+    Parameters:
+      - file_path (str): The path to the log file.
+
+    Returns:
+      - str: The extension of the file, if it is compressed.
+      - None: If the file is not compressed.
+    """
+    _, extension = os.path.splitext(file_path)
+    return extension if extension in READERS else None
+
+
+def open_log(file_path: str) -> BinaryIO:
+    """
+    Opens a log file in binary mode, decompressing it as a stream if it is compressed.
+
+    Parameters:
+      - file_path (str): The path to the log file.
+
+    Returns:
+      - BinaryIO: A binary file object with the (decompressed) contents of the file.
+    """
+    extension = compression_of(file_path)
+    if extension:
+        return READERS[extension](file_path)
+    return open(file_path, 'rb')
+
+
+def iter_line_batches(f: BinaryIO, since: Optional[float] = None,
+                      until: Optional[float] = None) -> Iterator[List[bytes]]:
+    """
+    Reads a stream a chunk at a time and yields its raw lines in batches, one batch per chunk,
+    so that only a chunk of the stream is held in memory at once. With `since` or `until`,
+    only the lines of that time window are yielded, found while reading since a compressed
+    stream cannot be searched with `time_window`. Lines without a timestamp belong to the
+    entry before them.
+
+    Parameters:
+      - f (BinaryIO): A binary file object, such as one returned by `open_log`.
+      - since (float, optional): Only yield the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only yield the entries up to this time, in seconds since the epoch.
+
+    Yields:
+      - list: The raw lines of a chunk, without their newlines. As with reading a plain file,
+              a trailing newline results in an empty last line.
+    """
+    windowed = since is not None or until is not None
+    inside = since is None
+    timed = False
+    # The lines before the first timestamp are only yielded once the file turns out to have one.
+    untimed = []
+    untimed_bytes = 0
+    carry = b''
+    while True:
+        chunk = f.read(DECOMPRESS_CHUNK_SIZE)
+        lines = (carry + chunk).split(b'\n')
+        if chunk:
+            # The last part is not followed by a newline yet, so it is read again with the next chunk.
+            carry = lines.pop()
+
+        if windowed:
+            batch = []
+            for line in lines:
+                timestamp = line_timestamp(line[:TIMESTAMP_PREFIX])
+                if timestamp is not None:
+                    if until is not None and timestamp > until:
+                        if batch:
+                            yield batch
+                        return
+                    if not timed:
+                        timed = True
+                        if inside:
+                            batch.extend(untimed)
+                        untimed = None
+                    inside = inside or timestamp >= since
+                if not timed:
+                    untimed.append(line)
+                    untimed_bytes += len(line) + 1
+                    if untimed_bytes > MAX_PROBE_BYTES:
+                        # As with `time_window`, a file without timestamps at its start has no window.
+                        return
+                elif inside:
+                    batch.append(line)
+            lines = batch
+        if lines:
+            yield lines
+        if not chunk:
+            return
+
+
+def decompress_lines(file_path: str, since: Optional[float] = None, until: Optional[float] = None,
+                     end: Optional[int] = None, n_lines: Optional[int] = None,
+                     deadline: Optional[float] = None) -> Tuple[int, List[Optional[str]]]:
+    """
+    Decompresses a log file as a stream and returns a page of its lines: the last `n_lines`
+    lines before line `end`. This is meant to run in a worker process through `decompression_pool`,
+    so that the CPU cost of decompressing several files runs in parallel across cores, and only
+    the page is held in memory and sent back, however big the file is.
+
+    Parameters:
+      - file_path (str): The path to the compressed log file.
+      - since (float, optional): Only count the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only count the entries up to this time, in seconds since the epoch.
+      - end (int, optional): The index of the line to stop before. Defaults to the end of the file.
+      - n_lines (int, optional): The size of the page. Defaults to every line before `end`.
+      - deadline (float, optional): The time in seconds since the epoch by which the page must be read.
+
+    Returns:
+      - tuple: The index of the first line of the page and its lines in file order, without line
+               terminators. Lines that cannot be decoded under the `skip` policy are None, so
+               that the indexes stay the same.
+
+    Raises:
+      - TimeoutError: If the deadline passed before the page was read.
+    """
+    page = deque(maxlen=n_lines)
+    index = 0
+    with open_log(file_path) as f:
+        for lines in iter_line_batches(f, since, until):
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Decompressing {file_path} did not finish in time.")
+            if end is not None:
+                lines = lines[:end - index]
+            page.extend(lines)
+            index += len(lines)
+            if end is not None and index >= end:
+                break
+    errors = decode_errors()
+    return index - len(page), [decode_line(line, errors) for line in page]
+
+
+def spool_lines(file_path: str, spool_path: str, since: Optional[float] = None,
+                until: Optional[float] = None) -> int:
+    """
+    Decompresses a log file as a stream into a plain spool file, which can then be read
+    backwards like any other file. This is meant to run in a worker process through
+    `decompression_pool`, for reads of a whole compressed file, which would otherwise
+    decompress the file again for every page.
+
+    Parameters:
+      - file_path (str): The path to the compressed log file.
+      - spool_path (str): The path of the file the decompressed lines are written to.
+      - since (float, optional): Only write the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only write the entries up to this time, in seconds since the epoch.
+
+    Returns:
+      - int: The number of lines written, which is the index `decompress_lines` gives the line after the last.
+    """
+    count = 0
+    with open_log(file_path) as f, open(spool_path, 'wb') as spool:
+        for lines in iter_line_batches(f, since, until):
+            if count:
+                spool.write(b'\n')
+            spool.write(b'\n'.join(lines))
+            count += len(lines)
+    return count
+
+
+def search_compressed(file_path: str, keyword: str, query=None,
+                      since: Optional[float] = None, until: Optional[float] = None) -> List[str]:
+    """
+    Searches a compressed log file for a keyword while decompressing it as a stream.
+    This is meant to run in a worker process through `decompression_pool`, and only the
+    matching lines are sent back.
+
+    Parameters:
+      - file_path (str): The path to the compressed log file.
+      - keyword (str): The keyword to search for.
+      - query (Query, optional): A compiled query to match lines with instead of the keyword.
+      - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+
+    Returns:
+      - list: The lines where the keyword was found, in file order.
+    """
+    finder, predicate = matcher_for(keyword, query)
+    if since is None and until is None:
+        with open_log(file_path) as f:
+            return list(iter_matching_lines(f, finder, predicate=predicate))
+
+    # Compressed streams cannot seek cheaply, so the window is found while decompressing.
+    errors = decode_errors()
+    found = []
+    with open_log(file_path) as f:
+        for lines in iter_line_batches(f, since, until):
+            for line in lines:
+                if finder is None or finder(line, 0, len(line)) != -1:
+                    decoded = decode_line(line, errors)
+                    if decoded is not None and (predicate is None or predicate(decoded)):
+                        found.append(decoded)
+    return found
+
+
+def decompression_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to decompress log files, creating it the first time it
+    is needed. Its size is set through `DECOMPRESS_WORKERS` and defaults to the number of CPUs.
+
+    Returns:
+      - ProcessPoolExecutor: The shared process pool.
+    """
+    return _pool.get()
+
+
+def run_decompression(function: Callable, *args) -> Any:
+    """
+    Runs a function in the decompression pool and waits for its result. If a worker died, 
+    the pool is replaced and the function is tried once more.
+
+    Parameters:
+      - function (Callable): The function to run, such as `search_compressed`.
+      - args: The arguments of the function.
+
+    Returns:
+      - Any: The result of the function.
+
+    Raises:
+      - BrokenProcessPool: If a worker of the new pool died as well.
+    """
+    return _pool.run(lambda pool: pool.submit(function, *args).result())
+
+
+def shutdown_decompression_pool() -> None:
+    """
+    Stops the decompression processes, if they were started, so that they do not outlive a
+    server process that is stopped. The pool is created again the next time it is needed.
+    """
+    _pool.shutdown()
+
+
+def record_compressed_scan(file_path: str, n_lines: int, seconds: float) -> None:
+    """
+    Records a compressed file that was read in a worker process in the metrics of the current
+    request, since the reads of the worker are not seen by this process. The compressed size
+    of the file is recorded as the bytes read, and the time waited for the worker as reading.
+
+    Parameters:
+      - file_path (str): The path to the compressed log file.
+      - n_lines (int): The number of lines that were sent back by the worker.
+      - seconds (float): The time waited for the worker.
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        size = 0
+    metrics.record_open()
+    metrics.record_scan(size, n_lines)
+    metrics.record_phase('read', seconds)
+
+
+def rotation_set(file_path: str) -> List[str]:
+    """
+    Finds the files that make up the rotation set of a log file, such as `x.log`,
+    `x.log.1` and `x.log.2.gz`, ordered from newest to oldest.
+
+    Parameters:
+      - file_path (str): The path to the current log file of the set.
+
+    Returns:
+      - list: The paths of the set, starting with `file_path` itself.
+    """
+    directory, name = os.path.split(file_path)
+    try:
+        names = os.listdir(directory or '.')
+    except OSError:
+        return [file_path]
+
+    rotations = []
+    prefix = name + '.'
+    for candidate in names:
+        if not candidate.startswith(prefix):
+            continue
+        index, _, extension = candidate[len(prefix):].partition('.')
+        if index.isdigit() and (not extension or '.' + extension in READERS):
+            rotations.append((int(index), os.path.join(directory, candidate)))
+
+    return [file_path] + [path for _, path in sorted(rotations)]
+
+
+def rotation_predates(file_path: str, since: float) -> bool:
+    """
+    Checks whether a log file starts before `since`, in which case its older rotations
+    have no entries from `since` on and do not need to be read.
+
+    Parameters:
+      - file_path (str): The path to the log file.
+      - since (float): The time in seconds since the epoch.
+
+    Returns:
+      - bool: True if the first timestamp of the file is before `since`.
+    """
+    try:
+        with open_log(file_path) as f:
+            timestamp = first_timestamp(f)
+    except (OSError, EOFError):
+        return False
+    return timestamp is not None and timestamp < since
+
+
+def iter_reverse_lines(file_path: str, end: Optional[int] = None, since: Optional[float] = None,
+                       until: Optional[float] = None, deadline: Optional[float] = None,
+                       whole: bool = False) -> Iterator[Tuple[int, str]]:
+    """
+    Yields the lines of a single log file from the last one to the first, along with a
+    position that `end` accepts to resume right before that line. For plain files the
+    position is the byte offset where the line starts. Compressed files cannot be read
+    backwards, so they are decompressed in a worker process, which sends back one page of
+    lines at a time, and the position is the index of the line.
+
+    Parameters:
+      - file_path (str): The path to the log file.
+      - end (int, optional): A position previously yielded by this function, to resume from.
+      - since (float, optional): Only yield the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only yield the entries up to this time, in seconds since the epoch.
+                                 Positions are only valid for the same `since` and `until`.
+      - deadline (float, optional): The time in seconds since the epoch by which each page of a
+                                    compressed file must be read.
+      - whole (bool): Whether the caller reads the whole file. A compressed file is then decompressed
+                      once into a temporary spool file that is read backwards, rather than a page at a time.
+
+    Yields:
+      - tuple: The position of the line and the line itself.
+
+    Raises:
+      - TimeoutError: If the deadline passed while a compressed file was decompressed.
+    """
+    if compression_of(file_path) and whole and end is None:
+        yield from _iter_spooled_lines(file_path, since, until)
+    elif compression_of(file_path):
+        n_lines = REVERSE_PAGE_LINES
+        while end is None or end > 0:
+            started = time.perf_counter()
+            first, lines = run_decompression(decompress_lines, file_path, since, until, end, n_lines, deadline)
+            record_compressed_scan(file_path, len(lines), time.perf_counter() - started)
+            for index in range(len(lines) - 1, -1, -1):
+                if lines[index] is not None:
+                    yield first + index, lines[index]
+            if not lines:
+                break
+            end = first
+            n_lines = min(2 * n_lines, MAX_REVERSE_PAGE_LINES)
+    else:
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            start = 0
+            if since is not None or until is not None:
+                start, window_end = time_window(f, since, until)
+                end = window_end if end is None else min(end, window_end)
+            errors = decode_errors()
+            for offset, line in reverse_line_spans(f, end, start):
+                decoded = decode_line(line, errors)
+                if decoded is not None:
+                    yield offset, decoded
+
+
+def _iter_spooled_lines(file_path: str, since: Optional[float] = None,
+                        until: Optional[float] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Decompresses a whole log file once into a temporary spool file in a worker process and
+    yields its lines backwards with their index, as `iter_reverse_lines` does. The spool file
+    is removed once the lines were read or the caller stopped.
+    """
+    fd, spool_path = tempfile.mkstemp(prefix='parser-spool-')
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        index = run_decompression(spool_lines, file_path, spool_path, since, until)
+        # The lines are recorded as they are read back from the spool file.
+        record_compressed_scan(file_path, 0, time.perf_counter() - started)
+        errors = decode_errors()
+        with open(spool_path, 'rb') as f:
+            for _, line in reverse_line_spans(f):
+                index -= 1
+                decoded = decode_line(line, errors)
+                if decoded is not None:
+                    yield index, decoded
+    finally:
+        os.unlink(spool_path)
@@ -1,9 +1,246 @@
 import os
 import sys
-from flask import Flask, request, make_response
-from parser import read_single_file, search_directory, read_n_log_entries, read_all_log_files, make_remote_call
+import json
+import time
+from contextlib import closing
+from typing import Iterator, Optional, Tuple
+from flask import Flask, Response, g, request, make_response
+from flask.json.provider import DefaultJSONProvider
+from parser import read_single_file, search_directory, read_all_log_files, read_log_page, read_log_lines, make_remote_call, iter_remote_call
+from parser import iter_single_file, iter_all_log_entries, iter_search_directory, search_newest_first, search_fields, iter_search_fields
+from parser import compression, metrics, profiling, scheduler, search_index
+from parser.fields import field_filters
+from parser.file_catalog import catalog_for
+from parser.stats import DEFAULT_BUCKET_SECONDS, DEFAULT_TOP, MAX_TOP, aggregate, parse_bucket
+from parser.query import Query
+from parser.timestamps import parse_time
+from parser.follow import follow
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """
+    The default JSON provider, which also records the time spent serializing responses.
+    """
+
+    def response(self, *args, **kwargs):
+        with metrics.timed('serialize'):
+            return super().response(*args, **kwargs)
 
 app = Flask(__name__)
+app.json = _TimedJSONProvider(app)
+
+def create_app() -> Flask:
+    """
+    Returns the server for `flask run`, after starting the background search indexer if the
+    index is enabled. Importing this module starts no threads: the pre-fork launcher loads it
+    before forking its workers and runs a single indexer process for all of them instead.
+
+    Returns: The Flask application.
+    
+    """
+    search_index.start_background_indexer()
+    return app
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _wants_ndjson() -> bool:
+    """
+    Checks whether the client asked for a streamed NDJSON response through the `Accept` header.
+
+    Returns: True if `application/x-ndjson` is preferred over `application/json`.
+    
+    """
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def _ndjson_response(records: Iterator[Tuple[str, str]], not_found_message: str, status: Optional[dict] = None):
+    """
+    Builds a streamed response that writes one `{"file": ..., "line": ...}` JSON object per line 
+    as the records are produced, so memory stays bounded regardless of the size of the result.
+
+    Parameters:
+      - records: An iterator of (file path, line) tuples.
+      - not_found_message: The message returned with status code 404 if there are no records at all.
+      - status: A dictionary that the records fill in with `TRUNCATED` once they are exhausted. 
+                If matches were left out, a final `{"truncated": true}` object is written.
+
+    Returns: A streamed NDJSON response, or an error with status code 404.
+    
+    """
+    # Pull the first record before streaming so that an empty result can still return 404.
+    first = next(records, None)
+    if first is None and not (status and status.get("TRUNCATED")):
+        return make_response(not_found_message, 404)
+
+    def generate():
+        serializing = 0.0
+        try:
+            if first is not None:
+                file_path, line = first
+                yield json.dumps({"file": file_path, "line": line}) + "\n"
+            for file_path, line in records:
+                started = time.perf_counter()
+                record = json.dumps({"file": file_path, "line": line}) + "\n"
+                serializing += time.perf_counter() - started
+                yield record
+            if status and status.get("TRUNCATED"):
+                yield json.dumps({"truncated": True}) + "\n"
+        finally:
+            metrics.record_phase('serialize', serializing)
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+def _time_window() -> dict:
+    """
+    Reads the `since` and `until` query parameters, which limit the entries to a time window.
+
+    Returns: The `since` and `until` values that were given, in seconds since the epoch.
+
+    Raises: ValueError if one of them is not a recognized time.
+    
+    """
+    window = {}
+    for name in ('since', 'until'):
+        if request.args.get(name):
+            window[name] = parse_time(request.args.get(name))
+    return window
+
+@app.before_request
+def _start_request_metrics():
+    """
+    Starts timing the request and recording the bytes and lines it reads. If the request asks 
+    to be profiled, through the `profile` query parameter or the `X-Profile` header, and sends 
+    the right `X-Profile-Token`, it is also run under a profiler.
+    """
+    g.metrics_started = time.perf_counter()
+    g.metrics_scan = metrics.start_scan()
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+
+    mode = request.args.get('profile') or request.headers.get('X-Profile')
+    if mode:
+        if not profiling.authorized(request.headers.get('X-Profile-Token')):
+            return make_response("Profiling requires a valid X-Profile-Token.", 403)
+        mode = 'sample' if mode.lower() in ('1', 'true') else mode.lower()
+        if mode not in profiling.MODES:
+            return make_response(f"Invalid profile mode. Must be one of: {', '.join(profiling.MODES)}.", 400)
+        try:
+            g.profile = profiling.RequestProfile(mode, g.metrics_scan, request.path)
+        except RuntimeError as e:
+            return make_response(f"{e} Try again later, or use the sample mode.", 409)
+
+# Requests that are always served: they are cheap, and needed to watch a saturated server. 
+# Followers are long-lived and share a single watcher per file, so they would only hold slots.
+_UNADMITTED_ROUTES = ('/', '/metrics', '/profiles', '/profiles/<profile_id>', '/follow/<file>')
+# Requests that read a bounded part of a single file, which are admitted ahead of directory scans.
+_INTERACTIVE_ROUTES = ('/log/<file>', '/files')
+
+@app.before_request
+def _admit_request():
+    """
+    Waits for a slot to serve the request, so that only a bounded number of requests are 
+    served at the same time. When the server is saturated, the request is shed with 503 
+    and a `Retry-After` estimate instead.
+    """
+    rule = request.url_rule.rule if request.url_rule else None
+    if rule is None or rule in _UNADMITTED_ROUTES or not scheduler.admission.enabled:
+        return None
+
+    priority = scheduler.INTERACTIVE if rule in _INTERACTIVE_ROUTES else scheduler.SCAN
+    ticket = scheduler.admission.acquire(priority)
+    if ticket is None:
+        response = make_response("The server is busy, retry later.", 503)
+        response.headers['Retry-After'] = str(scheduler.admission.retry_after())
+        return response
+    g.admission = ticket
+
+@app.after_request
+def _record_request_metrics(response):
+    """
+    Records the latency, the response size and the reads of the request once its response 
+    was sent. For streamed responses, that is when the stream is closed, so the time and the 
+    reads spent producing the stream are included.
+    """
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    scan = g.metrics_scan
+    profile = g.get('profile')
+    # The slot of the request is only given back once its response was sent, streamed or not.
+    ticket = g.get('admission')
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (route, request.method, str(response.status_code))
+    size = [0]
+    if response.is_streamed:
+        response.response = _count_bytes(response.response, size)
+    else:
+        size[0] = response.content_length or 0
+
+    # The phases of a streamed response are only complete once the stream is closed, so its 
+    # header has the time spent before streaming started. Profiles have the complete timings.
+    response.headers['Server-Timing'] = profiling.server_timing(scan, time.perf_counter() - started)
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+
+    def record():
+        if ticket is not None:
+            scheduler.admission.release(ticket)
+        metrics.stop_scan()
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, labels)
+        metrics.HTTP_RESPONSE_SIZE.observe(size[0], (route,))
+        metrics.BYTES_SCANNED.inc(scan.bytes, (route,))
+        metrics.LINES_SCANNED.inc(scan.lines, (route,))
+        metrics.FILES_OPENED.inc(scan.files, (route,))
+        for phase, seconds in list(scan.phases.items()):
+            metrics.PHASE_SECONDS.inc(seconds, (route, phase))
+        if profile is not None:
+            profile.finish()
+
+    response.call_on_close(record)
+    return response
+
+# After-request functions run in the reverse order they are registered, so responses are 
+# compressed before their metrics are recorded, and the compressed size is what is measured.
+@app.after_request
+def _compress_response(response):
+    """
+    Compresses the response with gzip or deflate, as negotiated through `Accept-Encoding`. 
+    Streamed responses are compressed incrementally, and other responses once they reach 
+    `COMPRESS_MIN_BYTES`.
+    """
+    if (request.method == 'HEAD' or response.status_code in (204, 206, 304) or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not compression.compressible(response.mimetype)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = compression.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compression.compress_stream(
+            response.response, encoding, flush_every_chunk=response.mimetype in compression.RECORD_STREAM_TYPES
+        )
+    else:
+        data = response.get_data()
+        if len(data) < compression.min_bytes():
+            return response
+        response.set_data(compression.compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def _count_bytes(body, size: list):
+    """
+    Passes the chunks of a streamed body through, encoded, while adding up their size.
+    Closing it closes the body, which stops the work behind the stream.
+    """
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
 
 @app.route("/")
 def index():
@@ -25,14 +262,92 @@ def get_all_logs():
     
     Returns: A hashmap that has all log entries in each file with the key 
              being the name of the file and an array with the entries for that file.
+             When the client accepts `application/x-ndjson`, the entries are streamed 
+             instead, one `{"file": ..., "line": ...}` object per line.
     
     """    
+    if _wants_ndjson():
+        return _ndjson_response(iter_all_log_entries(), "No readable log files found.")
+
     results = read_all_log_files()
     if results:
         return results
     else:
         return make_response("No readable log files found.", 404)
 
+@app.route('/metrics')
+def get_metrics():
+    """
+    Endpoint that exposes the metrics of this server in the Prometheus text format.
+
+    Returns: Per route latency histograms, response sizes, and the bytes and lines read and 
+             files opened to serve requests. Also the errors reading files, the number of tasks 
+             waiting in each shared pool and the latency of the calls to each remote host.
+    
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/profiles')
+def get_profiles():
+    """
+    Endpoint to list the stored request profiles. Requires the `X-Profile-Token` header.
+
+    Returns: A list with the id, mode, path, duration and phase timings of each stored profile, 
+             oldest first.
+    
+    """
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return make_response("Profiling requires a valid X-Profile-Token.", 403)
+    return profiling.list_profiles()
+
+@app.route('/profiles/<profile_id>')
+def get_profile(profile_id: str):
+    """
+    Endpoint to retrieve the profile of a request. Requires the `X-Profile-Token` header.
+
+    URI path parameter: profile_id
+        - The id returned in the `X-Profile-Id` header of the profiled request.
+
+    Returns: The profile, with its mode, path, duration, the time spent in each phase and the 
+             `profile` itself: collapsed stacks for `sample`, or `cProfile` statistics.
+    
+    """
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return make_response("Profiling requires a valid X-Profile-Token.", 403)
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return make_response(f"Profile '{profile_id}' not found.", 404)
+    return profile
+
+@app.route('/files')
+def list_files():
+    """
+    Endpoint to list the files in the log directory from the file catalog, along with 
+    their metadata.
+
+    Query parameter: kind (optional)
+        - Only list the files of this kind: `text`, `compressed`, `binary`, `empty` or `unreadable`.
+
+    Returns: A hashmap with the path of each file as the key and its size, mtime, inode, 
+             kind, detected encoding and whether it is readable as the value. Only `text` 
+             and `compressed` files are read and searched by the other endpoints.
+    
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    kind = request.args.get('kind')
+
+    results = {}
+    for info in catalog_for(log_directory).files(fresh=True):
+        if kind is None or info.kind == kind:
+            details = info.to_dict()
+            del details["path"]
+            results[info.path] = details
+
+    if results:
+        return results
+    else:
+        return make_response(f"No files found in the {log_directory} directory.", 404)
+
 @app.route('/log')
 def get_single_log_file():
     """
@@ -42,8 +357,14 @@ def get_single_log_file():
     Query parameter: file_name
         - The name of the file to parse the entries from.
 
+    Query parameters: since, until (optional)
+        - Only return the entries in this time window. Times are ISO-8601, seconds since the 
+          epoch or a timestamp in a log format such as syslog.
+
     Returns: A hashmap that has all log entries in the file with the key 
              being the name of the file and an array with the entries for that file.
+             When the client accepts `application/x-ndjson`, the entries are streamed 
+             instead, one `{"file": ..., "line": ...}` object per line.
     
     """
     file_name = request.args.get('file')
@@ -60,8 +381,16 @@ def get_single_log_file():
     else: 
         file_path = file_name
 
+    try:
+        window = _time_window()
+    except ValueError as e:
+        return make_response(str(e), 400)
+
+    if _wants_ndjson():
+        return _ndjson_response(iter_single_file(file_path, **window), f"File '{file_name}' not found.")
+
     results = {}
-    read_single_file(file_path, results)
+    read_single_file(file_path, results, **window)
     
     if results:
         return results
@@ -78,25 +407,172 @@ def search_logs():
     Query parameter: keyword
         - A word or words to search for across all files in the /var/log directory
 
+    Query parameter: query (instead of keyword)
+        - A query combining terms, "quoted phrases" and /regex/ terms with AND, OR, NOT 
+          and parentheses, for example `timeout AND "db pool" NOT /retry \\d+/`.
+
+    Query parameter: regex (optional)
+        - When set to `true`, the whole `query` is used as a single regular expression.
+
+    Query parameters: limit, per_file_limit, timeout_ms, cursor (optional)
+        - With any of these, files are searched newest entry first and the search stops once 
+          `limit` matches were found or `timeout_ms` ran out. `per_file_limit` caps the matches 
+          of each file, and `cursor` continues a search that stopped early. Streamed searches 
+          apply the limits too, searching the most recently modified files first, but take no cursor.
+
+    Query parameters: since, until (optional)
+        - Only search the entries in this time window. Times are ISO-8601, seconds since the 
+          epoch or a timestamp in a log format such as syslog.
+
+    Query parameters: field.NAME=VALUE, field.NAME!=VALUE (optional)
+        - Only return the entries whose parsed fields, such as `level`, `host`, `program` or 
+          the keys of JSON lines, have (or do not have) the value. With these, the keyword 
+          and query are optional, and limits and cursors are not supported.
+
     Returns: A hashmap that has all log entries that contain the keyword value, 
              with the key being the name of the file and an array with the entries for that file.
+             For a `query`, the `STATS` key reports the number of patterns, the bytes scanned 
+             and the throughput of the search. For a limited search, the `TRUNCATED` key tells 
+             whether matches were left out, and `CURSOR` holds the cursor to continue the search.
+             When the client accepts `application/x-ndjson`, the matches are streamed 
+             instead, one `{"file": ..., "line": ...}` object per line, followed by 
+             `{"truncated": true}` if a limit or the time budget left matches out.
     
     """      
     keyword = request.args.get('keyword')
-    if not keyword:
+    query_text = request.args.get('query')
+    try:
+        filters = field_filters(request.args.items(multi=True))
+    except ValueError as e:
+        return make_response(str(e), 400)
+    if not keyword and not query_text and not filters:
         return make_response("No keyword provided.", 400)
     
-    # Remove quotes from the keyword, if any. 
-    keyword = keyword.replace('"', '').replace("'", "")
-    results = search_directory(keyword)
+    query = None
+    if query_text:
+        try:
+            query = Query(query_text, regex=request.args.get('regex', '').lower() == 'true')
+        except ValueError as e:
+            return make_response(f"Invalid query: {e}", 400)
+        keyword = query_text
+    elif keyword:
+        # Remove quotes from the keyword, if any. 
+        keyword = keyword.replace('"', '').replace("'", "")
+
+    try:
+        window = _time_window()
+    except ValueError as e:
+        return make_response(str(e), 400)
+
+    if filters:
+        if any(request.args.get(name) is not None for name in ('limit', 'per_file_limit', 'timeout_ms', 'cursor')):
+            return make_response("Field filters cannot be combined with limits or a cursor.", 400)
+        if _wants_ndjson():
+            log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+            return _ndjson_response(iter_search_fields(filters, keyword, query, **window),
+                                    f"No entries matching the field filters were found in any file in the {log_directory} directory.")
+        results = search_fields(filters, keyword, query, **window)
+        if query is not None:
+            results["STATS"] = query.stats()
+        return make_response(results, 404) if "ERROR" in results else results
+
+    limits = {}
+    for name in ('limit', 'per_file_limit', 'timeout_ms'):
+        if request.args.get(name) is not None:
+            try:
+                limits[name] = int(request.args.get(name))
+            except ValueError:
+                limits[name] = 0
+            if limits[name] <= 0:
+                return make_response(f"Invalid {name} provided. Must be a positive integer.", 400)
+
+    if _wants_ndjson():
+        if request.args.get('cursor'):
+            return make_response("Cursors are not supported for streamed searches.", 400)
+        log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+        status = {}
+        return _ndjson_response(iter_search_directory(keyword, query, **limits, **window, status=status),
+                                f"Keyword '{keyword}' was not found in any file in the {log_directory} directory.",
+                                status)
+
+    if limits or request.args.get('cursor'):
+        try:
+            results = search_newest_first(keyword, query, cursor=request.args.get('cursor'), **limits, **window)
+        except ValueError as e:
+            return make_response(str(e), 400)
+    else:
+        results = search_directory(keyword, query, **window)
+
+    if query is not None:
+        results["STATS"] = query.stats()
     
-    if results["ERROR"]:
+    if "ERROR" in results:
         return make_response(results, 404)
     else:
         return results 
         
     
 
+@app.route('/stats')
+def log_stats():
+    """
+    Endpoint to summarize the log entries on the server instead of returning them, in a 
+    single streaming pass that takes bounded memory however many entries there are.
+
+    Query parameters: keyword or query (optional)
+        - Only summarize the entries that contain the keyword or match the query, as in `/search`. 
+          Without them, all the entries are summarized.
+
+    Query parameters: since, until (optional)
+        - Only summarize the entries in this time window.
+
+    Query parameter: bucket (optional)
+        - The width of the time buckets, in seconds or with a unit such as `5m` or `1h`. Defaults to 60 seconds.
+
+    Query parameter: top (optional)
+        - The number of top words and field values to return. Defaults to 10.
+
+    Query parameter: field (optional, can be repeated)
+        - A parsed field, such as `program` or `level`, to return the top and distinct values of.
+
+    Returns: A hashmap with the number of entries (`TOTAL`), by file (`FILES`) and by time bucket 
+             (`HISTOGRAM`, with the entries without a timestamp in `UNTIMED`), the approximate top 
+             words (`TOP_TERMS`) and number of distinct words (`DISTINCT_TERMS`), and the top and 
+             distinct values of each field (`FIELDS`).
+    
+    """
+    keyword = request.args.get('keyword')
+    query_text = request.args.get('query')
+
+    query = None
+    if query_text:
+        try:
+            query = Query(query_text, regex=request.args.get('regex', '').lower() == 'true')
+        except ValueError as e:
+            return make_response(f"Invalid query: {e}", 400)
+        keyword = query_text
+    elif keyword:
+        # Remove quotes from the keyword, if any. 
+        keyword = keyword.replace('"', '').replace("'", "")
+
+    try:
+        window = _time_window()
+        bucket = parse_bucket(request.args.get('bucket', str(DEFAULT_BUCKET_SECONDS)))
+    except ValueError as e:
+        return make_response(str(e), 400)
+
+    try:
+        top = int(request.args.get('top', DEFAULT_TOP))
+    except ValueError:
+        top = 0
+    if not 0 < top <= MAX_TOP:
+        return make_response(f"Invalid top provided. Must be a positive integer up to {MAX_TOP}.", 400)
+
+    results = aggregate(keyword, query, bucket=bucket, top=top, fields=request.args.getlist('field'), **window)
+    if query is not None:
+        results["STATS"] = query.stats()
+    return results
+
 @app.route('/log/<file>')
 def read_number_of_entries(file: str):
     """
@@ -110,8 +586,21 @@ def read_number_of_entries(file: str):
         - A positive integer that indicates the number of entries to retrieve
           from the specified file.
 
+    Query parameter: cursor (optional)
+        - The cursor returned with a previous page, to retrieve the next older entries.
+
+    Query parameters: since, until (optional)
+        - Only return the entries in this time window. A cursor must be passed with the same values.
+
+    Query parameter: line (optional)
+        - The number of a line, counting from 1, to return the lines from there on, oldest
+          first, instead of the most recent entries. It cannot be combined with the other
+          optional parameters.
+
     Returns: A hashmap that has n-number of entries with the key being the name of 
-             the file and an array with the entries for that file.
+             the file and an array with the entries for that file. If there are older 
+             entries, the `CURSOR` key holds the cursor to retrieve the next page.
+             With `line`, the `LINES` key holds the number of lines of the file.
     
     """       
     try: 
@@ -122,16 +611,72 @@ def read_number_of_entries(file: str):
         elif entries <= 0:
             return make_response("Invalid number of entries provided. Must be a positive integer.", 400)
         
-        # Remove quotes from the keyword, if any. 
-        results = read_n_log_entries(file, entries)
+        try:
+            window = _time_window()
+        except ValueError as e:
+            return make_response(str(e), 400)
+
+        if request.args.get('line') is not None:
+            try:
+                line = int(request.args.get('line'))
+            except ValueError:
+                line = 0
+            if line <= 0:
+                return make_response("Invalid line number provided. Must be a positive integer.", 400)
+            if request.args.get('cursor') or window:
+                return make_response("The line parameter cannot be combined with a cursor or a time window.", 400)
+            results = read_log_lines(file, line, entries)
+        else:
+            results = read_log_page(file, entries, request.args.get('cursor'), **window)
         
-        if type(results) == dict:
+        if "ERROR" in results:
+            return make_response(results, 400)
+        elif type(results) == dict:
             return results 
         else:
             return make_response(results, 404)
     except Exception as e:
         return make_response(e, 500)
 
+@app.route('/follow/<file>')
+def follow_log_file(file: str):
+    """
+    Endpoint to follow a log file, like `tail -f`, over Server-Sent Events.
+
+    Method: GET
+    URI path parameter: file name
+        - The name of the file to follow.
+
+    Returns: A `text/event-stream` response that sends every line appended to the file 
+             as a `{"file": ..., "line": ...}` message, and `rotated` or `truncated` events 
+             when the file is rotated or truncated. All the followers of a file share a 
+             single watcher, so the appended bytes are read once no matter how many there are.
+    
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+
+    # Check if the log_directory is already defined in the file name
+    if (file.find(log_directory) == -1):
+        file_path = log_directory + "/" + file
+    else:
+        file_path = file
+
+    events = follow(file_path)
+    try:
+        # Start following before the response is sent, so that a missing file returns 404.
+        first = next(events)
+    except OSError:
+        return make_response(f"File '{file}' not found.", 404)
+
+    def generate():
+        # Closing the events stops following the file when the client disconnects.
+        with closing(events):
+            yield first
+            yield from events
+
+    return Response(generate(), mimetype='text/event-stream', 
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/remote', methods=['POST'])
 def remote_server_queries():
     """
@@ -151,17 +696,43 @@ def remote_server_queries():
 
     Returns: A hashmap that has n-number of entries with the keys being the name of 
              the file and an array with the entries for that file.
+             The `STATUS` key has the status code (or `timeout`/`error`), latency and
+             whether the request was hedged, for each host.
+             When the client accepts `application/x-ndjson`, the results are streamed 
+             one JSON object per line, tagged with their `host`, in the order the hosts answer.
+
+    Query parameters:
+      - deadline_ms: Time budget for all the hosts. Hosts that miss it are reported as timed out.
+      - timeout_ms: Connect and read timeout for each host.
+      - hedge_ms: Delay after which a second request is sent to a host that has not answered yet.
     
     """    
-    data = request.get_json()
-
-    # Process the received data
-    if data:
-        resp =  make_remote_call(data)
-        return resp
-        # if "ERROR" in resp:
-        #     return make_response(f"Error making request to host {data.get("host")}: { resp['ERROR']}", 400)
-    else:
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
         return make_response("Invalid payload.", 400)
-    # Return a response
-    return resp
\ No newline at end of file
+
+    budgets = {}
+    for name in ('deadline_ms', 'timeout_ms', 'hedge_ms'):
+        if request.args.get(name) is not None:
+            try:
+                budgets[name] = int(request.args.get(name))
+            except ValueError:
+                budgets[name] = 0
+            if budgets[name] <= 0:
+                return make_response(f"Invalid {name} provided. Must be a positive integer.", 400)
+
+    if _wants_ndjson():
+        records = iter_remote_call(data, **budgets)
+
+        def generate():
+            # Closing the records stops the remote calls if the client disconnects.
+            with closing(records):
+                for record in records:
+                    with metrics.timed('serialize'):
+                        line = json.dumps(record) + "\n"
+                    yield line
+
+        return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+    return make_remote_call(data, **budgets)
+
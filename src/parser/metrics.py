@@ -0,0 +1,357 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Buckets of the latency histograms, in seconds, and of the size histograms, in bytes (256 B to 256 MB).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(256 * 4 ** exponent for exponent in range(11))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[str, ...]
+
+_registry: List['_Metric'] = []
+
+
+class _Metric:
+    """
+    A metric family with a fixed set of label names. Every metric registers itself so that
+    `render` exposes it.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> Iterable[Tuple[str, Labels, Tuple[str, ...], float]]:
+        """Yields the (name suffix, extra label names, label values, value) of every sample."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        output = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, extra_labels, values, value in self.samples():
+            output.append(f"{self.name}{suffix}{_format_labels(self.labels + extra_labels, values)} {_format_value(value)}")
+        return output
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as the number of bytes read."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '', (), labels, value
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Instead of being set, it can be computed when the metrics
+    are collected by a function that returns the value of each set of labels.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = (),
+                 collect: Optional[Callable[[], Iterable[Tuple[Labels, float]]]] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: Labels = ()) -> None:
+        self.inc(-amount, labels)
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self._collect is not None:
+            values.update(self._collect())
+        for labels, value in sorted(values.items()):
+            yield '', (), labels, value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations, such as latencies, in cumulative buckets. Observing a value is a
+    binary search over the bucket bounds and a few additions.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # For each set of labels: the count of each bucket (the last one is +Inf) and the sum.
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', ('le',), labels + (_format_value(bound),), cumulative
+            yield '_count', (), labels, cumulative
+            yield '_sum', (), labels, total
+
+
+def _format_labels(names: Labels, values: Tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """
+    Returns every registered metric in the Prometheus text exposition format.
+
+    Returns:
+      - str: The metrics, one sample per line.
+    """
+    output = []
+    for metric in _registry:
+        output.extend(metric.render())
+    return '\n'.join(output) + '\n'
+
+
+# The phases that the work of a request is broken down into, in the order they usually happen: listing
+# the log directory, reading (and decompressing) files, matching lines, serializing and compressing the response.
+PHASES = ('walk', 'read', 'match', 'serialize', 'compress')
+
+
+class RequestScan:
+    """
+    The bytes and lines read, the files opened and the time spent in each phase while serving
+    a single request, along with the threads that did the work. Reads record into the scan of
+    the request they run for, which is found through a context variable, so the readers do
+    not need to be handed anything. Phase times are added up across threads.
+    """
+
+    __slots__ = ('bytes', 'lines', 'files', 'phases', 'threads', '_lock')
+
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+        self.files = 0
+        self.phases: Dict[str, float] = {}
+        self.threads = {threading.get_ident()}
+        self._lock = threading.Lock()
+
+    def add(self, n_bytes: int, n_lines: int, n_files: int) -> None:
+        with self._lock:
+            self.bytes += n_bytes
+            self.lines += n_lines
+            self.files += n_files
+            self.threads.add(threading.get_ident())
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.threads.add(threading.get_ident())
+
+
+_current_scan: contextvars.ContextVar[Optional[RequestScan]] = contextvars.ContextVar('current_scan', default=None)
+
+
+def start_scan() -> RequestScan:
+    """
+    Starts recording the reads of the current request. Work submitted to a thread pool must
+    run in a copy of the current context (`contextvars.copy_context().run`) to be recorded.
+
+    Returns:
+      - RequestScan: The scan that the reads of the request are recorded in.
+    """
+    scan = RequestScan()
+    _current_scan.set(scan)
+    return scan
+
+
+def stop_scan() -> None:
+    """Stops recording the reads of the current request."""
+    _current_scan.set(None)
+
+
+def record_scan(n_bytes: int, n_lines: int = 0) -> None:
+    """
+    Records bytes and lines read from log files for the current request, if there is one.
+    This is called once per chunk that is read rather than per line, to keep it off the hot path.
+    """
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add(n_bytes, n_lines, 0)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Records time spent in one of the `PHASES` for the current request, if there is one."""
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add_phase(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str):
+    """Records the time spent in the block in one of the `PHASES` for the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def record_open() -> None:
+    """Records that a log file was opened for the current request, if there is one."""
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add(0, 0, 1)
+
+
+def _executor_queue_depth(executor) -> int:
+    """
+    Returns the number of tasks waiting for a worker in a thread or process pool. Executors do
+    not expose it, so it is read from their internals.
+    """
+    work_queue = getattr(executor, '_work_queue', None)
+    if work_queue is not None:
+        return work_queue.qsize()
+    pending = getattr(executor, '_pending_work_items', None)
+    if pending is not None:
+        return max(0, len(pending) - getattr(executor, '_max_workers', 0))
+    return 0
+
+
+_executors: Dict[str, Callable] = {}
+
+
+def register_executor(name: str, get_executor: Callable) -> None:
+    """
+    Registers an executor whose queue depth is reported, as `logserver_executor_queue_depth`.
+
+    Parameters:
+      - name (str): The value of the `executor` label.
+      - get_executor (Callable): Returns the executor, or None while it has not been created.
+    """
+    _executors[name] = get_executor
+
+
+def _collect_queue_depths():
+    for name, get_executor in list(_executors.items()):
+        executor = get_executor()
+        if executor is not None:
+            yield (name,), _executor_queue_depth(executor)
+
+
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, get_stats: Callable[[], dict]) -> None:
+    """
+    Registers an in-process cache whose counters are reported, as `logserver_cache_lookups`,
+    `logserver_cache_entries` and `logserver_cache_bytes`.
+
+    Parameters:
+      - name (str): The value of the `cache` label.
+      - get_stats (Callable): Returns the `hits`, `misses`, `extensions`, `entries` and `bytes` of the cache.
+    """
+    _caches[name] = get_stats
+
+
+def _collect_cache_lookups():
+    for name, get_stats in list(_caches.items()):
+        stats = get_stats()
+        for result, key in (('hit', 'hits'), ('miss', 'misses'), ('extension', 'extensions')):
+            yield (name, result), stats[key]
+
+
+def _cache_collector(key: str) -> Callable:
+    def collect():
+        for name, get_stats in list(_caches.items()):
+            yield (name,), get_stats()[key]
+    return collect
+
+
+HTTP_REQUEST_DURATION = Histogram('logserver_http_request_duration_seconds',
+                                  'Time to serve a request, until its response was sent.',
+                                  ('route', 'method', 'status'))
+HTTP_RESPONSE_SIZE = Histogram('logserver_http_response_size_bytes', 'Size of the response bodies.',
+                               ('route',), SIZE_BUCKETS)
+HTTP_REQUESTS_IN_FLIGHT = Gauge('logserver_http_requests_in_flight', 'Requests being served, including open streams.')
+BYTES_SCANNED = Counter('logserver_bytes_scanned_total', 'Bytes read from log files to serve requests.', ('route',))
+LINES_SCANNED = Counter('logserver_lines_scanned_total',
+                        'Lines read from log files to serve requests. Searches only count the candidate lines they decode.',
+                        ('route',))
+PHASE_SECONDS = Counter('logserver_phase_seconds_total',
+                        'Time spent in each phase of the requests, added up across threads.', ('route', 'phase'))
+FILES_OPENED = Counter('logserver_files_opened_total', 'Log files opened to serve requests.', ('route',))
+READ_ERRORS = Counter('logserver_read_errors_total', 'Log files that could not be read or searched.', ('operation',))
+EXECUTOR_QUEUE_DEPTH = Gauge('logserver_executor_queue_depth', 'Tasks waiting for a worker in a shared pool.',
+                             ('executor',), collect=_collect_queue_depths)
+CACHE_LOOKUPS = Gauge('logserver_cache_lookups',
+                      'Lookups in each in-process cache since the server started, by result. An extension is a hit '
+                      'that only read what was appended to the file.', ('cache', 'result'),
+                      collect=_collect_cache_lookups)
+CACHE_ENTRIES = Gauge('logserver_cache_entries', 'Entries held by each in-process cache.', ('cache',),
+                      collect=_cache_collector('entries'))
+CACHE_BYTES = Gauge('logserver_cache_bytes', 'Approximate memory used by each in-process cache.', ('cache',),
+                    collect=_cache_collector('bytes'))
+REMOTE_REQUEST_DURATION = Histogram('logserver_remote_request_duration_seconds',
+                                    'Latency of the calls to remote hosts.', ('host', 'status'))
+ADMISSION_QUEUED = Gauge('logserver_admission_queued', 'Requests waiting to be admitted, by priority.', ('priority',))
+ADMISSION_WAIT = Histogram('logserver_admission_wait_seconds', 'Time requests waited to be admitted.', ('priority',))
+ADMISSION_REJECTED = Counter('logserver_admission_rejected_total',
+                             'Requests shed with 503 because the server was saturated, by priority and reason.',
+                             ('priority', 'reason'))
@@ -0,0 +1,149 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from . import metrics
+from .byte_search import iter_matching_lines, matcher_for
+from .process_pools import ProcessPool
+
+# Files at least this big are split into byte ranges that are searched in parallel worker processes.
+DEFAULT_THRESHOLD = 256 * 1024 * 1024
+
+
+def parallel_threshold() -> int:
+    """
+    Returns the file size, in bytes, from which a file is searched in parallel. It is set
+    through the `PARALLEL_SCAN_THRESHOLD` environment variable.
+
+    Returns:
+      - int: The size threshold in bytes.
+    """
+    return int(os.environ.get('PARALLEL_SCAN_THRESHOLD', DEFAULT_THRESHOLD))
+
+
+def parallel_workers() -> int:
+    """
+    Returns the number of worker processes used to search large files. It is set through the
+    `PARALLEL_SCAN_WORKERS` environment variable and defaults to the number of CPUs.
+
+    Returns:
+      - int: The number of workers.
+    """
+    return int(os.environ.get('PARALLEL_SCAN_WORKERS', os.cpu_count() or 1))
+
+
+_pool = ProcessPool('scan', parallel_workers)
+
+
+def scan_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to search byte ranges of large files, creating it the first
+    time it is needed.
+
+    Returns:
+      - ProcessPoolExecutor: The shared process pool.
+    """
+    return _pool.get()
+
+
+def shutdown_scan_pool() -> None:
+    """Stops the processes of `scan_pool`, if it was created, when the server stops."""
+    _pool.shutdown()
+
+
+def split_ranges(file_path: str, n_ranges: int, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Splits a file into up to `n_ranges` byte ranges of roughly the same size. Every range
+    starts at the beginning of a line and ends right after a newline (or at the end of the
+    file), so no line is split between two ranges.
+
+    Parameters:
+      - file_path (str): The path to the file to split.
+      - n_ranges (int): The number of ranges to aim for.
+      - start (int): The offset of the line to start from. Defaults to the beginning of the file.
+      - end (int, optional): The offset right after the last line to split. Defaults to the end of the file.
+
+    Returns:
+      - list: The (start, end) byte ranges, in file order.
+    """
+    size = os.path.getsize(file_path) if end is None else end
+    boundaries = [start]
+    with open(file_path, 'rb') as f:
+        for i in range(1, n_ranges):
+            target = start + (size - start) * i // n_ranges
+            if target <= boundaries[-1]:
+                continue
+            f.seek(target - 1)
+            # Move the boundary to the start of the next line.
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def scan_range(file_path: str, start: int, end: int, keyword: str, query=None) -> List[str]:
+    """
+    Searches the lines in a byte range of a file. This is meant to run in a worker process
+    through `scan_pool`.
+
+    Parameters:
+      - file_path (str): The path to the file to search.
+      - start (int): The offset of the first line in the range.
+      - end (int): The offset right after the last line in the range.
+      - keyword (str): The keyword to search for.
+      - query (Query, optional): A compiled query to match lines with instead of the keyword.
+
+    Returns:
+      - list: The matching lines, in file order.
+    """
+    finder, predicate = matcher_for(keyword, query)
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return list(iter_matching_lines(f, finder, limit=end - start, predicate=predicate))
+
+
+def parallel_search_file(file_path: str, keyword: str, query=None, workers: Optional[int] = None,
+                         start: int = 0, end: Optional[int] = None) -> List[str]:
+    """
+    Searches a large file by splitting it into newline-aligned byte ranges and scanning the
+    ranges in parallel worker processes. The matches of each range are merged back in file order.
+    If a worker died, for example killed for running out of memory, the broken pool is replaced
+    and the search is run once more.
+
+    Parameters:
+      - file_path (str): The path to the file to search.
+      - keyword (str): The keyword to search for.
+      - query (Query, optional): A compiled query to match lines with instead of the keyword.
+      - workers (int, optional): The number of ranges to split the file into. Defaults to the number of workers.
+      - start (int): The offset of the line to start searching from. Defaults to the beginning of the file.
+      - end (int, optional): The offset right after the last line to search. Defaults to the end of the file.
+
+    Returns:
+      - list: The matching lines, in file order.
+    """
+    started = time.perf_counter()
+    ranges = split_ranges(file_path, workers or parallel_workers(), start, end)
+    found = _pool.run(lambda pool: _scan_ranges(pool, file_path, ranges, keyword, query))
+    # The reads of the workers are not seen by this process, so they are recorded here, and the 
+    # time waited for them as matching.
+    metrics.record_open()
+    metrics.record_scan(sum(range_end - range_start for range_start, range_end in ranges), len(found))
+    metrics.record_phase('match', time.perf_counter() - started)
+    return found
+
+
+def _scan_ranges(pool: ProcessPoolExecutor, file_path: str, ranges: List[Tuple[int, int]], keyword: str,
+                 query=None) -> List[str]:
+    tasks = [
+        pool.submit(scan_range, file_path, range_start, range_end, keyword, query)
+        for range_start, range_end in ranges
+    ]
+    found = []
+    for task in tasks:
+        found.extend(task.result())
+    return found
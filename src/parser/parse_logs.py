@@ -1,14 +1,21 @@
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import Generator
+from typing import Iterator, Optional, Tuple
+
+from . import metrics
+from .cursors import decode_cursor, encode_cursor
+from .file_catalog import catalog_for
+from .line_index import line_index_cache
+from .log_readers import compression_of, iter_reverse_lines, rotation_predates, rotation_set
+from .scheduler import run_tasks
+from .tail_cache import tail_cache
 
 
 def read_all_log_files() -> list:
     """
-    This function traverses the directory specified by the environment variable 
-    `LOG_DIRECTORY` (or '/var/log' by default) and reads each log file. It uses a 
-    thread pool to read the log files concurrently, and aggregates the log entries 
-    into a dictionary.
+    This function lists the directory specified by the environment variable 
+    `LOG_DIRECTORY` (or '/var/log' by default) through the file catalog and reads each log file. The log 
+    files are read concurrently in the I/O pool shared by all requests, and the log entries 
+    are aggregated into a dictionary.
 
     Returns:
         list: A list of aggregated log entries from all the log files found in the 
@@ -17,24 +24,16 @@ def read_all_log_files() -> list:
     log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
 
     all_log_entries = {}
-    tasks = []
-
-    # Traverse directory and read each log file in a separate thread
-    with ThreadPoolExecutor() as executor:
-        for root, _, files in os.walk(log_directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                task = executor.submit(read_single_file, file_path, all_log_entries)
-                tasks.append(task)
-
-        # Wait for each file search task to complete
-        for task in tasks:
-            task.result()
+
+    # Read the log files of the catalog in the shared I/O pool, a few at a time
+    run_tasks(read_single_file, ((file_path, all_log_entries) 
+                                 for file_path in catalog_for(log_directory).log_files()))
     
     # Display aggregated logs
     return all_log_entries
 
-def read_single_file(file_path: str, all_log_entries: dict) -> None:
+def read_single_file(file_path: str, all_log_entries: dict, since: Optional[float] = None, 
+                     until: Optional[float] = None) -> None:
     """
     Reads a single log file and stores its contents in a provided dictionary.
     Each line from the file is collected and added to a list, which is then 
@@ -44,12 +43,14 @@ def read_single_file(file_path: str, all_log_entries: dict) -> None:
       - file_path (str): The path to the log file to be read.
       - all_log_entries (dict): A dictionary to store the log entries. 
                                 The file path is used as the key, and a list of log lines is the value.
+      - since (float, optional): Only read the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only read the entries up to this time, in seconds since the epoch.
 
     """
     file_entries = []
 
     try:
-        for line in _read_log_lines(file_path):
+        for line in _read_log_lines(file_path, since, until):
             if line:
                 file_entries.append(line)
         
@@ -59,6 +60,43 @@ def read_single_file(file_path: str, all_log_entries: dict) -> None:
             all_log_entries["ERROR"] = f"There were no entries in {file_path}."
 
     except Exception as e:
+        metrics.READ_ERRORS.inc(labels=('read',))
+        print(f"Error reading: {file_path}. Won't be included in the response.")
+
+def iter_all_log_entries() -> Iterator[Tuple[str, str]]:
+    """
+    Traverses the log directory and yields the log entries of every file one at a time, 
+    newest first within each file. Files are read one after the other so that only a 
+    single chunk of a single file is held in memory, no matter how big the directory is.
+
+    Yields:
+      - tuple: The file path and a log entry from that file.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+
+    for file_path in catalog_for(log_directory).log_files():
+        yield from iter_single_file(file_path)
+
+def iter_single_file(file_path: str, since: Optional[float] = None, 
+                     until: Optional[float] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields the log entries of a single file one at a time, newest first. 
+    Files that cannot be read are skipped, in the same way as `read_single_file`.
+
+    Parameters:
+      - file_path (str): The path to the log file to be read.
+      - since (float, optional): Only yield the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only yield the entries up to this time, in seconds since the epoch.
+
+    Yields:
+      - tuple: The file path and a log entry from that file.
+    """
+    try:
+        for line in _read_log_lines(file_path, since, until):
+            if line:
+                yield file_path, line
+    except Exception as e:
+        metrics.READ_ERRORS.inc(labels=('read',))
         print(f"Error reading: {file_path}. Won't be included in the response.")
 
 def read_n_log_entries(file_name: str, n_entries: int) -> list:
@@ -71,11 +109,13 @@ def read_n_log_entries(file_name: str, n_entries: int) -> list:
       - file_name (str): The name of the log file to read. 
       - n_entries (int): The maximum number of log entries to read from the file.
 
+    If the file has fewer entries, the rest are read from its older rotations 
+    (`file.1`, `file.2.gz`, ...) as if they were one file.
+
     Returns:
       - dict: A dictionary with the file path as the key and a list of up to `n_entries` log entries as the value.
 
     """
-    count = 0
     entries = []
     
     log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
@@ -86,17 +126,161 @@ def read_n_log_entries(file_name: str, n_entries: int) -> list:
     else:
         file_path = file_name
     
-    # Read up to n_entries or the file is exhausted
-    for line in _read_log_lines(file_path):
-        if line:
-            if count < n_entries: 
+    # Serve the most recent entries from the tail cache, which only touches the disk 
+    # when the file changed since it was last read.
+    files_to_read = rotation_set(file_path)
+    if not compression_of(file_path):
+        try:
+            entries, _, _ = tail_cache.read_tail(file_path, n_entries)
+            files_to_read = files_to_read[1:]
+        except OSError:
+            # The file could not be checked against the cache, read it directly instead.
+            pass
+
+    # Read up to n_entries or until the file and its older rotations are exhausted
+    for path in files_to_read:
+        if len(entries) == n_entries:
+            break
+        for line in _read_log_lines(path, whole=False):
+            if line:
+                if len(entries) < n_entries: 
                     entries.append(line)
-                    count += 1
-            else:
-                break
+                else:
+                    break
     return {file_path: entries}
 
-def _read_log_lines(file_path: str) -> Generator[str]:
+def read_log_page(file_name: str, n_entries: int, cursor: Optional[str] = None, 
+                  since: Optional[float] = None, until: Optional[float] = None) -> dict:
+    """
+    Reads one page of up to `n_entries` log entries from a given log file, newest first. 
+    The result includes a cursor that records the byte offset where reading stopped, so 
+    that the next (older) page is read with a single seek instead of rescanning the file 
+    from the end. Once the file is exhausted, paging continues into its older rotations.
+
+    Parameters:
+      - file_name (str): The name of the log file to read. 
+      - n_entries (int): The maximum number of log entries to read from the file.
+      - cursor (str, optional): A cursor returned by a previous call, to continue where that page stopped.
+      - since (float, optional): Only read the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only read the entries up to this time, in seconds since the epoch.
+                                 A cursor must be used with the same `since` and `until` it was returned for.
+
+    Returns:
+      - dict: A dictionary with the file path as the key and a list of up to `n_entries` log entries as the value.
+              If there are older entries left to read, the `CURSOR` key holds the cursor for the next page.
+      - dict: An error message if the cursor is invalid or no longer matches the file.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    
+    # Check if the log_directory is already defined in the file_name
+    if (file_name.find(log_directory) == -1):
+        file_path = log_directory + "/" + file_name
+    else:
+        file_path = file_name
+
+    rotations = rotation_set(file_path)
+    entries = []
+    member = 0
+    end = None
+    position = 0
+    fingerprint = None
+
+    if cursor:
+        state = decode_cursor(cursor) or {}
+        member = state.get("member", 0)
+        # An offset of None means the next page starts at the end of that rotation.
+        if (not all(isinstance(state.get(key), int) for key in ("inode", "size")) 
+                or not (state.get("offset") is None or isinstance(state.get("offset"), int))
+                or not isinstance(member, int) or not 0 <= member < len(rotations)):
+            return {"ERROR": f"Invalid or expired cursor for {file_path}."}
+
+        # The cursor is only valid for the same file, and only as long as it was not truncated.
+        # The rotation may also have been removed since the files were listed.
+        try:
+            stat = os.stat(rotations[member])
+        except OSError:
+            return {"ERROR": f"Invalid or expired cursor for {file_path}."}
+        if state["inode"] != stat.st_ino or stat.st_size < state["size"]:
+            return {"ERROR": f"Invalid or expired cursor for {file_path}."}
+        end = state["offset"]
+        fingerprint = (state["inode"], state["size"])
+    elif not compression_of(file_path) and since is None and until is None:
+        # The first page is the tail of the file, which is served from the tail cache.
+        entries, position, (inode, size, _) = tail_cache.read_tail(file_path, n_entries)
+        fingerprint = (inode, size)
+        if len(entries) < n_entries:
+            member += 1
+            fingerprint = None
+
+    # Continue into older rotations of the file until the page is full
+    while len(entries) < n_entries and member < len(rotations):
+        if fingerprint is None:
+            stat = os.stat(rotations[member])
+            fingerprint = (stat.st_ino, stat.st_size)
+
+        for position, line in iter_reverse_lines(rotations[member], end, since, until):
+            if line:
+                entries.append(line)
+                if len(entries) == n_entries:
+                    break
+
+        if len(entries) == n_entries:
+            break
+        if since is not None and rotation_predates(rotations[member], since):
+            # The older rotations only have entries from before the window.
+            member = len(rotations)
+            break
+        member += 1
+        end = None
+        fingerprint = None
+
+    results = {file_path: entries}
+    if len(entries) == n_entries and (position > 0 or member < len(rotations) - 1):
+        if position == 0:
+            # The page ended exactly at the start of a file, so the next one starts with the next rotation.
+            stat = os.stat(rotations[member + 1])
+            member, fingerprint, position = member + 1, (stat.st_ino, stat.st_size), None
+        results["CURSOR"] = encode_cursor({
+            "member": member, "inode": fingerprint[0], "size": fingerprint[1], "offset": position
+        })
+    return results
+
+def read_log_lines(file_name: str, first_line: int, n_entries: int):
+    """
+    Reads a range of lines of a given log file by line number, oldest first. The offsets of
+    the lines are kept in a compact index that is built once per file and extended as the
+    file grows, so any range is read with a single seek, however deep into the file it is.
+
+    Parameters:
+      - file_name (str): The name of the log file to read.
+      - first_line (int): The number of the first line to read, counting from 1.
+      - n_entries (int): The maximum number of lines to read.
+
+    Returns:
+      - dict: A dictionary with the file path as the key and the list of lines as the value,
+              and the `LINES` key with the number of lines of the file. Empty lines are
+              included, so that the numbers match the ones of the file.
+      - dict: An error message if the file is compressed.
+      - str: An error message if the file does not exist.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+
+    # Check if the log_directory is already defined in the file_name
+    if (file_name.find(log_directory) == -1):
+        file_path = log_directory + "/" + file_name
+    else:
+        file_path = file_name
+
+    if compression_of(file_path):
+        return {"ERROR": f"Line numbers are not available for the compressed file {file_path}."}
+    try:
+        lines, total = line_index_cache.read_lines(file_path, first_line, n_entries)
+    except FileNotFoundError:
+        return f"File '{file_name}' not found."
+    return {file_path: lines, "LINES": total}
+
+def _read_log_lines(file_path: str, since: Optional[float] = None, 
+                    until: Optional[float] = None, whole: bool = True) -> Iterator[str]:
     """
     Reads a log file in reverse order and yields each line from the end to the beginning. 
     This method efficiently reads large log files by processing chunks of data in reverse 
@@ -104,28 +288,16 @@ def _read_log_lines(file_path: str) -> Generator[str]:
 
     Parameters:
       - file_path (str): The path to the log file to be read.
+      - whole (bool): Whether the whole file is read, rather than only its newest lines.
+
+    Compressed files are decompressed in a worker process before their lines are yielded, 
+    in a single pass when the whole file is read and a page at a time otherwise.
+    With `since` or `until`, only the entries in that time window are read, which is found 
+    with a binary search over the file instead of reading all of it.
 
     Yields:
       - str: Each line from the log file, starting from the last line and working backwards to the first.
     """
-
-    chunk_size = 1024
-    with open(file_path, 'rb') as f:
-        f.seek(0, 2)  
-        position = f.tell()
-        buffer = b''
-
-        while position > 0:
-            read_size = min(chunk_size, position)
-            position -= read_size
-            f.seek(position)
-            buffer = f.read(read_size) + buffer
-
-            while b'\n' in buffer:
-                line_end = buffer.rfind(b'\n')
-                yield buffer[line_end + 1:].decode('utf-8')
-                buffer = buffer[:line_end]
-
-        if buffer:
-            yield buffer.decode('utf-8')
-
+    # Lines that are not valid UTF-8 are decoded with the `DECODE_ERRORS` policy, as in searches.
+    for _, line in iter_reverse_lines(file_path, since=since, until=until, whole=whole):
+        yield line
@@ -0,0 +1,80 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from . import metrics
+
+
+class ProcessPool:
+    """
+    A process pool that is created the first time it is needed and shared by every request.
+    Workers are spawned rather than forked because the server is multi-threaded. A pool whose
+    worker died, for example killed for running out of memory, refuses every later task, so
+    `run` replaces it with a new one and tries the work once more.
+    """
+
+    def __init__(self, name: str, workers: Callable[[], int]):
+        """
+        Parameters:
+          - name (str): The name of the pool, reported as the `executor` label of its queue depth.
+          - workers (Callable): Returns the number of worker processes when the pool is created.
+        """
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        metrics.register_executor(name, lambda: self._pool)
+
+    def get(self) -> ProcessPoolExecutor:
+        """
+        Returns the process pool, creating it if it was not created yet or was replaced.
+
+        Returns:
+          - ProcessPoolExecutor: The shared process pool.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._workers(),
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def run(self, work: Callable[[ProcessPoolExecutor], Any]) -> Any:
+        """
+        Runs work that submits tasks to the pool and waits for their results. If a worker died,
+        the broken pool is dropped and the work is run once more on a new pool.
+
+        Parameters:
+          - work (Callable): Takes the pool and returns the result of its tasks.
+
+        Returns:
+          - Any: The result of the work.
+
+        Raises:
+          - BrokenProcessPool: If a worker of the new pool died as well.
+        """
+        for attempt in range(2):
+            pool = self.get()
+            try:
+                return work(pool)
+            except BrokenProcessPool:
+                self._discard(pool)
+                if attempt:
+                    raise
+
+    def shutdown(self) -> None:
+        """
+        Stops the processes of the pool, if it was created, so that they do not outlive a server
+        process that is stopped. The pool is created again the next time it is needed.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        """Drops a broken pool, unless another thread already replaced it."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,245 @@
+import cProfile
+import io
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from .metrics import PHASES, RequestScan
+
+# The profilers a request can be run under. `sample` takes the stacks of every thread that works
+# for the request at a fixed interval and returns them as collapsed stacks, as flame graph tools
+# expect. `cprofile` records every call with `cProfile`, which is exact but slower, and only runs
+# for one request at a time.
+MODES = ('sample', 'cprofile')
+
+# Frames kept per sampled stack, counting from the innermost one.
+MAX_STACK_DEPTH = 64
+
+_profiles: 'OrderedDict[str, dict]' = OrderedDict()
+_profiles_lock = threading.Lock()
+
+# From Python 3.12, `cProfile` is built on `sys.monitoring`, which takes a single profiler for the
+# whole process, so a second one fails to start. Held while a request runs under `cProfile`.
+_deterministic_lock = threading.Lock()
+
+
+def profile_token() -> Optional[str]:
+    """
+    Returns the token that requests must send in the `X-Profile-Token` header to be profiled, or
+    to retrieve profiles. It is set through the `PROFILE_TOKEN` environment variable, and
+    profiling is disabled when it is not set.
+
+    Returns:
+      - str: The token, or None if profiling is disabled.
+    """
+    return os.environ.get('PROFILE_TOKEN') or None
+
+
+def authorized(token: Optional[str]) -> bool:
+    """
+    Checks a token sent by a client against `PROFILE_TOKEN`, in constant time.
+
+    Parameters:
+      - token (str, optional): The token sent by the client.
+
+    Returns:
+      - bool: True if profiling is enabled and the token is the right one.
+    """
+    expected = profile_token()
+    return expected is not None and token is not None and secrets.compare_digest(token.encode(), expected.encode())
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Daemon thread that samples the stacks of the threads working for a request, which are the
+    threads that recorded reads or phases in its scan. Its cost does not depend on how much
+    Python code the request runs, so it is cheap enough to use on live traffic.
+    """
+
+    def __init__(self, scan: RequestScan, interval: float):
+        super().__init__(name='profiler', daemon=True)
+        self.scan = scan
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.scan.threads):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        """
+        Stops sampling.
+
+        Returns:
+          - str: The samples as collapsed stacks, one `outer;...;inner count` line per stack,
+                 the most frequent first.
+        """
+        self._stopped.set()
+        self.join()
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class DeterministicProfiler:
+    """
+    Runs a request under `cProfile`, one request at a time in the process. Up to Python 3.11
+    only the thread that starts it is profiled. From 3.12 every thread of the process is, so
+    the profile also has the calls of the thread pools and of other requests served meanwhile.
+    Streamed responses are profiled until the stream is closed.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self._running = False
+
+    def start(self) -> None:
+        """
+        Starts profiling.
+
+        Raises:
+          - RuntimeError: If another request is already being profiled with `cProfile`, or another
+                          profiler of the process is active.
+        """
+        if not _deterministic_lock.acquire(blocking=False):
+            raise RuntimeError("Another request is already being profiled in cprofile mode.")
+        try:
+            self.profile.enable()
+        except ValueError as e:
+            _deterministic_lock.release()
+            raise RuntimeError(f"The cprofile mode is not available: {e}")
+        self._running = True
+
+    def stop(self) -> str:
+        """
+        Stops profiling.
+
+        Returns:
+          - str: The statistics of the 100 functions with the highest cumulative time.
+        """
+        if self._running:
+            self._running = False
+            try:
+                self.profile.disable()
+            finally:
+                _deterministic_lock.release()
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(100)
+        return output.getvalue()
+
+
+class RequestProfile:
+    """
+    A profile being taken of a single request.
+
+    Raises:
+      - RuntimeError: If the profiler of the mode cannot be started right now.
+    """
+
+    def __init__(self, mode: str, scan: RequestScan, path: str):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.path = path
+        self.started = time.perf_counter()
+        if mode == 'cprofile':
+            self._profiler = DeterministicProfiler()
+        else:
+            interval = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+            self._profiler = SamplingProfiler(scan, interval)
+        self._scan = scan
+        self._profiler.start()
+
+    def finish(self) -> dict:
+        """
+        Stops profiling and stores the profile, so it can be retrieved with `get_profile`.
+
+        Returns:
+          - dict: The profile.
+        """
+        profile = self._profiler.stop()
+        stored = {
+            "id": self.id,
+            "mode": self.mode,
+            "path": self.path,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "phases_ms": phase_timings(self._scan),
+            "profile": profile,
+        }
+        keep = int(os.environ.get('PROFILE_KEEP', 20))
+        with _profiles_lock:
+            _profiles[self.id] = stored
+            while len(_profiles) > keep:
+                _profiles.popitem(last=False)
+        return stored
+
+
+def phase_timings(scan: RequestScan) -> Dict[str, float]:
+    """
+    Returns the time spent in each phase of a request, in milliseconds, in the order of `PHASES`.
+
+    Parameters:
+      - scan (RequestScan): The scan of the request.
+
+    Returns:
+      - dict: The milliseconds spent in each phase that the request went through.
+    """
+    phases = dict(scan.phases)
+    return {phase: round(phases[phase] * 1000, 3) for phase in PHASES if phase in phases}
+
+
+def server_timing(scan: RequestScan, total: float) -> str:
+    """
+    Builds the `Server-Timing` header of a request from the time spent in each of its phases.
+
+    Parameters:
+      - scan (RequestScan): The scan of the request.
+      - total (float): The time the request took so far, in seconds.
+
+    Returns:
+      - str: The header value, such as `walk;dur=0.4, read;dur=12.1, total;dur=15.2`.
+    """
+    timings = list(phase_timings(scan).items()) + [('total', round(total * 1000, 3))]
+    return ', '.join(f"{phase};dur={milliseconds}" for phase, milliseconds in timings)
+
+
+def get_profile(profile_id: str) -> Optional[dict]:
+    """
+    Returns a stored profile.
+
+    Parameters:
+      - profile_id (str): The id of the profile, as returned in the `X-Profile-Id` header.
+
+    Returns:
+      - dict: The profile, or None if there is no such profile (anymore).
+    """
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> List[dict]:
+    """
+    Returns a summary of the stored profiles, oldest first.
+
+    Returns:
+      - list: The id, mode, path, duration and phase timings of each profile.
+    """
+    with _profiles_lock:
+        return [{key: value for key, value in profile.items() if key != 'profile'} for profile in _profiles.values()]
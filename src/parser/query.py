@@ -0,0 +1,208 @@
+import re
+import threading
+import time
+from typing import List, Tuple
+
+# Splits a query into quoted phrases, /regex/ terms, parentheses and bare words. A regex term
+# has to stand on its own, so that paths such as /var/log are read as plain words.
+TOKEN_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|/((?:[^/\\]|\\.)+)/(?=[\s()]|$)|(\()|(\))|([^\s()]+)')
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+class Query:
+    """
+    A search query compiled once and then evaluated against every line. Queries combine
+    literal terms, quoted phrases and /regex/ terms with `AND`, `OR`, `NOT` and parentheses,
+    and adjacent terms are joined with `AND`. For example: `timeout AND "db pool" NOT /retry \\d+/`.
+
+    All the terms a line needs for a match are combined into a single regular expression,
+    so lines that cannot match are rejected with one pass over the line no matter how many
+    patterns the query has. Only the lines that pass it are checked term by term.
+    """
+
+    def __init__(self, text: str, regex: bool = False):
+        """
+        Parameters:
+          - text (str): The query to compile.
+          - regex (bool): Treat the whole query as a single regular expression instead of parsing it.
+
+        Raises:
+          - ValueError: If the query or one of its regular expressions is invalid.
+        """
+        self.text = text
+        self.regex = regex
+        try:
+            if regex:
+                self.tree = ('re', re.compile(text))
+            else:
+                tokens = _tokenize(text)
+                self.tree, position = _parse_or(tokens, 0)
+                if position != len(tokens):
+                    raise ValueError(f"Unexpected '{tokens[position][1]}' in query.")
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression in query: {e}")
+
+        self.terms = _terms(self.tree)
+        self.prefilter = None
+        if _requires_term(self.tree):
+            try:
+                self.prefilter = re.compile('|'.join(
+                    f'(?:{term.pattern})' if kind == 're' else re.escape(term) for kind, term in self.terms
+                ))
+            except re.error:
+                # Terms that cannot be combined, such as ones with global inline flags, are checked one by one.
+                self.prefilter = None
+
+        self.files = 0
+        self.bytes_scanned = 0
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def matches(self, line: str) -> bool:
+        """
+        Checks whether a line matches the query.
+
+        Parameters:
+          - line (str): The line to check.
+
+        Returns:
+          - bool: True if the line matches.
+        """
+        if self.prefilter is not None and not self.prefilter.search(line):
+            return False
+        return _evaluate(self.tree, line)
+
+    def record(self, n_bytes: int) -> None:
+        """
+        Records that a file of `n_bytes` was scanned with this query, for the throughput report.
+        """
+        with self._lock:
+            self.files += 1
+            self.bytes_scanned += n_bytes
+
+    def stats(self) -> dict:
+        """
+        Returns the throughput of the query since it was compiled.
+
+        Returns:
+          - dict: The number of patterns, files and bytes scanned, the elapsed time and the MB/s.
+        """
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            return {
+                "patterns": len(self.terms),
+                "files": self.files,
+                "bytes_scanned": self.bytes_scanned,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "mb_per_s": round(self.bytes_scanned / elapsed / 1e6, 3) if elapsed > 0 else 0.0,
+            }
+
+    def __getstate__(self) -> dict:
+        # The lock cannot be pickled, which is needed to send the query to worker processes.
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def _tokenize(text: str) -> List[Tuple[str, object]]:
+    tokens = []
+    for phrase, regex, opening, closing, word in TOKEN_PATTERN.findall(text):
+        if phrase:
+            tokens.append(('lit', re.sub(r'\\(.)', r'\1', phrase)))
+        elif regex:
+            tokens.append(('re', re.compile(regex.replace('\\/', '/'))))
+        elif opening:
+            tokens.append(('(', opening))
+        elif closing:
+            tokens.append((')', closing))
+        elif word in OPERATORS:
+            tokens.append((word, word))
+        else:
+            tokens.append(('lit', word))
+    if not tokens:
+        raise ValueError("Empty query.")
+    return tokens
+
+
+def _parse_or(tokens: list, position: int) -> Tuple[tuple, int]:
+    children = []
+    node, position = _parse_and(tokens, position)
+    children.append(node)
+    while position < len(tokens) and tokens[position][0] == 'OR':
+        node, position = _parse_and(tokens, position + 1)
+        children.append(node)
+    return (children[0] if len(children) == 1 else ('or', children)), position
+
+
+def _parse_and(tokens: list, position: int) -> Tuple[tuple, int]:
+    children = []
+    node, position = _parse_not(tokens, position)
+    children.append(node)
+    while position < len(tokens) and tokens[position][0] not in ('OR', ')'):
+        if tokens[position][0] == 'AND':
+            position += 1
+        node, position = _parse_not(tokens, position)
+        children.append(node)
+    return (children[0] if len(children) == 1 else ('and', children)), position
+
+
+def _parse_not(tokens: list, position: int) -> Tuple[tuple, int]:
+    if position >= len(tokens):
+        raise ValueError("Query ends unexpectedly.")
+    kind, value = tokens[position]
+    if kind == 'NOT':
+        node, position = _parse_not(tokens, position + 1)
+        return ('not', node), position
+    if kind == '(':
+        node, position = _parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position][0] != ')':
+            raise ValueError("Missing closing parenthesis in query.")
+        return node, position + 1
+    if kind in ('lit', 're'):
+        return (kind, value), position + 1
+    raise ValueError(f"Unexpected '{value}' in query.")
+
+
+def _terms(node: tuple) -> list:
+    """Returns the distinct terms the line needs to contain for a match, in query order."""
+    kind = node[0]
+    if kind in ('lit', 're'):
+        return [node]
+    if kind == 'not':
+        return []
+    terms = []
+    for child in node[1]:
+        for term in _terms(child):
+            if term not in terms:
+                terms.append(term)
+    return terms
+
+
+def _requires_term(node: tuple) -> bool:
+    """Checks whether every line matching the node contains at least one of its terms."""
+    kind = node[0]
+    if kind in ('lit', 're'):
+        return True
+    if kind == 'not':
+        return False
+    if kind == 'and':
+        return any(_requires_term(child) for child in node[1])
+    return all(_requires_term(child) for child in node[1])
+
+
+def _evaluate(node: tuple, line: str) -> bool:
+    kind = node[0]
+    if kind == 'lit':
+        return node[1] in line
+    if kind == 're':
+        return node[1].search(line) is not None
+    if kind == 'not':
+        return not _evaluate(node[1], line)
+    if kind == 'and':
+        return all(_evaluate(child, line) for child in node[1])
+    return any(_evaluate(child, line) for child in node[1])
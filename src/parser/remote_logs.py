@@ -1,46 +1,104 @@
+import os
+import json
+import queue
+import threading
+import time
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Optional
 
-def make_remote_call(data: dict) -> dict:
+from . import metrics
 
-    all_log_entries = {}
-    tasks = []
-    
-    base_host_list = data.keys()
-    
-    # Create a thread per host to connect to
-    with ThreadPoolExecutor() as executor:
-        for base_host in base_host_list:
-            data_per_host = data.get(base_host)
-            task = executor.submit(_make_remote_call_per_file, base_host, data_per_host, all_log_entries)
-            tasks.append(task)
-
-        # Wait for each file search task to complete
-        for task in tasks:
-            task.result()
-    return all_log_entries
-    
+# Connections are pooled and kept alive across requests, so fanning out to the same hosts
+# again does not pay for new TCP handshakes. The number of hosts called at the same time
+# is bounded by the number of workers, whatever the size of the payload.
+REMOTE_WORKERS = int(os.environ.get('REMOTE_WORKERS', 32))
+
+# Default per-host timeout and overall deadline of a fan-out, in milliseconds.
+DEFAULT_TIMEOUT_MS = int(os.environ.get('REMOTE_TIMEOUT_MS', 10000))
+DEFAULT_DEADLINE_MS = int(os.environ.get('REMOTE_DEADLINE_MS', 30000))
+
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_connections=REMOTE_WORKERS, pool_maxsize=REMOTE_WORKERS))
+_session.mount('https://', HTTPAdapter(pool_connections=REMOTE_WORKERS, pool_maxsize=REMOTE_WORKERS))
+
+_executor = ThreadPoolExecutor(max_workers=REMOTE_WORKERS, thread_name_prefix='remote')
+# Hedged requests run on their own workers so that they never wait behind the calls they hedge.
+_hedge_executor = ThreadPoolExecutor(max_workers=REMOTE_WORKERS, thread_name_prefix='remote-hedge')
+metrics.register_executor('remote', lambda: _executor)
+metrics.register_executor('remote-hedge', lambda: _hedge_executor)
 
-def _make_remote_call_per_file(base_host: str, data: dict, all_log_entries: dict) -> dict:
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Records buffered between the hosts and the client of a streamed call. When the client reads
+# slower than the hosts answer, the hosts wait instead of piling up records in memory.
+STREAM_BUFFER_RECORDS = 1024
+
+
+def make_remote_call(data: dict, deadline_ms: Optional[int] = None, timeout_ms: Optional[int] = None,
+                     hedge_ms: Optional[int] = None) -> dict:
     """
-    Constructs and sends an HTTP GET request to a remote host based on the action specified. 
-    The method supports several predefined actions, each corresponding to different URIs and query parameters.
-    It returns the JSON response from the remote host or an error message if the request fails.
+    Fans out the requests in the payload to every host in parallel, over a shared pool of
+    keep-alive connections. Hosts that do not answer within the deadline are reported as
+    timed out while the results of the other hosts are still returned.
 
     Parameters:
-    - data (dict): A dictionary containing the following keys:
-      - "host" (str): The base host for constructing the request URL.
-      - "action" (str): The action to perform, which must be one of the predefined actions (`parse`, `search`, `log`, `entries`).
-      - "file_name" (str, optional): The name of the file to parse.
-      - "entries" (str, optional): The number of entries to obtain from a specific file.
-      - "keyword" (str, optional): The keyword to search for in the logs directory.
+    - data (dict): The payload, with the host as the key and the action and its parameters as the value.
+    - deadline_ms (int, optional): The time budget of the whole fan-out in milliseconds.
+    - timeout_ms (int, optional): The connect and read timeout of each host in milliseconds.
+    - hedge_ms (int, optional): If a host has not answered after this many milliseconds, a second
+                                identical request is sent and whichever answers first is used.
 
     Returns:
-        - dict: The JSON response from the remote host if the request is successful.
-        - dict: An error message if the request fails or if the input data is invalid.
+        - dict: The result of each host keyed by its base URL. The `STATUS` key holds the status,
+                the latency in milliseconds and whether the request was hedged, for each host.
+    """
+    deadline = (deadline_ms or DEFAULT_DEADLINE_MS) / 1000
+    timeout = (timeout_ms or DEFAULT_TIMEOUT_MS) / 1000
+    hedge = hedge_ms / 1000 if hedge_ms else None
+
+    all_log_entries = {}
+    status = {}
+    tasks = {}
+
+    for base_host in data.keys():
+        data_per_host = data.get(base_host)
+        task = _executor.submit(_make_remote_call_per_file, base_host, data_per_host, timeout, hedge)
+        tasks[task] = _base_url(base_host)
+
+    # Wait for the hosts until the deadline, then report the ones that are still running.
+    # Only the finished calls are merged, so a late host cannot overwrite its timeout error.
+    done, not_done = wait(tasks, timeout=deadline)
+    for task in done:
+        base_url = tasks[task]
+        all_log_entries[base_url], status[base_url] = task.result()
+    for task in not_done:
+        # Calls still queued behind the workers are dropped, running ones finish on their own.
+        task.cancel()
+        base_url = tasks[task]
+        all_log_entries[base_url] = {"ERROR": f"Remote host ({base_url}) did not respond within {deadline_ms or DEFAULT_DEADLINE_MS} ms"}
+        status[base_url] = {"status": "timeout", "latency_ms": round(deadline * 1000, 3), "hedged": False}
+
+    all_log_entries["STATUS"] = status
+    return all_log_entries
+
+
+def _base_url(base_host: str) -> str:
+    if not base_host.startswith("http"):
+        base_host = "http://" + base_host
+    return base_host
+
+
+def _build_url(base_host: str, data: dict) -> tuple:
+    """
+    Builds the URL of the request for a host from the action in its payload.
+
+    Returns:
+        - tuple: The URL, or None if the payload is invalid, and the error for an invalid payload.
     """
     actions = {
-        "logs": { 
+        "logs": {
             "uri": "/logs",
             "query": ""
         },
@@ -58,42 +116,228 @@ def _make_remote_call_per_file(base_host: str, data: dict, all_log_entries: dict
         }
     }
 
-
-    if not base_host.startswith("http"):
-        base_host = "http://" + base_host
-    
     # Get possible data payload.
     action = data.get("action")
     file_name = data.get("file_name")
     entries = data.get("entries")
     keyword = data.get("keyword")
-    
-    url = None
-    if action in actions.keys():
-        uri = actions[action]["uri"]
-        query = actions[action]["query"]
-
-        # Build the URL to make the call
-        if entries and file_name:
-            url = base_host + uri + file_name + query + str(entries)
-        elif file_name:
-            url = base_host + uri + query + file_name
-        elif keyword:
-            url = base_host + uri + query + keyword
-        elif action == "logs":
-            url = base_host + uri
-        else:
-            result = {"ERROR": f"Invalid parameters for {action}."}
-        
-        if url:
-            res = requests.get(url)
+
+    if action not in actions.keys():
+        return None, {"ERROR": f"Unknown action {action}"}
+
+    uri = actions[action]["uri"]
+    query = actions[action]["query"]
+
+    # Build the URL to make the call
+    if entries and file_name:
+        return base_host + uri + file_name + query + str(entries), None
+    elif file_name:
+        return base_host + uri + query + file_name, None
+    elif keyword:
+        return base_host + uri + query + keyword, None
+    elif action == "logs":
+        return base_host + uri, None
+    return None, {"ERROR": f"Invalid parameters for {action}."}
+
+
+def _get(url: str, timeout: float, **kwargs) -> requests.Response:
+    return _session.get(url, timeout=timeout, **kwargs)
+
+
+def _make_remote_call_per_file(base_host: str, data: dict, timeout: Optional[float] = None,
+                               hedge: Optional[float] = None) -> tuple:
+    """
+    Constructs and sends an HTTP GET request to a remote host based on the action specified.
+    The method supports several predefined actions, each corresponding to different URIs and query parameters.
+    It returns the JSON response from the remote host, or an error message if the request fails.
+
+    Parameters:
+    - base_host (str): The base host for constructing the request URL.
+    - data (dict): A dictionary containing the following keys:
+      - "action" (str): The action to perform, which must be one of the predefined actions (`logs`, `search`, `log`, `entries`).
+      - "file_name" (str, optional): The name of the file to parse.
+      - "entries" (str, optional): The number of entries to obtain from a specific file.
+      - "keyword" (str, optional): The keyword to search for in the logs directory.
+    - timeout (float, optional): The connect and read timeout of the request in seconds.
+    - hedge (float, optional): The delay in seconds after which a second identical request is sent.
+
+    Returns:
+        - tuple: The result of the host, and the status of the call, its latency in milliseconds
+                 and whether it was hedged.
+    """
+    base_host = _base_url(base_host)
+    started = time.perf_counter()
+    call_status = {"status": "invalid", "latency_ms": 0.0, "hedged": False}
+
+    url, result = _build_url(base_host, data)
+    if url:
+        try:
+            res, call_status["hedged"] = _hedged_get(url, timeout or DEFAULT_TIMEOUT_MS / 1000, hedge)
+            call_status["status"] = res.status_code
 
             if res.status_code == 200:
                 result = res.json()
             else:
                 result = {"ERROR": f"Remote host ({base_host}) returned status {res.status_code}"}
+        except requests.Timeout:
+            call_status["status"] = "timeout"
+            result = {"ERROR": f"Remote host ({base_host}) timed out"}
+        except requests.RequestException as e:
+            call_status["status"] = "error"
+            result = {"ERROR": f"Remote host ({base_host}) could not be reached: {e}"}
+
+    elapsed = time.perf_counter() - started
+    call_status["latency_ms"] = round(elapsed * 1000, 3)
+    metrics.REMOTE_REQUEST_DURATION.observe(elapsed, (base_host, str(call_status["status"])))
+    return result, call_status
+
+
+def _hedged_get(url: str, timeout: float, hedge: Optional[float], **kwargs) -> tuple:
+    """
+    Sends a GET request and, if it has not completed after `hedge` seconds, a second identical
+    one. The response that arrives first is used and the other one is closed.
+
+    Returns:
+        - tuple: The response and whether a hedged request was sent.
+    """
+    if not hedge:
+        return _get(url, timeout, **kwargs), False
+
+    first = _hedge_executor.submit(_get, url, timeout, **kwargs)
+    done, _ = wait([first], timeout=hedge)
+    if done:
+        return first.result(), False
+
+    second = _hedge_executor.submit(_get, url, timeout, **kwargs)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return task.result(), True
+    # Both requests failed, report the error of the original one.
+    return first.result(), True
+
+
+def _close_response(task) -> None:
+    if task.exception() is None:
+        task.result().close()
+
+
+def iter_remote_call(data: dict, deadline_ms: Optional[int] = None, timeout_ms: Optional[int] = None,
+                     hedge_ms: Optional[int] = None) -> Iterator[dict]:
+    """
+    Fans out the requests in the payload to every host in parallel, like `make_remote_call`,
+    and yields the results as they arrive instead of waiting for the slowest host. Hosts that
+    stream NDJSON have their lines forwarded one by one, without holding their whole response.
+
+    Parameters:
+    - data (dict): The payload, with the host as the key and the action and its parameters as the value.
+    - deadline_ms (int, optional): The time budget of the whole fan-out in milliseconds.
+    - timeout_ms (int, optional): The connect and read timeout of each host in milliseconds.
+    - hedge_ms (int, optional): If a host has not answered after this many milliseconds, a second
+                                identical request is sent and whichever answers first is used.
+
+    Yields:
+        - dict: Records tagged with the `host` they come from, in the order they arrive:
+          - `{"host", "file", "line"}` for each line streamed by a host.
+          - `{"host", "result"}` for the JSON response of a host that does not stream.
+          - `{"host", "ERROR"}` if the call to a host failed or missed the deadline.
+          - `{"host", "STATUS"}` as the last record of each host, with its status, latency and hedging.
+    """
+    deadline_ms = deadline_ms or DEFAULT_DEADLINE_MS
+    deadline = time.monotonic() + deadline_ms / 1000
+    timeout = (timeout_ms or DEFAULT_TIMEOUT_MS) / 1000
+    hedge = hedge_ms / 1000 if hedge_ms else None
+
+    records = queue.Queue(maxsize=STREAM_BUFFER_RECORDS)
+    cancelled = threading.Event()
+    pending = {}
+    for base_host in data.keys():
+        base_url = _base_url(base_host)
+        pending[base_url] = _executor.submit(_stream_remote_call_per_file, base_url, data.get(base_host),
+                                             records, cancelled, timeout, hedge)
+
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                record = records.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if "STATUS" in record:
+                pending.pop(record["host"], None)
+            yield record
+
+        # Report the hosts that missed the deadline.
+        for base_url in pending:
+            yield {"host": base_url, "ERROR": f"Remote host ({base_url}) did not respond within {deadline_ms} ms"}
+            yield {"host": base_url, "STATUS": {"status": "timeout", "latency_ms": float(deadline_ms), "hedged": False}}
+    finally:
+        # Stop the hosts that are still streaming, also when the client went away.
+        cancelled.set()
+
+
+def _stream_remote_call_per_file(base_host: str, data: dict, records: queue.Queue, cancelled: threading.Event,
+                                 timeout: float, hedge: Optional[float]) -> None:
+    """
+    Sends the request for a single host of `iter_remote_call` and puts its records in the queue.
+    The remote host is asked for NDJSON, and if it streams, each line is forwarded as soon as it
+    is received.
+    """
+    started = time.perf_counter()
+    call_status = {"status": "invalid", "latency_ms": 0.0, "hedged": False}
+
+    def emit(record: dict) -> bool:
+        record["host"] = base_host
+        while not cancelled.is_set():
+            try:
+                records.put(record, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    url, error = _build_url(base_host, data)
+    if url:
+        try:
+            res, call_status["hedged"] = _hedged_get(url, timeout, hedge, stream=True,
+                                                     headers={"Accept": f"{NDJSON_MIMETYPE}, application/json;q=0.9"})
+            call_status["status"] = res.status_code
+            with res:
+                if res.status_code != 200:
+                    error = {"ERROR": f"Remote host ({base_host}) returned status {res.status_code}"}
+                elif res.headers.get("Content-Type", "").startswith(NDJSON_MIMETYPE):
+                    for line in res.iter_lines():
+                        if not line:
+                            continue
+                        record = json.loads(line)
+                        # Records are tagged with their host, which only an object can hold.
+                        if not isinstance(record, dict):
+                            call_status["status"] = "error"
+                            error = {"ERROR": f"Remote host ({base_host}) returned an invalid record"}
+                            break
+                        if not emit(record):
+                            return
+                elif not emit({"result": res.json()}):
+                    return
+        except requests.Timeout:
+            call_status["status"] = "timeout"
+            error = {"ERROR": f"Remote host ({base_host}) timed out"}
+        except json.JSONDecodeError:
+            call_status["status"] = "error"
+            error = {"ERROR": f"Remote host ({base_host}) returned an invalid response"}
+        except requests.RequestException as e:
+            call_status["status"] = "error"
+            error = {"ERROR": f"Remote host ({base_host}) could not be reached: {e}"}
 
-    else:
-        result = {"ERROR": f"Unknown action {action}"}
-    
-    all_log_entries[base_host] = result
+    if error and not emit(error):
+        return
+    elapsed = time.perf_counter() - started
+    call_status["latency_ms"] = round(elapsed * 1000, 3)
+    metrics.REMOTE_REQUEST_DURATION.observe(elapsed, (base_host, str(call_status["status"])))
+    emit({"STATUS": call_status})
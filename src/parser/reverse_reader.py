@@ -0,0 +1,102 @@
+import time
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from . import metrics
+
+# The first read from the end of a file is kept small so that tail reads of a
+# handful of entries stay cheap, and every following read doubles in size up to
+# the maximum so that full-file reads need only a few large syscalls.
+INITIAL_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def reverse_line_spans(f: BinaryIO, end: Optional[int] = None,
+                       start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Walks an open binary file backwards and yields every line together with the
+    byte offset where it starts, from the last line to the first.
+
+    Newline boundaries are found with `rfind` directly on each chunk that is read,
+    and only the bytes of a line are ever copied. A line that spans two chunks is
+    the only case where pieces are joined.
+
+    Parameters:
+      - f (BinaryIO): A file object opened in binary mode. Only `seek`, `tell` and `read` are used.
+      - end (int, optional): The offset of a line start to read backwards from, such as one
+                             previously yielded by this function. Defaults to the end of the file.
+      - start (int): The offset at which reading stops. Defaults to the beginning of the file.
+
+    Yields:
+      - tuple: The start offset of the line and its raw bytes, without the trailing newline.
+    """
+    f.seek(0, 2)
+    file_size = f.tell()
+    position = file_size if end is None else min(end, file_size)
+
+    # An explicit end offset is the start of a line that was already yielded, so the
+    # newline just before it terminates the line to yield first rather than an empty one.
+    if end is not None and position > start:
+        f.seek(position - 1)
+        if f.read(1) == b'\n':
+            position -= 1
+
+    chunk_size = INITIAL_CHUNK_SIZE
+    # Pieces of the line that begins before the current chunk, in reverse file order.
+    carry = []
+    # Lines yielded since the last chunk was recorded in the metrics.
+    n_lines = 0
+
+    try:
+        while position > start:
+            read_size = min(chunk_size, position - start)
+            position -= read_size
+            started = time.perf_counter()
+            f.seek(position)
+            chunk = f.read(read_size)
+            metrics.record_phase('read', time.perf_counter() - started)
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+            metrics.record_scan(len(chunk), n_lines)
+            n_lines = 0
+
+            line_end = len(chunk)
+            newline = chunk.rfind(b'\n', 0, line_end)
+            while newline != -1:
+                line = chunk[newline + 1:line_end]
+                if carry:
+                    carry.append(line)
+                    line = b''.join(reversed(carry))
+                    carry = []
+                n_lines += 1
+                yield position + newline + 1, line
+                line_end = newline
+                newline = chunk.rfind(b'\n', 0, line_end)
+
+            if line_end:
+                carry.append(chunk[:line_end])
+
+        if carry:
+            n_lines += 1
+            yield start, b''.join(reversed(carry))
+    finally:
+        metrics.record_scan(0, n_lines)
+
+
+def reverse_lines(f: BinaryIO, end: Optional[int] = None, start: int = 0,
+                  encoding: str = 'utf-8', errors: str = 'strict') -> Iterator[str]:
+    """
+    Walks an open binary file backwards and yields every line decoded to a string.
+    Lines are only decoded once they are yielded, so callers that stop early never
+    pay for decoding the rest of the file.
+
+    Parameters:
+      - f (BinaryIO): A file object opened in binary mode.
+      - end (int, optional): The offset to start reading backwards from. Defaults to the end of the file.
+      - start (int): The offset at which reading stops. Defaults to the beginning of the file.
+      - encoding (str): The encoding used to decode each line.
+      - errors (str): How decoding errors are handled, as accepted by `bytes.decode`.
+
+    Yields:
+      - str: Each line, starting from the last line and working backwards to the first.
+    """
+    for _, line in reverse_line_spans(f, end, start):
+        yield line.decode(encoding, errors)
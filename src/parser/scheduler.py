@@ -0,0 +1,235 @@
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional
+
+from . import metrics
+
+# Priorities of the requests waiting to be admitted, lowest first. Interactive requests, such as
+# reading the last entries of a file, are cheap and bounded. Scans read whole directories.
+INTERACTIVE = 0
+SCAN = 1
+PRIORITY_NAMES = ('interactive', 'scan')
+
+# Weight of the latest request in the moving average of the time requests hold a slot.
+SERVICE_TIME_WEIGHT = 0.2
+
+# Threads shared by all requests to read and search files, by default as many as a
+# `ThreadPoolExecutor` would start. A single request may only run `REQUEST_CONCURRENCY` tasks
+# at the same time, so that one directory scan cannot take every worker.
+IO_WORKERS = int(os.environ.get('IO_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+REQUEST_CONCURRENCY = int(os.environ.get('REQUEST_CONCURRENCY', max(2, IO_WORKERS // 2)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def io_pool() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool that reads and searches files for every request, creating it the
+    first time it is needed.
+
+    Returns:
+      - ThreadPoolExecutor: The shared thread pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
+        return _pool
+
+
+metrics.register_executor('io', lambda: _pool)
+
+
+def run_tasks(function: Callable, arguments: Iterable[tuple], quota: Optional[int] = None) -> List:
+    """
+    Runs a function once per set of arguments in the shared I/O pool, with at most `quota` of
+    them queued or running at a time. The next task is only submitted once one finishes, so
+    concurrent requests take turns on the workers instead of queueing all their files at once.
+    Tasks run in a copy of the current context, so that their reads are recorded for the request.
+
+    Parameters:
+      - function (Callable): The function to run.
+      - arguments (Iterable): The positional arguments of each call.
+      - quota (int, optional): Defaults to `REQUEST_CONCURRENCY`.
+
+    Returns:
+      - list: The result of each call, in the order of the arguments.
+
+    Raises:
+      - Exception: The first exception raised by a call. The calls not started yet are cancelled.
+    """
+    pool = io_pool()
+    arguments = iter(arguments)
+    results = {}
+    pending = {}
+
+    def submit() -> bool:
+        call = next(arguments, None)
+        if call is None:
+            return False
+        task = pool.submit(contextvars.copy_context().run, function, *call)
+        pending[task] = len(results) + len(pending)
+        return True
+
+    for _ in range(max(1, quota or REQUEST_CONCURRENCY)):
+        if not submit():
+            break
+
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                results[pending.pop(task)] = task.result()
+                submit()
+    finally:
+        for task in pending:
+            task.cancel()
+    return [results[index] for index in range(len(results))]
+
+
+class Ticket:
+    """
+    A request waiting for, or holding, one of the slots of the admission control.
+    """
+
+    __slots__ = ('priority', 'admitted', 'released', 'queued', 'started', '_event')
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.admitted = False
+        self.released = False
+        self.queued = time.monotonic()
+        self.started = self.queued
+        self._event = threading.Event()
+
+
+class Admission:
+    """
+    Admission control, which bounds the number of requests served at the same time. Requests
+    over that number wait in a bounded queue, interactive ones first, and are shed when the
+    queue is full or they waited too long, so that an overloaded server keeps its throughput
+    and answers quickly instead of letting latency grow without bound. Scans may not take the
+    slots reserved for interactive requests, which are admitted even while scans pile up.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, timeout: float, reserved: Optional[int] = None):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # At least one slot is left to scans, whatever is reserved.
+        self.reserved = min(max(1, max_active // 4) if reserved is None else reserved, max(0, max_active - 1))
+        self.service_time = 0.0
+        self._active = [0] * len(PRIORITY_NAMES)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_active > 0
+
+    def acquire(self, priority: int) -> Optional[Ticket]:
+        """
+        Waits for a slot to serve a request, up to the timeout.
+
+        Parameters:
+          - priority (int): `INTERACTIVE` or `SCAN`.
+
+        Returns:
+          - Ticket: The slot, to give back with `release` once the response was sent.
+          - None: If the request was shed because the server is saturated.
+        """
+        ticket = Ticket(priority)
+        name = PRIORITY_NAMES[priority]
+        with self._lock:
+            ahead = self._waiting and self._waiting[0][0] <= priority
+            if not ahead and self._can_admit(priority):
+                self._admit(ticket)
+                return ticket
+            if len(self._waiting) >= self.max_queue:
+                metrics.ADMISSION_REJECTED.inc(labels=(name, 'queue_full'))
+                return None
+            entry = (priority, next(self._sequence), ticket)
+            heapq.heappush(self._waiting, entry)
+            metrics.ADMISSION_QUEUED.inc(labels=(name,))
+
+        ticket._event.wait(self.timeout)
+        with self._lock:
+            if not ticket.admitted:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                metrics.ADMISSION_QUEUED.dec(labels=(name,))
+                metrics.ADMISSION_REJECTED.inc(labels=(name, 'timeout'))
+                return None
+        metrics.ADMISSION_WAIT.observe(ticket.started - ticket.queued, (name,))
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Gives back the slot of a request and admits the requests waiting for it. Releasing the
+        same ticket more than once has no effect.
+        """
+        with self._lock:
+            if ticket.released or not ticket.admitted:
+                return
+            ticket.released = True
+            self._active[ticket.priority] -= 1
+            held = time.monotonic() - ticket.started
+            self.service_time += SERVICE_TIME_WEIGHT * (held - self.service_time)
+
+            while self._waiting and self._can_admit(self._waiting[0][0]):
+                _, _, waiting = heapq.heappop(self._waiting)
+                metrics.ADMISSION_QUEUED.dec(labels=(PRIORITY_NAMES[waiting.priority],))
+                self._admit(waiting)
+                waiting._event.set()
+
+    def retry_after(self) -> int:
+        """
+        Estimates how long a shed request should wait before it is retried, from the time
+        requests hold a slot and the number of requests waiting for one.
+
+        Returns:
+          - int: The delay in seconds, at least 1.
+        """
+        with self._lock:
+            waiting = len(self._waiting)
+        return max(1, math.ceil(self.service_time * (waiting + 1) / max(1, self.max_active)))
+
+    def stats(self) -> dict:
+        """
+        Returns the number of requests being served and waiting, by priority.
+
+        Returns:
+          - dict: The `active` and `waiting` requests of each priority.
+        """
+        with self._lock:
+            waiting = [0] * len(PRIORITY_NAMES)
+            for priority, _, _ in self._waiting:
+                waiting[priority] += 1
+            return {
+                "active": dict(zip(PRIORITY_NAMES, self._active)),
+                "waiting": dict(zip(PRIORITY_NAMES, waiting)),
+            }
+
+    def _can_admit(self, priority: int) -> bool:
+        if sum(self._active) >= self.max_active:
+            return False
+        return priority == INTERACTIVE or self._active[SCAN] < self.max_active - self.reserved
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted = True
+        ticket.started = time.monotonic()
+        self._active[ticket.priority] += 1
+
+
+admission = Admission(int(os.environ.get('ADMISSION_MAX_ACTIVE', 4 * (os.cpu_count() or 1) + 4)),
+                      int(os.environ.get('ADMISSION_QUEUE', 64)),
+                      int(os.environ.get('ADMISSION_TIMEOUT_MS', 10000)) / 1000,
+                      int(os.environ['ADMISSION_RESERVED']) if os.environ.get('ADMISSION_RESERVED') else None)
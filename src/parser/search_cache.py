@@ -0,0 +1,304 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from . import metrics, shared_store
+from .byte_search import decode_errors, iter_matching_lines, matcher_for
+from .log_readers import compression_of, record_compressed_scan, run_decompression, search_compressed
+from .parallel_scan import parallel_search_file, parallel_threshold
+
+# Rough per-line cost of a cached match on top of its characters, as in the tail cache.
+LINE_OVERHEAD = 57
+
+# Bytes right before the evaluated offset that are kept with a file, to recognize a file that
+# was truncated and then grew back past that offset before the query was repeated.
+CHECK_BYTES = 64
+
+# Bytes read at a time while looking for the end of the last complete line of a file.
+BACKWARD_BLOCK_SIZE = 64 * 1024
+
+QueryKey = Tuple[str, Optional[str], Optional[str], bool, str]
+
+
+class FileMatches:
+    """
+    The matches of a query in a single file, up to the offset where its evaluation stopped.
+    For plain files, that is the end of the last complete line when the file was searched,
+    so the next search only has to look at the bytes appended after it. Compressed files are
+    searched whole, and their matches are valid as long as the file does not change.
+    """
+
+    __slots__ = ('inode', 'size', 'mtime', 'offset', 'check', 'matches', 'cost')
+
+    def __init__(self, inode: int, size: int, mtime: float, offset: int, check: bytes,
+                 matches: List[str], cost: int):
+        self.inode = inode
+        self.size = size
+        self.mtime = mtime
+        self.offset = offset
+        self.check = check
+        self.matches = matches
+        # The approximate memory used by the matches.
+        self.cost = cost
+
+    def to_list(self) -> list:
+        return [self.inode, self.size, self.mtime, self.offset, self.check.hex(), self.matches, self.cost]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'FileMatches':
+        inode, size, mtime, offset, check, matches, cost = values
+        return cls(inode, size, mtime, offset, bytes.fromhex(check), matches, cost)
+
+
+def _cost(matches: List[str]) -> int:
+    return sum(len(line) for line in matches) + LINE_OVERHEAD * len(matches)
+
+
+class SearchCache:
+    """
+    In-process LRU cache of the results of directory searches, bounded by an approximate
+    memory budget. Entries are keyed by the query and hold the matches of every file along
+    with the offset up to which the query was evaluated. Repeating a query only searches the
+    bytes appended to each file since then. A file whose inode changed (it was rotated) or that
+    no longer has the same bytes before that offset (it was truncated) is searched again from
+    the start.
+
+    When the caches are shared, the results are kept in the store shared by the worker processes
+    instead, within the same budget, so that a search repeated on another worker continues from
+    where this one stopped.
+    """
+
+    def __init__(self, max_bytes: int, shared: Optional[bool] = None):
+        self.max_bytes = max_bytes
+        self._shared = shared
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self._entries: 'OrderedDict[QueryKey, Tuple[Dict[str, FileMatches], int]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def shared(self) -> bool:
+        """Whether the results are kept in the shared store, as set by `SHARED_CACHE` unless given."""
+        return shared_store.is_enabled() if self._shared is None else self._shared
+
+    @staticmethod
+    def key(log_directory: str, keyword: str, query=None) -> QueryKey:
+        """
+        Returns the key of the results of a search, which includes the decoding policy since
+        it changes the matching lines.
+        """
+        if query is not None:
+            return log_directory, None, query.text, query.regex, decode_errors()
+        return log_directory, keyword, None, False, decode_errors()
+
+    def lookup(self, key: QueryKey) -> Dict[str, FileMatches]:
+        """
+        Returns the cached matches of each file for a query.
+
+        Returns:
+          - dict: The matches of each file keyed by path, empty if the query is not cached.
+        """
+        if self.shared:
+            return self._load(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {}
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def store(self, key: QueryKey, files: Dict[str, FileMatches],
+              previous: Optional[Dict[str, FileMatches]] = None) -> None:
+        """
+        Caches the matches of each file for a query and evicts the least recently used
+        queries until the cache fits its budget. With the `previous` matches the query was
+        searched from, nothing is written to the shared store if no file changed since.
+        """
+        cost = sum(matches.cost for matches in files.values())
+        if cost > self.max_bytes:
+            return
+        if self.shared:
+            if previous is None or not _same_files(files, previous):
+                self._save(key, files, cost)
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (files, cost)
+            self._size += cost
+
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def search_file(self, file_path: str, keyword: str, query=None,
+                    previous: Optional[FileMatches] = None) -> Tuple[FileMatches, List[str]]:
+        """
+        Searches a file for a query, starting from where the previous search of the same query
+        stopped when the file only grew since then.
+
+        Parameters:
+          - file_path (str): The path to the file to search.
+          - keyword (str): The keyword to search for.
+          - query (Query, optional): A compiled query to match lines with instead of the keyword.
+          - previous (FileMatches, optional): The cached matches of the file for the query.
+
+        Returns:
+          - tuple: The matches to cache for the file, and the matches in its last line if that
+                   line is not complete yet. These are not cached, since the line may still grow.
+
+        Raises:
+          - OSError: If the file cannot be read.
+        """
+        if compression_of(file_path):
+            return self._search_compressed(file_path, keyword, query, previous), []
+
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            start, matches = 0, []
+            if previous is not None and _continues(f, stat, previous):
+                start, matches = previous.offset, previous.matches
+
+            end = _last_line_end(f, start, stat.st_size)
+            if start == 0:
+                self._count('misses')
+            else:
+                self._count('hits' if end == start else 'extensions')
+
+            found = _search_range(file_path, f, keyword, query, start, end)
+            tail = _search_range(file_path, f, keyword, query, end, stat.st_size)
+            if query is not None:
+                query.record(stat.st_size - start)
+
+            f.seek(max(0, end - CHECK_BYTES))
+            check = f.read(end - max(0, end - CHECK_BYTES))
+
+        cost = (previous.cost if start > 0 else 0) + _cost(found)
+        return FileMatches(stat.st_ino, stat.st_size, stat.st_mtime, end, check,
+                           matches + found if found else matches, cost), tail
+
+    def _search_compressed(self, file_path: str, keyword: str, query,
+                           previous: Optional[FileMatches]) -> FileMatches:
+        stat = os.stat(file_path)
+        if (previous is not None and previous.inode == stat.st_ino and previous.size == stat.st_size
+                and previous.mtime == stat.st_mtime):
+            self._count('hits')
+            return previous
+
+        self._count('misses')
+        if query is not None:
+            query.record(stat.st_size)
+        started = time.perf_counter()
+        found = run_decompression(search_compressed, file_path, keyword, query)
+        record_compressed_scan(file_path, len(found), time.perf_counter() - started)
+        return FileMatches(stat.st_ino, stat.st_size, stat.st_mtime, stat.st_size, b'', found, _cost(found))
+
+    def _load(self, key: QueryKey) -> Dict[str, FileMatches]:
+        try:
+            stored = shared_store.load_search_results(json.dumps(key))
+        except sqlite3.Error as e:
+            print(f"Error loading shared search results: {e}")
+            return {}
+        if stored is None:
+            return {}
+        return {file_path: FileMatches.from_list(values) for file_path, values in json.loads(stored).items()}
+
+    def _save(self, key: QueryKey, files: Dict[str, FileMatches], cost: int) -> None:
+        stored = json.dumps({file_path: matches.to_list() for file_path, matches in files.items()})
+        try:
+            shared_store.save_search_results(json.dumps(key), stored, cost, self.max_bytes)
+        except sqlite3.Error as e:
+            print(f"Error storing shared search results: {e}")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit, miss and extension counters of the cache, counted per file, and its current size.
+
+        Returns:
+          - dict: The counters, the number of cached queries and the approximate bytes used.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "extensions": self.extensions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def _same_files(files: Dict[str, FileMatches], previous: Dict[str, FileMatches]) -> bool:
+    """
+    Checks whether the matches of every file were evaluated up to the same offset as before.
+    """
+    return files.keys() == previous.keys() and all(
+        (matches.inode, matches.offset) == (previous[file_path].inode, previous[file_path].offset)
+        for file_path, matches in files.items()
+    )
+
+
+def _continues(f: BinaryIO, stat: os.stat_result, previous: FileMatches) -> bool:
+    """
+    Checks whether a file is the one that was searched before, and still has the same bytes
+    right before the offset where the search stopped, so that only what comes after is new.
+    """
+    if previous.inode != stat.st_ino or stat.st_size < previous.offset:
+        return False
+    f.seek(previous.offset - len(previous.check))
+    return f.read(len(previous.check)) == previous.check
+
+
+def _last_line_end(f: BinaryIO, start: int, size: int) -> int:
+    """
+    Returns the offset right after the last newline of a file between `start` and `size`,
+    or `start` if there is none.
+    """
+    position = size
+    while position > start:
+        block_start = max(start, position - BACKWARD_BLOCK_SIZE)
+        f.seek(block_start)
+        newline = f.read(position - block_start).rfind(b'\n')
+        if newline != -1:
+            return block_start + newline + 1
+        position = block_start
+    return start
+
+
+def _search_range(file_path: str, f: BinaryIO, keyword: str, query, start: int, end: int) -> List[str]:
+    """
+    Searches the lines between two offsets of an open file, in parallel worker processes
+    when the range is big enough.
+    """
+    if end <= start:
+        return []
+    if end - start >= parallel_threshold():
+        return parallel_search_file(file_path, keyword, query, start=start, end=end)
+    finder, predicate = matcher_for(keyword, query)
+    f.seek(start)
+    return list(iter_matching_lines(f, finder, limit=end - start, predicate=predicate))
+
+
+search_cache = SearchCache(int(os.environ.get('SEARCH_CACHE_BYTES', 64 * 1024 * 1024)))
+metrics.register_cache('search', search_cache.stats)
@@ -0,0 +1,402 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from . import metrics
+from .log_readers import compression_of
+from .file_catalog import catalog_for
+from .shared_store import cache_directory
+
+# Tokens are runs of ASCII letters, digits and underscores. Any such run inside a keyword
+# is contained in a run of the line it matches, which is what lets the index narrow a
+# substring search down to candidate lines without changing its results.
+TOKEN_PATTERN = re.compile(rb'[A-Za-z0-9_]+')
+
+# How a token of a keyword must appear in the tokens of a matching line. A run of the keyword
+# that is cut off by other characters on both sides is a whole token of the line, one cut off
+# only after its end ends a token, one cut off only before its start begins one, and one that
+# is the whole keyword can be anywhere in a token.
+WHOLE, SUFFIX, PREFIX, SUBSTRING = 'whole', 'suffix', 'prefix', 'substring'
+
+# Tokens sort below this character, so `token >= t AND token < t || TOKEN_END` is a range of
+# the unique index on tokens that holds every token starting with `t`.
+TOKEN_END = '\x7f'
+
+# Version of the schema, stored as `PRAGMA user_version`, which is upgraded in place.
+SCHEMA_VERSION = 1
+
+# Bytes read per batch while indexing, so that postings are written in bounded transactions.
+INDEX_BATCH_SIZE = 4 * 1024 * 1024
+
+# Bytes appended after the indexed part of a file that are scanned directly at search time.
+# Anything bigger means the index is not fresh for that file and the search falls back to scanning.
+MAX_UNINDEXED_TAIL = 1024 * 1024
+
+_local = threading.local()
+_indexer = None
+_indexer_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """
+    Checks whether the search index is turned on through the `SEARCH_INDEX` environment variable.
+
+    Returns:
+      - bool: True if `SEARCH_INDEX` is set to `1`.
+    """
+    return os.environ.get('SEARCH_INDEX', '0') == '1'
+
+
+def _connection() -> sqlite3.Connection:
+    """
+    Returns the connection to the index database for the current thread, creating the
+    database and its schema the first time it is used.
+    """
+    path = os.path.join(cache_directory(), 'search_index.sqlite3')
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and getattr(_local, 'path', None) == path:
+        return connection
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            indexed_offset INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tokens (
+            id INTEGER PRIMARY KEY,
+            token TEXT UNIQUE NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            token_id INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS postings_lookup ON postings (token_id, file_id);
+        CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id);
+        CREATE TABLE IF NOT EXISTS token_trigrams (
+            trigram TEXT NOT NULL,
+            token_id INTEGER NOT NULL,
+            PRIMARY KEY (trigram, token_id)
+        ) WITHOUT ROWID;
+    ''')
+    if connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        # Indexes built before the trigrams were added get the trigrams of their tokens.
+        with connection:
+            for token_id, token in connection.execute('SELECT id, token FROM tokens').fetchall():
+                _add_trigrams(connection, token_id, token)
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    _local.connection = connection
+    _local.path = path
+    return connection
+
+
+def _indexable_tokens(data: bytes) -> set:
+    """
+    Returns the tokens worth indexing in a line or keyword. Single characters and plain
+    numbers are left out because they match almost every line and would bloat the index.
+    """
+    return {token for token in TOKEN_PATTERN.findall(data) if len(token) > 1 and not token.isdigit()}
+
+
+def _keyword_tokens(keyword: bytes) -> set:
+    """
+    Returns the indexable tokens of a keyword, each with how it must appear in a matching
+    line: `WHOLE`, `SUFFIX`, `PREFIX` or `SUBSTRING`.
+    """
+    tokens = set()
+    for match in TOKEN_PATTERN.finditer(keyword):
+        token = match.group()
+        if len(token) < 2 or token.isdigit():
+            continue
+        cut_before, cut_after = match.start() > 0, match.end() < len(keyword)
+        if cut_before and cut_after:
+            kind = WHOLE
+        elif cut_after:
+            kind = SUFFIX
+        elif cut_before:
+            kind = PREFIX
+        else:
+            kind = SUBSTRING
+        tokens.add((token.decode('ascii'), kind))
+    return tokens
+
+
+def _trigrams(token: str) -> set:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _add_trigrams(connection: sqlite3.Connection, token_id: int, token: str) -> None:
+    connection.executemany(
+        'INSERT OR IGNORE INTO token_trigrams (trigram, token_id) VALUES (?, ?)',
+        ((trigram, token_id) for trigram in _trigrams(token))
+    )
+
+
+def _matching_token_ids(connection: sqlite3.Connection, token: str, kind: str) -> List[int]:
+    """
+    Returns the ids of the indexed tokens that a keyword token can appear in. Whole tokens and
+    prefixes are looked up in the unique index on tokens. Suffixes and substrings are looked up
+    through the trigrams of the tokens, and only the tokens that have all the trigrams of the
+    keyword token are checked. A keyword token too short to have a trigram falls back to
+    checking every distinct token, which is still far fewer than the postings of a file.
+    """
+    if kind == WHOLE:
+        return [token_id for (token_id,) in connection.execute('SELECT id FROM tokens WHERE token = ?', (token,))]
+    if kind == PREFIX:
+        return [token_id for (token_id,) in connection.execute(
+            'SELECT id FROM tokens WHERE token >= ? AND token < ?', (token, token + TOKEN_END)
+        )]
+
+    trigrams = sorted(_trigrams(token))
+    if trigrams:
+        query = ' INTERSECT '.join(['SELECT token_id FROM token_trigrams WHERE trigram = ?'] * len(trigrams))
+        candidates = connection.execute(
+            f'SELECT id, token FROM tokens WHERE id IN ({query})', trigrams
+        ).fetchall()
+    else:
+        candidates = connection.execute('SELECT id, token FROM tokens').fetchall()
+    if kind == SUFFIX:
+        return [token_id for token_id, text in candidates if text.endswith(token)]
+    return [token_id for token_id, text in candidates if token in text]
+
+
+def update_file(file_path: str) -> None:
+    """
+    Brings the index up to date for a single file. Only the bytes appended since the last
+    update are indexed, unless the file was rotated (different inode) or truncated, in which
+    case its postings are dropped and the whole file is indexed again.
+
+    Parameters:
+      - file_path (str): The path to the file to index.
+    """
+    stat = os.stat(file_path)
+    connection = _connection()
+    row = connection.execute(
+        'SELECT id, inode, size, mtime, indexed_offset FROM files WHERE path = ?', (file_path,)
+    ).fetchone()
+
+    if row and (row[1], row[2], row[3]) == (stat.st_ino, stat.st_size, stat.st_mtime):
+        return
+
+    with connection:
+        if row and row[1] == stat.st_ino and stat.st_size >= row[2]:
+            file_id, offset = row[0], row[4]
+        elif row:
+            file_id, offset = row[0], 0
+            connection.execute('DELETE FROM postings WHERE file_id = ?', (file_id,))
+            connection.execute(
+                'UPDATE files SET inode = ?, size = 0, mtime = 0, indexed_offset = 0 WHERE id = ?',
+                (stat.st_ino, file_id)
+            )
+        else:
+            file_id = connection.execute(
+                'INSERT INTO files (path, inode, size, mtime, indexed_offset) VALUES (?, ?, 0, 0, 0)',
+                (file_path, stat.st_ino)
+            ).lastrowid
+            offset = 0
+
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        pending = b''
+        while True:
+            data = f.read(INDEX_BATCH_SIZE)
+            if not data:
+                break
+            data = pending + data
+            # Only whole lines are indexed, the unterminated tail waits for the next update.
+            last_newline = data.rfind(b'\n')
+            if last_newline == -1:
+                pending = data
+                continue
+            pending = data[last_newline + 1:]
+            # Postings and the indexed offset are committed together, so searches never
+            # see a line both in the index and in the unindexed tail.
+            with connection:
+                _index_lines(connection, file_id, offset, data[:last_newline + 1])
+                offset += last_newline + 1
+                connection.execute('UPDATE files SET indexed_offset = ? WHERE id = ?', (offset, file_id))
+
+    with connection:
+        connection.execute(
+            'UPDATE files SET inode = ?, size = ?, mtime = ?, indexed_offset = ? WHERE id = ?',
+            (stat.st_ino, stat.st_size, stat.st_mtime, offset, file_id)
+        )
+
+
+def _index_lines(connection: sqlite3.Connection, file_id: int, base_offset: int, data: bytes) -> None:
+    """
+    Adds the postings for a block of complete lines that starts at `base_offset` in the file.
+    The caller is responsible for committing the transaction.
+    """
+    token_ids = {}
+    postings = []
+    line_start = 0
+    for line in data.split(b'\n')[:-1]:
+        for token in _indexable_tokens(line):
+            postings.append((token, base_offset + line_start))
+            token_ids[token] = None
+        line_start += len(line) + 1
+
+    for token in token_ids:
+        text = token.decode('ascii')
+        inserted = connection.execute('INSERT OR IGNORE INTO tokens (token) VALUES (?)', (text,))
+        token_ids[token] = connection.execute('SELECT id FROM tokens WHERE token = ?', (text,)).fetchone()[0]
+        if inserted.rowcount:
+            _add_trigrams(connection, token_ids[token], text)
+    connection.executemany(
+        'INSERT INTO postings (token_id, file_id, offset) VALUES (?, ?, ?)',
+        ((token_ids[token], file_id, offset) for token, offset in postings)
+    )
+
+
+def update_directory(log_directory: str) -> None:
+    """
+    Brings the index up to date for every file in a directory, and drops the postings of
+    files that no longer exist.
+
+    Parameters:
+      - log_directory (str): The directory to index.
+    """
+    seen = set()
+    for file_path in catalog_for(log_directory).log_files():
+        # Compressed rotations are searched by decompressing them, they are not indexed.
+        if compression_of(file_path):
+            continue
+        seen.add(file_path)
+        try:
+            update_file(file_path)
+        except Exception as e:
+            print(f"Error indexing {file_path}: {e}")
+
+    connection = _connection()
+    with connection:
+        for file_id, path in connection.execute('SELECT id, path FROM files').fetchall():
+            if path.startswith(log_directory) and path not in seen:
+                connection.execute('DELETE FROM postings WHERE file_id = ?', (file_id,))
+                connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+
+def search_file(file_path: str, keyword: str) -> Optional[List[str]]:
+    """
+    Searches a single file for a keyword using the index. Candidate lines are the ones whose
+    tokens contain every token of the keyword, and each candidate is then read and checked
+    with the same `keyword in line` test as a full scan. The tokens of the index that can
+    hold a keyword token are found first, and only their postings in this file are read.
+    Bytes appended since the last index update are scanned directly.
+
+    Parameters:
+      - file_path (str): The path to the file to search.
+      - keyword (str): The keyword to search for.
+
+    Returns:
+      - list: The matching lines, in file order.
+      - None: If the index cannot answer the query for this file and the file must be scanned instead.
+    """
+    keyword_tokens = _keyword_tokens(keyword.encode('utf-8'))
+    if not keyword_tokens:
+        return None
+
+    stat = os.stat(file_path)
+    connection = _connection()
+    row = connection.execute(
+        'SELECT id, inode, size, indexed_offset FROM files WHERE path = ?', (file_path,)
+    ).fetchone()
+    if (not row or row[1] != stat.st_ino or stat.st_size < row[2]
+            or stat.st_size - row[3] > MAX_UNINDEXED_TAIL):
+        return None
+    file_id, indexed_offset = row[0], row[3]
+
+    candidates = None
+    # Whole tokens select the fewest lines and are the cheapest to look up, so they go first.
+    order = (WHOLE, PREFIX, SUFFIX, SUBSTRING)
+    for token, kind in sorted(keyword_tokens, key=lambda pair: (order.index(pair[1]), -len(pair[0]))):
+        offsets = set()
+        for token_id in _matching_token_ids(connection, token, kind):
+            offsets.update(offset for (offset,) in connection.execute(
+                'SELECT offset FROM postings WHERE token_id = ? AND file_id = ?', (token_id, file_id)
+            ))
+        candidates = offsets if candidates is None else candidates & offsets
+        if not candidates:
+            break
+
+    found = []
+    n_bytes = n_lines = 0
+    started = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        metrics.record_open()
+        for offset in sorted(candidates or ()):
+            f.seek(offset)
+            raw = f.readline()
+            n_bytes += len(raw)
+            n_lines += 1
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if keyword in line:
+                found.append(line)
+
+        f.seek(indexed_offset)
+        for raw in f:
+            n_bytes += len(raw)
+            n_lines += 1
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if keyword in line:
+                found.append(line)
+    metrics.record_scan(n_bytes, n_lines)
+    metrics.record_phase('read', time.perf_counter() - started)
+    return found
+
+
+class BackgroundIndexer(threading.Thread):
+    """
+    Daemon thread that keeps the index up to date by re-indexing the log directory
+    at a fixed interval. Only appended bytes are indexed on each pass.
+    """
+
+    def __init__(self, log_directory: str, interval: float):
+        super().__init__(name='search-indexer', daemon=True)
+        self.log_directory = log_directory
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                update_directory(self.log_directory)
+            except Exception as e:
+                print(f"Error updating the search index: {e}")
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def start_background_indexer() -> Optional[BackgroundIndexer]:
+    """
+    Starts the background indexer for the log directory if the index is enabled.
+    The interval between passes is set in seconds through `SEARCH_INDEX_INTERVAL`.
+
+    Returns:
+      - BackgroundIndexer: The running indexer.
+      - None: If the index is not enabled.
+    """
+    global _indexer
+    if not is_enabled():
+        return None
+
+    with _indexer_lock:
+        if _indexer is None or not _indexer.is_alive():
+            log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+            interval = float(os.environ.get('SEARCH_INDEX_INTERVAL', '30'))
+            _indexer = BackgroundIndexer(log_directory, interval)
+            _indexer.start()
+    return _indexer
@@ -1,7 +1,23 @@
 import os
-from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Iterator, List, Optional, Tuple
 
-def search_in_file(file_path: str, keyword: str, results: dict) -> None:
+from . import metrics, search_index
+from .byte_search import decode_errors, decode_line, iter_matching_lines, matcher_for
+from .cursors import decode_cursor, encode_cursor
+from .fields import FieldFilter, field_cache, select_compressed
+from .file_catalog import catalog_for
+from .log_readers import (compression_of, iter_reverse_lines, record_compressed_scan, run_decompression,
+                          search_compressed)
+from .parallel_scan import parallel_search_file, parallel_threshold
+from .query import Query
+from .reverse_reader import reverse_line_spans
+from .scheduler import run_tasks
+from .search_cache import search_cache
+from .timestamps import time_window
+
+def search_in_file(file_path: str, keyword: str, results: dict, query: Optional[Query] = None, 
+                   since: Optional[float] = None, until: Optional[float] = None) -> None:
     """
     Searches for a specific keyword in a given file and stores the lines containing the keyword in a shared results dictionary.
 
@@ -10,23 +26,79 @@ def search_in_file(file_path: str, keyword: str, results: dict) -> None:
     - keyword (str): The keyword to search for within the file.
     - results (dict): A dictionary to store the search results. The file path is used as the key,
                       and the value is a list of lines where the keyword was found.
+    - query (Query, optional): A compiled query to match lines with instead of the keyword.
+    - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+    - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+
+    With `since` or `until`, the time window is found with a binary search over the file and 
+    only that byte range is searched. When the search index is enabled and fresh for the file, the index is used instead of 
+    scanning the whole file. Compressed files are decompressed and searched in a worker process, 
+    and files bigger than the parallel scan threshold are split into byte ranges that are 
+    searched in parallel worker processes.
 
     """
     
     found_in_file = []
     
     try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                if keyword in line:
-                    found_in_file.append(line.strip('\n'))
+        if query is not None:
+            query.record(os.path.getsize(file_path))
+
+        if compression_of(file_path):
+            started = time.perf_counter()
+            found_in_file = run_decompression(search_compressed, file_path, keyword, query, since, until)
+            record_compressed_scan(file_path, len(found_in_file), time.perf_counter() - started)
+            if found_in_file:
+                results[file_path] = found_in_file
+            return
+
+        windowed = since is not None or until is not None
+        if search_index.is_enabled() and query is None and not windowed:
+            found_in_file = search_index.search_file(file_path, keyword)
+            if found_in_file is not None:
+                if found_in_file:
+                    results[file_path] = found_in_file
+                return
+            found_in_file = []
+
+        start, end = 0, None
+        if windowed:
+            with open(file_path, 'rb') as file:
+                metrics.record_open()
+                start, end = time_window(file, since, until)
+
+        if _is_large_file(file_path, start, end):
+            found_in_file = parallel_search_file(file_path, keyword, query, start=start, end=end)
+            if found_in_file:
+                results[file_path] = found_in_file
+            return
+
+        finder, predicate = matcher_for(keyword, query)
+        with open(file_path, 'rb') as file:
+            metrics.record_open()
+            file.seek(start)
+            limit = None if end is None else end - start
+            found_in_file = list(iter_matching_lines(file, finder, limit=limit, predicate=predicate))
             if found_in_file:
                 results[file_path] = found_in_file
 
     except Exception as e:
+        metrics.READ_ERRORS.inc(labels=('search',))
         print(f"Error reading {file_path}: {e}")
 
-def search_directory(keyword: str) -> dict:
+def _is_large_file(file_path: str, start: int = 0, end: Optional[int] = None) -> bool:
+    """
+    Checks whether a file, or the byte range of it to search, is big enough to be searched in 
+    parallel across worker processes. Files that cannot be checked are searched the normal way, 
+    which reports the error.
+    """
+    try:
+        return (os.path.getsize(file_path) if end is None else end) - start >= parallel_threshold()
+    except OSError:
+        return False
+
+def search_directory(keyword: str, query: Optional[Query] = None, since: Optional[float] = None, 
+                     until: Optional[float] = None) -> dict:
     """
     Searches for a specific keyword in all log files within a specified directory. 
     By default, the directory is set to `/var/log`, but this can be overridden using 
@@ -34,32 +106,418 @@ def search_directory(keyword: str) -> dict:
 
     This method uses multi-threading to concurrently search through multiple files, 
     improving the efficiency of the search process. 
-    Each file is processed in a separate thread, and the results are collected in a shared dictionary.
+    The files are processed in the I/O pool shared by all requests, a few at a time, and the results 
+    are collected in a shared dictionary.
+    Searches without a time window go through the search cache, so repeating one only scans 
+    the bytes appended to the files since the last time.
 
     Parameters:
         - keyword (str): The keyword to search for within the log files.
+        - query (Query, optional): A compiled query to match lines with instead of the keyword.
+        - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+        - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
 
     Returns:
         - dict: A dictionary containing file paths as keys and lists of lines where the keyword was found as values.
         - dict: An error message if the keyword is not found.
     """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    # The search index, when enabled, already answers repeated searches without scanning the files.
+    if since is None and until is None and search_cache.enabled and not search_index.is_enabled():
+        results = _search_directory_cached(log_directory, keyword, query)
+    else:
+        results = _search_directory(log_directory, keyword, query, since, until)
+
+    if results:
+        return results
+    else:
+        return {"ERROR": f"Keyword '{keyword}' was not found in any file in the {log_directory} directory."}
+
+def _search_directory(log_directory: str, keyword: str, query: Optional[Query], since: Optional[float], 
+                      until: Optional[float]) -> dict:
+    """
+    Searches the log files of the directory concurrently in the shared I/O pool, without the search cache.
+    """
     results = {}
-    tasks = []
+
+    # Search the files in the shared I/O pool, a few at a time
+    run_tasks(search_in_file, ((file_path, keyword, results, query, since, until) 
+                               for file_path in catalog_for(log_directory).log_files()))
+    return results
+
+def _search_directory_cached(log_directory: str, keyword: str, query: Optional[Query]) -> dict:
+    """
+    Searches the log files of the directory concurrently in the shared I/O pool through the search cache, 
+    so that a repeated search only scans the bytes appended to each file since the last one. 
+    Files that cannot be searched through the cache are searched the normal way, which reports the error.
+    """
+    key = search_cache.key(log_directory, keyword, query)
+    previous = search_cache.lookup(key)
+    files = {}
+    results = {}
+
+    def search_file(file_path: str) -> None:
+        try:
+            matches, tail = search_cache.search_file(file_path, keyword, query, previous.get(file_path))
+        except Exception:
+            search_in_file(file_path, keyword, results, query)
+            return
+        files[file_path] = matches
+        found_in_file = matches.matches + tail if tail else matches.matches
+        if found_in_file:
+            results[file_path] = found_in_file
+
+    run_tasks(search_file, ((file_path,) for file_path in catalog_for(log_directory).log_files()))
+
+    search_cache.store(key, files, previous)
+    return results
+
+def search_fields(filters: List[FieldFilter], keyword: Optional[str] = None, query: Optional[Query] = None,
+                  since: Optional[float] = None, until: Optional[float] = None) -> dict:
+    """
+    Searches all log files within the log directory for the lines whose fields pass the filters,
+    such as `level=ERROR` and `service=auth`. The fields of each file are parsed once into
+    column-oriented batches that are kept in the field cache, so the filters run as comparisons
+    over whole columns, and repeating a search only parses the lines appended since the last one.
+    Compressed files are decompressed and parsed every time.
+
+    Parameters:
+        - filters (list): The field filters, as returned by `field_filters`.
+        - keyword (str, optional): A keyword the lines must also contain.
+        - query (Query, optional): A compiled query the lines must also match, instead of the keyword.
+        - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+        - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+
+    Returns:
+        - dict: A dictionary containing file paths as keys and lists of matching lines, in file order, as values.
+        - dict: An error message if no line matches.
+    """
     log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    results = {}
 
-    # Create a thread per file to search
-    with ThreadPoolExecutor() as executor:
-        for root, _, files in os.walk(log_directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                task = executor.submit(search_in_file, file_path, keyword, results)
-                tasks.append(task)
-
-        # Wait for each file search task to complete
-        for task in tasks:
-            task.result()
-    
+    # Search the files in the shared I/O pool, a few at a time
+    run_tasks(_search_fields_in_file, ((file_path, filters, keyword, query, since, until, results)
+                                       for file_path in catalog_for(log_directory).log_files()))
     if results:
         return results
     else:
-        return {"ERROR": f"Keyword '{keyword}' was not found in any file in the {log_directory} directory."}
\ No newline at end of file
+        return {"ERROR": f"No entries matching the field filters were found in any file in the {log_directory} directory."}
+
+def iter_search_fields(filters: List[FieldFilter], keyword: Optional[str] = None, query: Optional[Query] = None,
+                       since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Searches the log files for the lines whose fields pass the filters, like `search_fields`,
+    and yields the matches of each file as soon as that file was searched. Files are searched 
+    one after the other, so only the matches of the current file are held in memory.
+
+    Parameters:
+        - filters (list): The field filters, as returned by `field_filters`.
+        - keyword (str, optional): A keyword the lines must also contain.
+        - query (Query, optional): A compiled query the lines must also match, instead of the keyword.
+        - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+        - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+
+    Yields:
+        - tuple: The file path and a matching line from that file.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    for file_path in catalog_for(log_directory).log_files():
+        try:
+            found_in_file = _fields_in_file(file_path, filters, keyword, query, since, until)
+        except Exception as e:
+            metrics.READ_ERRORS.inc(labels=('search',))
+            print(f"Error reading {file_path}: {e}")
+            continue
+        for line in found_in_file:
+            yield file_path, line
+
+def _search_fields_in_file(file_path: str, filters: List[FieldFilter], keyword: Optional[str], query: Optional[Query],
+                           since: Optional[float], until: Optional[float], results: dict) -> None:
+    """
+    Searches a single file for the lines whose fields pass the filters and stores them in the shared results.
+    """
+    try:
+        found_in_file = _fields_in_file(file_path, filters, keyword, query, since, until)
+        if found_in_file:
+            results[file_path] = found_in_file
+    except Exception as e:
+        metrics.READ_ERRORS.inc(labels=('search',))
+        print(f"Error reading {file_path}: {e}")
+
+def _fields_in_file(file_path: str, filters: List[FieldFilter], keyword: Optional[str], query: Optional[Query],
+                    since: Optional[float], until: Optional[float]) -> List[str]:
+    """
+    Returns the lines of a single file whose fields pass the filters and that contain the keyword or match the query.
+    """
+    if query is not None:
+        query.record(os.path.getsize(file_path))
+
+    if compression_of(file_path):
+        started = time.perf_counter()
+        found_in_file = run_decompression(select_compressed, file_path, filters, since, until)
+        record_compressed_scan(file_path, len(found_in_file), time.perf_counter() - started)
+    else:
+        found_in_file = field_cache.search_file(file_path, filters, since, until)
+
+    # The keyword or query is only checked on the lines that passed the filters.
+    if query is not None:
+        return [line for line in found_in_file if query.matches(line)]
+    if keyword:
+        return [line for line in found_in_file if keyword in line]
+    return found_in_file
+
+def iter_search_directory(keyword: str, query: Optional[Query] = None, since: Optional[float] = None, 
+                          until: Optional[float] = None, limit: Optional[int] = None,
+                          per_file_limit: Optional[int] = None, timeout_ms: Optional[int] = None,
+                          status: Optional[dict] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Searches for a specific keyword in all log files within the log directory and yields 
+    each matching line as soon as it is found. Files are searched one after the other and 
+    only the current line is held in memory, so memory use does not grow with the number 
+    or size of the files.
+
+    Parameters:
+        - keyword (str): The keyword to search for within the log files.
+        - query (Query, optional): A compiled query to match lines with instead of the keyword.
+        - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+        - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+        - limit (int, optional): The maximum number of matches to yield in total.
+        - per_file_limit (int, optional): The maximum number of matches to yield for each file.
+        - timeout_ms (int, optional): The time budget of the search in milliseconds, after which it stops.
+        - status (dict, optional): Receives the `TRUNCATED` key once the search is over, telling 
+                                   whether matches were left out because of a limit or the time budget.
+
+    With any of the limits, the search works as `search_newest_first`: the most recently 
+    modified files are searched first and each file is read backwards, newest line first.
+
+    Yields:
+        - tuple: The file path and a line from that file where the keyword was found.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    finder, predicate = matcher_for(keyword, query)
+
+    if limit is not None or per_file_limit is not None or timeout_ms:
+        deadline = time.time() + timeout_ms / 1000 if timeout_ms else None
+        files = _newest_first(catalog_for(log_directory).log_files())
+        outcome = {}
+        yield from _iter_newest_first(files, finder, predicate, query, limit, per_file_limit, deadline,
+                                      since, until, outcome)
+        if status is not None:
+            status["TRUNCATED"] = outcome["TRUNCATED"] or outcome["STOPPED_AT"] is not None
+        return
+
+    if status is not None:
+        status["TRUNCATED"] = False
+    for file_path in catalog_for(log_directory).log_files():
+        try:
+            if query is not None:
+                query.record(os.path.getsize(file_path))
+
+            if compression_of(file_path):
+                started = time.perf_counter()
+                found_in_file = run_decompression(search_compressed, file_path, keyword, query, since, until)
+                record_compressed_scan(file_path, len(found_in_file), time.perf_counter() - started)
+                for line in found_in_file:
+                    yield file_path, line
+                continue
+
+            with open(file_path, 'rb') as file:
+                metrics.record_open()
+                size = None
+                if since is not None or until is not None:
+                    start, end = time_window(file, since, until)
+                    file.seek(start)
+                    size = end - start
+                for line in iter_matching_lines(file, finder, limit=size, predicate=predicate):
+                    yield file_path, line
+        except Exception as e:
+            metrics.READ_ERRORS.inc(labels=('search',))
+            print(f"Error reading {file_path}: {e}")
+
+def search_newest_first(keyword: str, query: Optional[Query] = None, limit: Optional[int] = None, 
+                        per_file_limit: Optional[int] = None, timeout_ms: Optional[int] = None, 
+                        cursor: Optional[str] = None, since: Optional[float] = None, 
+                        until: Optional[float] = None) -> dict:
+    """
+    Searches the log files for a keyword reading each file backwards, so the most recent 
+    matches come first, and stops as soon as `limit` matches were found or the time budget 
+    ran out. This bounds the cost of a search for a common keyword, which no longer grows 
+    with the size of the log directory. Files are searched one after the other, the most 
+    recently modified first, so that the live file is searched before its older rotations.
+
+    Parameters:
+        - keyword (str): The keyword to search for within the log files.
+        - query (Query, optional): A compiled query to match lines with instead of the keyword.
+        - limit (int, optional): The maximum number of matches to return in total.
+        - per_file_limit (int, optional): The maximum number of matches to return for each file.
+        - timeout_ms (int, optional): The time budget of the search in milliseconds.
+        - cursor (str, optional): A cursor returned by a previous call, to continue where that search stopped.
+        - since (float, optional): Only search the entries from this time on, in seconds since the epoch.
+        - until (float, optional): Only search the entries up to this time, in seconds since the epoch.
+
+    Returns:
+        - dict: A dictionary containing file paths as keys and lists of matching lines, newest first, as values. 
+                The `TRUNCATED` key tells whether matches were left out because of a limit or the time budget, 
+                and the `CURSOR` key holds the cursor to continue the search when it stopped early.
+        - dict: An error message if the keyword is not found.
+
+    Raises:
+        - ValueError: If the cursor is invalid or the file it points to no longer exists.
+    """
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    # The deadline is a wall-clock time, so that the worker processes reading compressed files can check it too.
+    deadline = time.time() + timeout_ms / 1000 if timeout_ms else None
+    finder, predicate = matcher_for(keyword, query)
+
+    files = _newest_first(catalog_for(log_directory).log_files())
+
+    resume_path, resume_offset = None, None
+    if cursor:
+        state = decode_cursor(cursor) or {}
+        resume_path, resume_offset, resume_mtime = state.get("path"), state.get("offset"), state.get("mtime")
+        if (resume_path not in (file_path for _, file_path in files)
+                or not (resume_offset is None or isinstance(resume_offset, int))
+                or not isinstance(resume_mtime, (int, float))):
+            raise ValueError("Invalid or expired cursor.")
+        # Continue with the files after the one the search stopped in, in the order of the first
+        # page, even if some of them were modified since then.
+        resume_key = (-resume_mtime, resume_path)
+        files = [(resume_mtime, resume_path)] + [
+            (mtime, file_path) for mtime, file_path in files
+            if (-mtime, file_path) > resume_key and file_path != resume_path
+        ]
+
+    results = {}
+    outcome = {}
+    matches = _iter_newest_first(files, finder, predicate, query, limit, per_file_limit, deadline,
+                                 since, until, outcome, resume_path, resume_offset)
+    for file_path, line in matches:
+        results.setdefault(file_path, []).append(line)
+    stopped_at = outcome["STOPPED_AT"]
+
+    if not results and not stopped_at:
+        return {"ERROR": f"Keyword '{keyword}' was not found in any file in the {log_directory} directory."}
+
+    results["TRUNCATED"] = outcome["TRUNCATED"] or stopped_at is not None
+    if stopped_at:
+        file_path, mtime, position, end = stopped_at
+        # Resume right before the line that was not returned, which is the one after it in file order,
+        # or where this file was started from if none of its lines were read.
+        offset = end if position is None else _resume_position(file_path, position)
+        results["CURSOR"] = encode_cursor({"path": file_path, "offset": offset, "mtime": mtime})
+    return results
+
+def _iter_newest_first(files: List[Tuple[float, str]], finder, predicate, query: Optional[Query],
+                       limit: Optional[int], per_file_limit: Optional[int], deadline: Optional[float],
+                       since: Optional[float], until: Optional[float], outcome: dict,
+                       resume_path: Optional[str] = None,
+                       resume_offset: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Reads the files backwards in the given order and yields each matching line with its file, 
+    until `limit` matches were yielded or the deadline passed. When it is done, `outcome` holds 
+    `TRUNCATED`, which tells whether a file had more matches than `per_file_limit`, and 
+    `STOPPED_AT`, the file, mtime, position and end where the search stopped early, or None.
+    The limit only stops the search at a further line that matches, so a search that found 
+    every match is not reported as stopped.
+    """
+    outcome["TRUNCATED"] = False
+    outcome["STOPPED_AT"] = None
+    total = 0
+
+    for mtime, file_path in files:
+        end = resume_offset if file_path == resume_path else None
+        found = 0
+        position = None
+        try:
+            candidates = _iter_reverse_candidates(file_path, finder, end, since, until, deadline)
+            for count, (position, line) in enumerate(candidates):
+                if deadline is not None and count % 256 == 0 and time.time() > deadline:
+                    outcome["STOPPED_AT"] = (file_path, mtime, position, end)
+                    break
+                if line is None or (predicate is not None and not predicate(line)):
+                    continue
+                if limit is not None and total == limit:
+                    outcome["STOPPED_AT"] = (file_path, mtime, position, end)
+                    break
+                if per_file_limit is not None and found == per_file_limit:
+                    outcome["TRUNCATED"] = True
+                    break
+                found += 1
+                total += 1
+                yield file_path, line
+        except TimeoutError:
+            # The time budget ran out while a compressed file was decompressed.
+            outcome["STOPPED_AT"] = (file_path, mtime, position, end)
+        except Exception as e:
+            metrics.READ_ERRORS.inc(labels=('search',))
+            print(f"Error reading {file_path}: {e}")
+
+        if query is not None:
+            query.record(_bytes_scanned(file_path, end, position))
+        if outcome["STOPPED_AT"]:
+            return
+
+def _newest_first(file_paths: List[str]) -> List[Tuple[float, str]]:
+    """
+    Returns the modification time and path of the files, the most recently modified first,
+    and in path order for files modified at the same time. Files that vanished are left out.
+    """
+    files = []
+    for file_path in file_paths:
+        try:
+            files.append((os.path.getmtime(file_path), file_path))
+        except OSError:
+            continue
+    return sorted(files, key=lambda file: (-file[0], file[1]))
+
+def _iter_reverse_candidates(file_path: str, finder, end: Optional[int], since: Optional[float] = None, 
+                             until: Optional[float] = None,
+                             deadline: Optional[float] = None) -> Iterator[Tuple[int, Optional[str]]]:
+    """
+    Reads a file backwards and yields every line with its position, decoding only the lines 
+    where the finder has a hit. Lines without a hit are yielded as None, so that the caller 
+    can still check its time budget and record where it stopped. A compressed file raises
+    `TimeoutError` if the deadline passes while it is decompressed.
+    """
+    errors = decode_errors()
+    if compression_of(file_path):
+        for position, line in iter_reverse_lines(file_path, end, since, until, deadline):
+            yield position, line
+        return
+
+    with open(file_path, 'rb') as f:
+        metrics.record_open()
+        start = 0
+        if since is not None or until is not None:
+            start, window_end = time_window(f, since, until)
+            end = window_end if end is None else min(end, window_end)
+        for position, line in reverse_line_spans(f, end, start):
+            if finder is None or finder(line, 0, len(line)) != -1:
+                yield position, decode_line(line, errors)
+            else:
+                yield position, None
+
+def _bytes_scanned(file_path: str, end: Optional[int], position: Optional[int]) -> int:
+    """
+    Returns how many bytes of a file a reverse search read, from `end` back to the last 
+    position it reached. Compressed files are always decompressed whole.
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return 0
+    if compression_of(file_path):
+        return size
+    if position is None:
+        return 0
+    return (size if end is None else end) - position
+
+def _resume_position(file_path: str, position: int) -> int:
+    """
+    Returns the `end` position that makes a reverse read start with the line at `position`.
+    """
+    if compression_of(file_path):
+        return position + 1
+    with open(file_path, 'rb') as f:
+        f.seek(position)
+        return position + len(f.readline())
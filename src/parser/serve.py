@@ -0,0 +1,206 @@
+"""
+Production launcher of the log server. It loads the server and the parser modules once, then
+forks worker processes that all serve the same port, so that parsing and matching run on
+every core instead of the single one a `flask run` process is limited to by the GIL.
+
+With `SO_REUSEPORT`, every worker listens on its own socket and the kernel spreads the new
+connections evenly between them. Otherwise the workers accept from a single listening socket
+opened before forking. Workers that exit are restarted. When there is more than one worker,
+the caches are kept in the store shared by the workers, and the search index is updated by a
+single indexer process rather than by every worker.
+
+Usage: PYTHONPATH=src python -m parser.serve [--host 127.0.0.1] [--port 5000] [--workers N] [--no-access-log]
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+# Connections waiting to be accepted by each listening socket.
+BACKLOG = 1024
+
+# A process that exits within this many seconds of being started is restarted after a delay,
+# so that one that cannot start does not fork in a loop.
+MIN_UPTIME = 5.0
+RESTART_DELAY = 1.0
+
+WORKER, INDEXER = 'worker', 'indexer'
+
+
+def default_workers() -> int:
+    """
+    Returns the number of worker processes to start. It is set through the `SERVER_WORKERS`
+    environment variable and defaults to the number of CPUs.
+
+    Returns:
+      - int: The number of workers.
+    """
+    return int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 1))
+
+
+def open_socket(host: str, port: int, listen: bool) -> socket.socket:
+    """
+    Opens a TCP socket bound to the address, with `SO_REUSEPORT` when the platform has it.
+
+    Parameters:
+      - host (str): The address to bind to.
+      - port (int): The port to bind to, or 0 for any free port.
+      - listen (bool): Whether to start listening. A socket that is only bound reserves the
+                       port without receiving any of its connections.
+
+    Returns:
+      - socket.socket: The socket.
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(BACKLOG)
+    return sock
+
+
+def run_worker(app, host: str, port: int, listener: Optional[socket.socket], access_log: bool) -> None:
+    """
+    Serves requests in the current process until it is stopped, with a thread per request.
+
+    Parameters:
+      - app: The WSGI application.
+      - host (str): The address to serve on.
+      - port (int): The port to serve on.
+      - listener (socket, optional): The listening socket shared by the workers. Without it,
+                                     the worker listens on its own `SO_REUSEPORT` socket.
+      - access_log (bool): Whether to log every request, as `flask run` does.
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from parser.log_readers import shutdown_decompression_pool
+    from parser.parallel_scan import shutdown_scan_pool
+
+    class RequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            if access_log:
+                super().log_request(*args, **kwargs)
+
+    def stop(signum, frame) -> None:
+        raise SystemExit(0)
+
+    # Stop on SIGTERM the same way as on Ctrl-C, so that the worker processes of its pools are stopped too.
+    signal.signal(signal.SIGTERM, stop)
+    sock = listener if listener is not None else open_socket(host, port, listen=True)
+    server = make_server(host, port, app, threaded=True, request_handler=RequestHandler, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        shutdown_decompression_pool()
+        shutdown_scan_pool()
+
+
+def run_indexer() -> None:
+    """
+    Keeps the search index up to date for all the workers, until the process is stopped.
+    """
+    from parser import search_index
+    indexer = search_index.start_background_indexer()
+    if indexer is not None:
+        indexer.join()
+
+
+def _fork(target: Callable[[], None]) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Restarted processes are forked after the supervisor installed its own signal handlers.
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        status = 1
+        try:
+            target()
+            status = 0
+        except (KeyboardInterrupt, SystemExit):
+            status = 0
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+    return pid
+
+
+def main(arguments: argparse.Namespace) -> None:
+    # The environment is set before the server is loaded, since it configures the caches.
+    if arguments.workers > 1:
+        os.environ.setdefault('SHARED_CACHE', '1')
+
+    # Load the server and the parser modules once, so that the workers start with them in memory.
+    from parser import search_index
+    from parser.log_server import app
+
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # Reserve the port, to resolve port 0 once for every worker.
+        reservation = open_socket(arguments.host, arguments.port, listen=False)
+        listener = None
+        port = reservation.getsockname()[1]
+    else:
+        reservation = listener = open_socket(arguments.host, arguments.port, listen=True)
+        port = listener.getsockname()[1]
+
+    def serve() -> None:
+        if listener is None:
+            reservation.close()
+        run_worker(app, arguments.host, port, listener, arguments.access_log)
+
+    targets = {WORKER: serve, INDEXER: run_indexer}
+    children: Dict[int, tuple] = {}
+
+    def start(role: str) -> None:
+        children[_fork(targets[role])] = (role, time.monotonic())
+
+    for _ in range(arguments.workers):
+        start(WORKER)
+    if search_index.is_enabled():
+        start(INDEXER)
+    print(f"Serving on http://{arguments.host}:{port} with {arguments.workers} worker processes", flush=True)
+
+    stopping = []
+
+    def stop(signum, frame) -> None:
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in children:
+            continue
+        role, started = children.pop(pid)
+        if stopping:
+            continue
+        print(f"The {role} process {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it.",
+              file=sys.stderr, flush=True)
+        if time.monotonic() - started < MIN_UPTIME:
+            time.sleep(RESTART_DELAY)
+        if not stopping:
+            start(role)
+    reservation.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to serve on')
+    parser.add_argument('--port', type=int, default=5000, help='port to serve on, 0 for any free port')
+    parser.add_argument('--workers', type=int, default=default_workers(), help='number of worker processes')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false', help='do not log every request')
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+_local = threading.local()
+
+
+def is_enabled() -> bool:
+    """
+    Checks whether the caches are shared between processes through the `SHARED_CACHE`
+    environment variable. The pre-fork launcher turns it on when it starts more than one worker.
+
+    Returns:
+      - bool: True if `SHARED_CACHE` is set to `1`.
+    """
+    return os.environ.get('SHARED_CACHE', '0') == '1'
+
+
+def cache_directory() -> str:
+    """
+    Returns the directory where on-disk caches and indexes are stored. It is set through the
+    `CACHE_DIRECTORY` environment variable and defaults to a directory in the system temp directory.
+
+    Returns:
+      - str: The path of the cache directory.
+    """
+    return os.environ.get('CACHE_DIRECTORY', os.path.join(tempfile.gettempdir(), 'log_server_cache'))
+
+
+def _forget_connections() -> None:
+    # A connection must not be used on both sides of a fork, so a forked worker opens its own.
+    global _local
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_forget_connections)
+
+
+def _connection() -> sqlite3.Connection:
+    """
+    Returns the connection to the shared store for the current thread, creating the database
+    and its schema the first time it is used.
+    """
+    path = os.path.join(cache_directory(), 'shared_cache.sqlite3')
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and getattr(_local, 'path', None) == path:
+        return connection
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS file_kinds (
+            path TEXT PRIMARY KEY,
+            directory TEXT NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            encoding TEXT
+        );
+        CREATE INDEX IF NOT EXISTS file_kinds_directory ON file_kinds (directory);
+        CREATE TABLE IF NOT EXISTS search_results (
+            key TEXT PRIMARY KEY,
+            files TEXT NOT NULL,
+            cost INTEGER NOT NULL,
+            used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS search_results_used ON search_results (used);
+    ''')
+    _local.connection = connection
+    _local.path = path
+    return connection
+
+
+def load_file_kinds(directory: str) -> Dict[str, Tuple[int, int, str, Optional[str]]]:
+    """
+    Returns the detected kinds of the files of a directory, as stored by any process.
+
+    Parameters:
+      - directory (str): The directory the files are in.
+
+    Returns:
+      - dict: The inode, size, kind and encoding of each file keyed by path.
+    """
+    rows = _connection().execute(
+        'SELECT path, inode, size, kind, encoding FROM file_kinds WHERE directory = ?', (directory,)
+    )
+    return {path: (inode, size, kind, encoding) for path, inode, size, kind, encoding in rows}
+
+
+def save_file_kinds(directory: str, kinds: Iterable[Tuple[str, int, int, str, Optional[str]]]) -> None:
+    """
+    Stores the detected kinds of files of a directory in a single transaction.
+
+    Parameters:
+      - directory (str): The directory the files are in.
+      - kinds (Iterable): The path, inode, size, kind and encoding of each file.
+    """
+    connection = _connection()
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO file_kinds (path, directory, inode, size, kind, encoding) VALUES (?, ?, ?, ?, ?, ?)',
+            ((path, directory, inode, size, kind, encoding) for path, inode, size, kind, encoding in kinds)
+        )
+
+
+def load_search_results(key: str) -> Optional[str]:
+    """
+    Returns the stored results of a search.
+
+    Parameters:
+      - key (str): The key of the search.
+
+    Returns:
+      - str: The results as stored by `save_search_results`.
+      - None: If the search is not stored.
+    """
+    row = _connection().execute('SELECT files FROM search_results WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def save_search_results(key: str, files: str, cost: int, max_bytes: int) -> None:
+    """
+    Stores the results of a search, and drops the least recently stored searches until the
+    results fit in `max_bytes`.
+
+    Parameters:
+      - key (str): The key of the search.
+      - files (str): The serialized results.
+      - cost (int): The approximate memory the results use once loaded, counted against the budget.
+      - max_bytes (int): The budget of all the stored results.
+    """
+    connection = _connection()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO search_results (key, files, cost, used) VALUES (?, ?, ?, ?)',
+                           (key, files, cost, time.time()))
+        total = connection.execute('SELECT COALESCE(SUM(cost), 0) FROM search_results').fetchone()[0]
+        if total <= max_bytes:
+            return
+        for old_key, old_cost in connection.execute(
+                'SELECT key, cost FROM search_results WHERE key != ? ORDER BY used', (key,)).fetchall():
+            connection.execute('DELETE FROM search_results WHERE key = ?', (old_key,))
+            total -= old_cost
+            if total <= max_bytes:
+                break
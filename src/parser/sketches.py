@@ -0,0 +1,126 @@
+import math
+from array import array
+from typing import Dict, Hashable, List, Tuple
+
+# Items are hashed with the built-in `hash`, which is 64 bits wide on 64-bit platforms. Strings
+# are hashed with a random seed per process, so sketches are only comparable within a process.
+HASH_MASK = (1 << 64) - 1
+
+
+def _hash(item: Hashable) -> int:
+    # Integers hash to themselves, which would put small numbers in neighbouring registers.
+    return hash(item if isinstance(item, str) else repr(item)) & HASH_MASK
+
+
+class CountMinSketch:
+    """
+    Approximate counts of items in fixed memory: `depth` rows of `width` counters, where every
+    item adds to one counter per row. The estimate of an item is the smallest of its counters,
+    which is never below its true count and exceeds it by at most `e / width` of the total with
+    probability `1 - exp(-depth)`.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._counters = array('Q', bytes(8 * width * depth))
+
+    def add(self, item: Hashable, count: int = 1) -> int:
+        """
+        Counts an item.
+
+        Parameters:
+          - item (Hashable): The item to count.
+          - count (int): How many times to count it.
+
+        Returns:
+          - int: The new estimate of the item.
+        """
+        self.total += count
+        estimate = None
+        for slot in self._slots(item):
+            value = self._counters[slot] + count
+            self._counters[slot] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def estimate(self, item: Hashable) -> int:
+        """Returns the estimated count of an item, which is never below its true count."""
+        return min(self._counters[slot] for slot in self._slots(item))
+
+    def _slots(self, item: Hashable) -> List[int]:
+        # Derives the counter of each row from two halves of a single hash.
+        value = _hash(item)
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [row * self.width + (first + row * second) % self.width for row in range(self.depth)]
+
+
+class HyperLogLog:
+    """
+    Approximate number of distinct items in fixed memory: `2 ** precision` one-byte registers
+    that each keep the longest run of leading zero bits seen in the hashes routed to them.
+    The standard error is `1.04 / sqrt(2 ** precision)`, 0.8% with the default precision.
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, item: Hashable) -> None:
+        value = _hash(item)
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self) -> int:
+        """Returns the estimated number of distinct items added."""
+        size = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Few items: count the empty registers instead, which is more accurate.
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+class TopK:
+    """
+    The approximately most frequent items, counted with a `CountMinSketch`. Only the `k`
+    items with the highest estimates so far are remembered, so memory does not grow with
+    the number of distinct items.
+    """
+
+    def __init__(self, k: int, width: int = 2048, depth: int = 4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self._candidates: Dict[Hashable, int] = {}
+        # The lowest estimate among the candidates once there are `k` of them.
+        self._floor = 0
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        estimate = self.sketch.add(item, count)
+        candidates = self._candidates
+        if item in candidates:
+            previous = candidates[item]
+            candidates[item] = estimate
+            if previous > self._floor:
+                return
+        elif len(candidates) < self.k:
+            candidates[item] = estimate
+        elif estimate > self._floor:
+            del candidates[min(candidates, key=candidates.get)]
+            candidates[item] = estimate
+        else:
+            return
+        if len(candidates) == self.k:
+            self._floor = min(candidates.values())
+
+    def items(self) -> List[Tuple[Hashable, int]]:
+        """Returns the top items and their estimated counts, most frequent first."""
+        estimates = [(item, self.sketch.estimate(item)) for item in self._candidates]
+        return sorted(estimates, key=lambda pair: (-pair[1], str(pair[0])))
@@ -0,0 +1,218 @@
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from .fields import parse_fields
+from .file_catalog import catalog_for
+from .parse_logs import iter_single_file
+from .query import Query
+from .search_logs import iter_search_directory
+from .sketches import HyperLogLog, TopK
+from .timestamps import TIMESTAMP_PREFIX, line_timestamp
+
+DEFAULT_BUCKET_SECONDS = 60
+DEFAULT_TOP = 10
+MAX_TOP = 1000
+
+# Past this many time buckets, the width of the buckets is doubled and neighbouring buckets
+# are merged, so that the histogram of a long time span still takes bounded memory.
+MAX_BUCKETS = 10000
+
+# Words are counted in a plain `Counter` for this many lines at a time, which runs in C, and
+# only then added to the sketches, once per distinct word.
+FLUSH_LINES = 8192
+
+# Words counted for the top terms. A word does not start right after a letter or digit, so
+# the `T` and `Z` of ISO-8601 timestamps are not counted.
+WORD_PATTERN = re.compile(r'(?<!\w)[A-Za-z]\w*(?:[.-]\w+)*')
+
+# Lines that start with the same characters as the line before have the same timestamp, to
+# the second, so it is not parsed again. This covers ISO-8601 and syslog timestamps. It is only
+# used when the buckets are whole seconds, which a fraction of a second cannot move a line across.
+TIMESTAMP_KEY_LENGTH = 19
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_bucket(value: str) -> float:
+    """
+    Parses the width of the time buckets of a histogram, in seconds or with a unit such as `5m`.
+
+    Parameters:
+      - value (str): The width, for example `60`, `30s`, `5m`, `1h` or `1d`.
+
+    Returns:
+      - float: The width in seconds.
+
+    Raises:
+      - ValueError: If the value is not a positive duration.
+    """
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd]?)', value.strip())
+    seconds = float(match.group(1)) * UNITS.get(match.group(2), 1) if match else 0
+    if seconds <= 0:
+        raise ValueError(f"Invalid bucket '{value}'. Use a number of seconds or a duration such as 5m or 1h.")
+    return seconds
+
+
+class StreamAggregator:
+    """
+    Summarizes a stream of log entries in a single pass and in bounded memory: the number of
+    entries by file and by time bucket, the most frequent words and the number of distinct
+    words, and the same for the values of chosen fields. The entries themselves are not kept.
+    """
+
+    def __init__(self, bucket: float = DEFAULT_BUCKET_SECONDS, top: int = DEFAULT_TOP,
+                 fields: Iterable[str] = ()):
+        self.bucket = bucket
+        self.total = 0
+        self.untimed = 0
+        self.files: Dict[str, int] = {}
+        self.buckets: Dict[int, int] = {}
+        self.terms = TopK(top)
+        self.distinct_terms = HyperLogLog()
+        self.fields = {name: (TopK(top), HyperLogLog()) for name in fields}
+        self._pending_terms = Counter()
+        self._pending_fields = {name: Counter() for name in self.fields}
+        self._pending_lines = 0
+        self._last_key = None
+        self._last_time = None
+        self._entry_file = None
+        self._entry_time = None
+
+    def add(self, file_path: str, line: str) -> None:
+        self.total += 1
+        self.files[file_path] = self.files.get(file_path, 0) + 1
+
+        moment = self._timestamp(line)
+        if file_path != self._entry_file:
+            self._entry_file, self._entry_time = file_path, None
+        # Lines without a timestamp, such as the continuation of a multi-line entry, belong to the entry before them.
+        if moment is None:
+            moment = self._entry_time
+        else:
+            self._entry_time = moment
+        if moment is None:
+            self.untimed += 1
+        else:
+            key = int(moment // self.bucket)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+            if len(self.buckets) > MAX_BUCKETS:
+                self._widen()
+
+        self._pending_terms.update(WORD_PATTERN.findall(line))
+        if self.fields:
+            fields = parse_fields(line)
+            for name, counter in self._pending_fields.items():
+                value = fields.get(name)
+                if value is not None:
+                    counter[value] += 1
+
+        self._pending_lines += 1
+        if self._pending_lines >= FLUSH_LINES:
+            self._flush()
+
+    def result(self) -> dict:
+        """
+        Returns the summary of the entries added so far.
+
+        Returns:
+          - dict: `TOTAL`, the number of entries; `FILES`, the number of entries of each file;
+                  `HISTOGRAM`, the number of entries in each bucket of `BUCKET_SECONDS` by the
+                  time the bucket starts; `UNTIMED`, the lines without a timestamp before the
+                  first entry of their file;
+                  `TOP_TERMS` and `DISTINCT_TERMS`, the most frequent words and the estimated
+                  number of distinct words; and `FIELDS`, the top and distinct values of each field.
+        """
+        self._flush()
+        bucket = int(self.bucket) if float(self.bucket).is_integer() else self.bucket
+        results = {
+            "TOTAL": self.total,
+            "FILES": self.files,
+            "BUCKET_SECONDS": bucket,
+            "HISTOGRAM": {_format_time(key * self.bucket): self.buckets[key] for key in sorted(self.buckets)},
+            "UNTIMED": self.untimed,
+            "TOP_TERMS": [[term, count] for term, count in self.terms.items()],
+            "DISTINCT_TERMS": self.distinct_terms.count(),
+        }
+        if self.fields:
+            results["FIELDS"] = {
+                name: {"top": [[value, count] for value, count in top.items()], "distinct": distinct.count()}
+                for name, (top, distinct) in self.fields.items()
+            }
+        return results
+
+    def _timestamp(self, line: str) -> Optional[float]:
+        if self.bucket < 1 or not float(self.bucket).is_integer():
+            return line_timestamp(line[:TIMESTAMP_PREFIX].encode('utf-8', 'replace'))
+        key = line[:TIMESTAMP_KEY_LENGTH]
+        if key != self._last_key:
+            self._last_key = key
+            self._last_time = line_timestamp(line[:TIMESTAMP_PREFIX].encode('utf-8', 'replace'))
+        return self._last_time
+
+    def _widen(self) -> None:
+        self.bucket *= 2
+        buckets = {}
+        for key, count in self.buckets.items():
+            buckets[key // 2] = buckets.get(key // 2, 0) + count
+        self.buckets = buckets
+
+    def _flush(self) -> None:
+        for term, count in self._pending_terms.items():
+            self.terms.add(term, count)
+            self.distinct_terms.add(term)
+        self._pending_terms.clear()
+        for name, counter in self._pending_fields.items():
+            top, distinct = self.fields[name]
+            for value, count in counter.items():
+                top.add(value, count)
+                distinct.add(value)
+            counter.clear()
+        self._pending_lines = 0
+
+
+def aggregate(keyword: Optional[str] = None, query: Optional[Query] = None, since: Optional[float] = None,
+              until: Optional[float] = None, bucket: float = DEFAULT_BUCKET_SECONDS, top: int = DEFAULT_TOP,
+              fields: Iterable[str] = ()) -> dict:
+    """
+    Summarizes the log entries of the log directory in a single streaming pass, instead of
+    returning them: counts by file and by time bucket, the top words and the number of distinct
+    words, along with the top and distinct values of the chosen fields. The entries are read
+    through the same paths as a streamed `/search` or `/logs`, one at a time, so memory stays
+    bounded however many entries there are. Counts by file and time are exact, while the top
+    and distinct counts are estimated with fixed-size sketches.
+
+    Parameters:
+      - keyword (str, optional): Only summarize the entries that contain the keyword.
+      - query (Query, optional): Only summarize the entries that match the query, instead of the keyword.
+      - since (float, optional): Only summarize the entries from this time on, in seconds since the epoch.
+      - until (float, optional): Only summarize the entries up to this time, in seconds since the epoch.
+      - bucket (float): The width of the time buckets of the histogram, in seconds.
+      - top (int): The number of top words and field values to return.
+      - fields (Iterable): The names of the fields to summarize the values of, such as `program`.
+
+    Returns:
+      - dict: The summary, as described in `StreamAggregator.result`.
+    """
+    aggregator = StreamAggregator(bucket, top, fields)
+    for file_path, line in _entries(keyword, query, since, until):
+        aggregator.add(file_path, line)
+    return aggregator.result()
+
+
+def _entries(keyword: Optional[str], query: Optional[Query], since: Optional[float],
+             until: Optional[float]) -> Iterator[Tuple[str, str]]:
+    if keyword or query is not None:
+        yield from iter_search_directory(keyword, query, since, until)
+        return
+    log_directory = os.environ.get('LOG_DIRECTORY', '/var/log')
+    for file_path in catalog_for(log_directory).log_files():
+        yield from iter_single_file(file_path, since, until)
+
+
+def _format_time(moment: float) -> str:
+    # Buckets shorter than a second, or not a whole number of seconds, start at a fraction of a second.
+    timespec = 'seconds' if float(moment).is_integer() else 'milliseconds'
+    return datetime.fromtimestamp(moment, timezone.utc).isoformat(timespec=timespec).replace('+00:00', 'Z')
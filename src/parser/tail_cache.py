@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from . import metrics
+from .byte_search import decode_errors, decode_line
+from .reverse_reader import reverse_line_spans
+
+# Rough per-line cost of a cached entry on top of its characters: the `str` object
+# header and its slot in the offsets array.
+LINE_OVERHEAD = 57
+
+# Appending more than this since the last read is treated as a miss, because reading
+# the newest lines backwards is cheaper than decoding everything that was appended.
+MAX_EXTENSION_BYTES = 4 * 1024 * 1024
+
+Fingerprint = Tuple[int, int, float]
+
+
+class _TailEntry:
+    """
+    The most recent lines of a file, newest first, along with the offsets where they
+    start and the fingerprint of the file when they were read.
+    """
+
+    def __init__(self, fingerprint: Fingerprint, lines: List[str], offsets: array,
+                 complete: bool, ends_with_newline: bool):
+        self.fingerprint = fingerprint
+        self.lines = lines
+        self.offsets = offsets
+        # True when the lines go all the way back to the beginning of the file.
+        self.complete = complete
+        self.ends_with_newline = ends_with_newline
+        self.size = sum(len(line) for line in lines) + LINE_OVERHEAD * len(lines)
+
+    def covers(self, n_entries: int) -> bool:
+        return self.complete or len(self.lines) >= n_entries
+
+
+class TailCache:
+    """
+    In-process LRU cache of the most recent lines of log files, bounded by an approximate
+    memory budget. Entries are keyed by path and validated against the file's
+    (inode, size, mtime) fingerprint. When a file only grew, the cached lines are extended
+    with the appended bytes instead of reading the file again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read_tail(self, file_path: str, n_entries: int) -> Tuple[List[str], int, Fingerprint]:
+        """
+        Returns up to `n_entries` of the most recent non-empty lines of a file, newest first.
+        Requests that are already covered by the cache do not read the file at all.
+
+        Parameters:
+          - file_path (str): The path to the log file.
+          - n_entries (int): The maximum number of lines to return.
+
+        Returns:
+          - tuple: The lines, the offset where the oldest returned line starts (0 if there are
+                   no lines), and the (inode, size, mtime) fingerprint of the file they were read from.
+        """
+        stat = os.stat(file_path)
+        fingerprint = (stat.st_ino, stat.st_size, stat.st_mtime)
+
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None:
+                self._entries.move_to_end(file_path)
+
+        if entry is not None and entry.fingerprint == fingerprint and entry.covers(n_entries):
+            with self._lock:
+                self.hits += 1
+            return self._slice(entry, n_entries)
+
+        if (entry is not None and entry.fingerprint[0] == stat.st_ino and entry.ends_with_newline
+                and 0 < stat.st_size - entry.fingerprint[1] <= MAX_EXTENSION_BYTES):
+            extended = self._extend(file_path, entry, stat.st_ino)
+            if extended is not None and extended.covers(n_entries):
+                with self._lock:
+                    self.extensions += 1
+                self._store(file_path, extended)
+                return self._slice(extended, n_entries)
+
+        with self._lock:
+            self.misses += 1
+        entry = self._read(file_path, n_entries)
+        self._store(file_path, entry)
+        return self._slice(entry, n_entries)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit, miss and extension counters of the cache and its current size.
+
+        Returns:
+          - dict: The counters, the number of cached files and the approximate bytes used.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "extensions": self.extensions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _slice(self, entry: _TailEntry, n_entries: int) -> Tuple[List[str], int, Fingerprint]:
+        lines = entry.lines[:n_entries]
+        oldest_offset = entry.offsets[len(lines) - 1] if lines else 0
+        return lines, oldest_offset, entry.fingerprint
+
+    def _read(self, file_path: str, n_entries: int) -> _TailEntry:
+        """
+        Reads the most recent lines of a file backwards from its end.
+        """
+        lines = []
+        offsets = array('Q')
+        complete = True
+
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            stat = os.fstat(f.fileno())
+            f.seek(max(stat.st_size - 1, 0))
+            ends_with_newline = f.read(1) == b'\n'
+
+            errors = decode_errors()
+            for offset, line in reverse_line_spans(f, stat.st_size):
+                decoded = decode_line(line, errors) if line else None
+                if not decoded:
+                    continue
+                if len(lines) == n_entries:
+                    complete = False
+                    break
+                lines.append(decoded)
+                offsets.append(offset)
+
+        fingerprint = (stat.st_ino, stat.st_size, stat.st_mtime)
+        return _TailEntry(fingerprint, lines, offsets, complete, ends_with_newline)
+
+    def _extend(self, file_path: str, entry: _TailEntry, inode: int) -> Optional[_TailEntry]:
+        """
+        Reads only the bytes appended since the entry was cached and puts the new lines in
+        front of the cached ones. The number of cached lines stays the same, unless the entry
+        already covered the whole file.
+
+        Returns:
+          - _TailEntry: The extended entry.
+          - None: If the file was replaced in the meantime.
+        """
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            metrics.record_open()
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != inode or stat.st_size < entry.fingerprint[1]:
+                return None
+            start = entry.fingerprint[1]
+            f.seek(start)
+            data = f.read(stat.st_size - start)
+        metrics.record_phase('read', time.perf_counter() - started)
+        metrics.record_scan(len(data), data.count(b'\n'))
+
+        errors = decode_errors()
+        new_lines = []
+        new_offsets = []
+        line_start = 0
+        for line in data.split(b'\n'):
+            decoded = decode_line(line, errors) if line else None
+            if decoded:
+                new_lines.append(decoded)
+                new_offsets.append(start + line_start)
+            line_start += len(line) + 1
+
+        new_lines.reverse()
+        new_offsets.reverse()
+        lines = new_lines + entry.lines
+        offsets = array('Q', new_offsets) + entry.offsets
+        complete = entry.complete
+        if not complete:
+            lines = lines[:len(entry.lines)]
+            offsets = offsets[:len(entry.lines)]
+
+        fingerprint = (stat.st_ino, stat.st_size, stat.st_mtime)
+        return _TailEntry(fingerprint, lines, offsets, complete, data.endswith(b'\n'))
+
+    def _store(self, file_path: str, entry: _TailEntry) -> None:
+        """
+        Caches an entry and evicts the least recently used ones until the cache fits its budget.
+        """
+        if entry.size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(file_path, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._entries[file_path] = entry
+            self._size += entry.size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+
+tail_cache = TailCache(int(os.environ.get('TAIL_CACHE_BYTES', 64 * 1024 * 1024)))
+metrics.register_cache('tail', tail_cache.stats)
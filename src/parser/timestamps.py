@@ -0,0 +1,229 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Callable, Dict, Match, Optional, Pattern, Tuple
+
+# Timestamp formats recognized at the start of a log line, tried in order. Each one has a
+# pattern matched against the raw bytes of the line and a function that converts the match
+# to seconds since the epoch. Timestamps without a time zone are read as UTC.
+TIMESTAMP_FORMATS: Dict[str, Tuple[Pattern[bytes], Callable[[Match], float]]] = {}
+
+# Only the start of a line is checked for a timestamp.
+TIMESTAMP_PREFIX = 64
+
+# Once the binary search narrowed the window down to this many bytes, the rest is scanned line by line.
+SCAN_SPAN = 64 * 1024
+
+# How far a single probe of the binary search reads past its position looking for a line with
+# a timestamp. Files that have no timestamp in their first bytes are considered to have none.
+MAX_PROBE_BYTES = 64 * 1024
+
+MONTHS = {month: index for index, month in enumerate(
+    (b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'), start=1
+)}
+
+
+def register_timestamp_format(name: str, pattern: str | bytes, convert: Callable[[Match], float]) -> None:
+    """
+    Registers a timestamp format for log lines. Formats are tried in the order they were registered.
+
+    Parameters:
+      - name (str): The name of the format. Registering an existing name replaces it.
+      - pattern (str | bytes): A regular expression matched at the start of a line.
+      - convert (Callable): A function that takes the match and returns seconds since the epoch.
+                            It may raise ValueError if the match is not a valid time.
+    """
+    if isinstance(pattern, str):
+        pattern = pattern.encode('utf-8')
+    TIMESTAMP_FORMATS[name] = (re.compile(pattern), convert)
+
+
+def _iso8601(match: Match) -> float:
+    moment = datetime.fromisoformat(match.group(1).decode('ascii').replace(',', '.'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _syslog(match: Match) -> float:
+    # Syslog timestamps have no year, so the most recent one that is not in the future is used.
+    now = datetime.now(timezone.utc)
+    month, day, hour, minute, second = MONTHS[match.group(1)], *map(int, match.groups()[1:])
+    moment = datetime(now.year, month, day, hour, minute, second, tzinfo=timezone.utc)
+    if moment > now + timedelta(days=1):
+        moment = moment.replace(year=now.year - 1)
+    return moment.timestamp()
+
+
+def _epoch(match: Match) -> float:
+    value = match.group(1)
+    # 13 digits are milliseconds, as written by Java and JavaScript loggers.
+    return int(value) / 1000 if len(value) == 13 else float(value)
+
+
+register_timestamp_format(
+    'iso8601', rb'\[?(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)', _iso8601
+)
+register_timestamp_format(
+    'syslog', rb'\[?(' + b'|'.join(MONTHS) + rb') {1,2}(\d{1,2}) (\d{2}):(\d{2}):(\d{2})', _syslog
+)
+register_timestamp_format('epoch', rb'\[?(\d{13}|\d{10}(?:\.\d+)?)(?!\d)', _epoch)
+
+
+def line_timestamp(line: bytes) -> Optional[float]:
+    """
+    Returns the timestamp at the start of a log line, in any of the registered formats.
+
+    Parameters:
+      - line (bytes): The raw line.
+
+    Returns:
+      - float: The timestamp in seconds since the epoch.
+      - None: If the line does not start with a timestamp, such as the continuation of a multi-line entry.
+    """
+    for pattern, convert in TIMESTAMP_FORMATS.values():
+        match = pattern.match(line, 0, TIMESTAMP_PREFIX)
+        if match:
+            try:
+                return convert(match)
+            except (ValueError, KeyError, OverflowError):
+                continue
+    return None
+
+
+def parse_time(value: str) -> float:
+    """
+    Parses the value of a `since` or `until` parameter. It accepts ISO-8601 dates and times,
+    seconds since the epoch and any of the registered timestamp formats.
+
+    Parameters:
+      - value (str): The time to parse.
+
+    Returns:
+      - float: The time in seconds since the epoch.
+
+    Raises:
+      - ValueError: If the value is not a recognized time.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    except ValueError:
+        pass
+    timestamp = line_timestamp(value.encode('utf-8'))
+    if timestamp is None:
+        raise ValueError(f"Invalid time '{value}'. Use ISO-8601, seconds since the epoch or a log timestamp.")
+    return timestamp
+
+
+def time_window(f: BinaryIO, since: Optional[float] = None, until: Optional[float] = None) -> Tuple[int, int]:
+    """
+    Finds the byte range of a time-ordered log file that holds the entries between `since`
+    and `until`, both included. The boundaries are found with a binary search over byte
+    offsets that samples the timestamp of the line at each probe, so only O(log size) parts
+    of the file are read. Lines without a timestamp belong to the entry before them.
+
+    Parameters:
+      - f (BinaryIO): A seekable file object opened in binary mode.
+      - since (float, optional): The earliest time to include, in seconds since the epoch.
+      - until (float, optional): The latest time to include, in seconds since the epoch.
+
+    Returns:
+      - tuple: The offset of the first line of the window and the offset right after its last line.
+               Both are 0 if the file has no timestamps.
+    """
+    f.seek(0, 2)
+    size = f.tell()
+    if _next_timestamp(f, 0, MAX_PROBE_BYTES) is None:
+        return 0, 0
+
+    start = 0 if since is None else _find_offset(f, size, since, strict=False)
+    end = size if until is None else _find_offset(f, size, until, strict=True)
+    return start, max(start, end)
+
+
+def first_timestamp(f: BinaryIO) -> Optional[float]:
+    """
+    Returns the timestamp of the first line of a file that has one, looking only at the
+    start of the file.
+
+    Parameters:
+      - f (BinaryIO): A file object opened in binary mode and positioned at its start.
+
+    Returns:
+      - float: The first timestamp in seconds since the epoch.
+      - None: If there is no timestamp at the start of the file.
+    """
+    read = 0
+    for line in f:
+        timestamp = line_timestamp(line)
+        if timestamp is not None:
+            return timestamp
+        read += len(line)
+        if read >= MAX_PROBE_BYTES:
+            break
+    return None
+
+
+def _find_offset(f: BinaryIO, size: int, target: float, strict: bool) -> int:
+    """
+    Returns the offset of the first line whose timestamp is at or after `target` (or strictly
+    after it, when `strict`), or the size of the file if there is none.
+    """
+    # Every line with a timestamp that starts before `low` is before the target.
+    low, high = 0, size
+    while high - low > SCAN_SPAN:
+        middle = (low + high) // 2
+        found = _next_timestamp(f, middle, min(high, middle + MAX_PROBE_BYTES))
+        if found is None or _reached(found[1], target, strict):
+            high = middle
+        else:
+            low = found[0] + 1
+
+    # Scan the lines that are left. This keeps the result exact even where a probe gave up early.
+    line_start = _line_start(f, low)
+    for line in f:
+        timestamp = line_timestamp(line)
+        if timestamp is not None and _reached(timestamp, target, strict):
+            return line_start
+        line_start += len(line)
+    return size
+
+
+def _next_timestamp(f: BinaryIO, position: int, limit: int) -> Optional[Tuple[int, float]]:
+    """
+    Returns the offset and timestamp of the first line with a timestamp that starts at or after
+    `position` and before `limit`, or None if there is none.
+    """
+    line_start = _line_start(f, position)
+    while line_start < limit:
+        line = f.readline()
+        if not line:
+            return None
+        timestamp = line_timestamp(line)
+        if timestamp is not None:
+            return line_start, timestamp
+        line_start += len(line)
+    return None
+
+
+def _line_start(f: BinaryIO, position: int) -> int:
+    """
+    Moves the file to the start of the first line that starts at or after `position` and returns its offset.
+    """
+    if position == 0:
+        f.seek(0)
+        return 0
+    f.seek(position - 1)
+    # Skip the rest of the line that `position` falls in.
+    f.readline()
+    return f.tell()
+
+
+def _reached(timestamp: float, target: float, strict: bool) -> bool:
+    return timestamp > target if strict else timestamp >= target
@@ -0,0 +1,63 @@
+import io
+import unittest
+from unittest.mock import patch
+
+from parser.byte_search import iter_matching_lines, keyword_finder, matcher_for, decode_line
+from parser.query import Query
+
+
+class TestByteSearch(unittest.TestCase):
+
+    def test_matches_across_chunk_boundaries(self):
+        content = b''.join(b'line %d %s\r\n' % (i, b'needle' if i % 5 == 0 else b'hay') for i in range(100))
+
+        with patch('parser.byte_search.SEARCH_CHUNK_SIZE', 17):
+            result = list(iter_matching_lines(io.BytesIO(content), keyword_finder('needle')))
+
+        self.assertEqual(result, [f'line {i} needle' for i in range(0, 100, 5)])
+
+    def test_one_line_per_hit_and_unterminated_last_line(self):
+        content = b'needle needle\nnothing\nlast needle'
+
+        result = list(iter_matching_lines(io.BytesIO(content), keyword_finder('needle')))
+
+        self.assertEqual(result, ['needle needle', 'last needle'])
+
+    def test_limit(self):
+        content = b'a needle\nb needle\nc needle\n'
+
+        result = list(iter_matching_lines(io.BytesIO(content), keyword_finder('needle'), limit=18))
+
+        self.assertEqual(result, ['a needle', 'b needle'])
+
+    def test_decode_policies(self):
+        self.assertEqual(decode_line(b'bad \xff needle', 'replace'), 'bad � needle')
+        self.assertIsNone(decode_line(b'bad \xff needle', 'skip'))
+        with self.assertRaises(UnicodeDecodeError):
+            decode_line(b'bad \xff needle', 'strict')
+
+    def test_query_prefilter_on_bytes(self):
+        content = b'GET /a 200\nGET /b 500\nPOST /c 500\nPOST /d 200\n'
+        finder, predicate = matcher_for('', Query('500 NOT POST'))
+
+        result = list(iter_matching_lines(io.BytesIO(content), finder, predicate=predicate))
+
+        self.assertEqual(result, ['GET /b 500'])
+
+    def test_regex_term_matches_non_ascii_lines(self):
+        content = 'café ouvert\ncafe ferme\nthé\n'.encode('utf-8')
+        for text, expected in (('/caf\\w ouvert/', ['café ouvert']), ('/th./', ['thé'])):
+            finder, predicate = matcher_for('', Query(text))
+
+            result = list(iter_matching_lines(io.BytesIO(content), finder, predicate=predicate))
+
+            self.assertIsNone(finder)
+            self.assertEqual(result, expected)
+
+    def test_query_without_prefilter_checks_every_line(self):
+        finder, predicate = matcher_for('', Query('NOT debug'))
+
+        result = list(iter_matching_lines(io.BytesIO(b'debug a\ninfo b\n'), finder, predicate=predicate))
+
+        self.assertIsNone(finder)
+        self.assertEqual(result, ['info b'])
@@ -0,0 +1,81 @@
+import gzip
+import os
+import unittest
+import zlib
+from unittest.mock import patch
+
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from parser import compression
+
+
+def accept(header):
+    return parse_accept_header(header, Accept)
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate(accept('gzip, deflate, br')), 'gzip')
+        self.assertEqual(compression.negotiate(accept('deflate')), 'deflate')
+        self.assertEqual(compression.negotiate(accept('gzip;q=0.5, deflate')), 'deflate')
+        self.assertIsNone(compression.negotiate(accept('br')))
+        self.assertIsNone(compression.negotiate(accept('')))
+
+    @patch.dict(os.environ, {'COMPRESS_LEVEL': '0'})
+    def test_level_zero_disables_compression(self):
+        self.assertIsNone(compression.negotiate(accept('gzip')))
+
+    def test_compressible(self):
+        self.assertTrue(compression.compressible('application/x-ndjson'))
+        self.assertFalse(compression.compressible('text/event-stream'))
+
+    def test_compress(self):
+        data = b'{"file": "/var/log/syslog", "line": "connection accepted"}\n' * 100
+        self.assertEqual(gzip.decompress(compression.compress(data, 'gzip')), data)
+        self.assertEqual(zlib.decompress(compression.compress(data, 'deflate', 1)), data)
+
+    @patch.object(compression, 'STREAM_FLUSH_BYTES', 1024)
+    def test_compress_stream_flushes_incrementally(self):
+        chunks = [f'{{"line": "entry {number}"}}\n' for number in range(1000)]
+        output = list(compression.compress_stream(iter(chunks), 'gzip'))
+
+        self.assertGreater(len(output), 5)
+        self.assertEqual(gzip.decompress(b''.join(output)), ''.join(chunks).encode())
+        # Every flushed part can be decoded as soon as it arrives.
+        decompressor = zlib.decompressobj(31)
+        self.assertTrue(decompressor.decompress(b''.join(output[:2])).startswith(b'{"line": "entry 0"}'))
+
+    def test_record_stream_is_flushed_before_next_record(self):
+        produced = []
+
+        def body():
+            for number in range(2):
+                produced.append(number)
+                yield f'{{"line": "entry {number}"}}\n'
+
+        stream = compression.compress_stream(body(), 'gzip', flush_every_chunk=True)
+        first = next(stream)
+
+        self.assertEqual(produced, [0])
+        self.assertEqual(zlib.decompressobj(31).decompress(first), b'{"line": "entry 0"}\n')
+        stream.close()
+
+    def test_compress_stream_closes_body(self):
+        def body():
+            try:
+                while True:
+                    yield 'entry\n' * 20000
+            finally:
+                closed.append(True)
+
+        closed = []
+        stream = compression.compress_stream(body(), 'deflate')
+        next(stream)
+        stream.close()
+        self.assertEqual(closed, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import unittest
+
+from parser.cursors import encode_cursor, decode_cursor
+
+
+class TestCursors(unittest.TestCase):
+
+    def test_round_trip(self):
+        state = {"inode": 1234, "size": 5678, "offset": 42}
+
+        cursor = encode_cursor(state)
+
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), state)
+
+    def test_malformed_cursor(self):
+        self.assertIsNone(decode_cursor('not a cursor'))
+        self.assertIsNone(decode_cursor(encode_cursor({"a": 1})[:-2] + '!!'))
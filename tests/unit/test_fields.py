@@ -0,0 +1,137 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import iter_search_fields, search_fields
+from parser.fields import FieldCache, FieldTable, field_filters, parse_fields
+from parser.timestamps import parse_time
+
+LINES = [
+    '2026-01-01T10:00:00Z web1 auth[42]: ERROR login failed user=alice',
+    '2026-01-01T10:00:01Z web1 auth[42]: INFO login ok user=bob',
+    '{"time": "2026-01-01T10:00:02Z", "level": "error", "service": "auth", "msg": "token expired"}',
+    '{"time": "2026-01-01T10:00:03Z", "level": "warn", "service": "db", "http": {"status": 500}}',
+]
+
+
+class TestFields(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'app.log')
+        with open(self.file_path, 'w') as f:
+            f.write('\n'.join(LINES) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fields_are_parsed(self):
+        self.assertEqual(parse_fields(LINES[0]), {
+            'user': 'alice', 'level': 'ERROR', 'timestamp': '2026-01-01T10:00:00Z', 'host': 'web1',
+            'program': 'auth', 'pid': '42'
+        })
+        self.assertEqual(parse_fields(LINES[3]), {
+            'timestamp': '2026-01-01T10:00:03Z', 'level': 'WARNING', 'service': 'db', 'http.status': '500'
+        })
+        self.assertEqual(parse_fields('<11>Jan  1 10:00:00 web1 cron: job done')['level'], 'ERROR')
+        self.assertEqual(parse_fields('level=debug service=db took 3ms'), {'level': 'DEBUG', 'service': 'db'})
+        self.assertEqual(parse_fields('plain text'), {})
+
+    def test_filters_are_built_from_arguments(self):
+        filters = field_filters([('field.level', 'err'), ('field.service', 'auth'), ('field.service', 'db'),
+                                 ('field.host!', 'web2'), ('keyword', 'x')])
+
+        self.assertEqual(filters, [('level', frozenset({'ERROR'}), False),
+                                   ('service', frozenset({'auth', 'db'}), False),
+                                   ('host', frozenset({'web2'}), True)])
+        with self.assertRaises(ValueError):
+            field_filters([('field.', 'x')])
+
+    def test_table_selects_rows_by_columns(self):
+        table = FieldTable()
+        offset = 0
+        for line in LINES:
+            table.append(offset, line.encode(), line)
+            offset += len(line) + 1
+        third = len(LINES[0]) + len(LINES[1]) + 2
+
+        self.assertEqual(table.select(field_filters([('field.level', 'ERROR')])), [0, third])
+        self.assertEqual(table.select(field_filters([('field.level', 'ERROR'), ('field.service', 'auth')])), [third])
+        self.assertEqual(table.select(field_filters([('field.level', 'FATAL')])), [])
+        self.assertEqual(len(table.select(field_filters([('field.service!', 'auth')]))), 3)
+        self.assertEqual(table.select([], since=parse_time('2026-01-01T10:00:02Z'),
+                                      until=parse_time('2026-01-01T10:00:02Z')), [third])
+
+    def test_columns_with_many_values_are_filtered(self):
+        table = FieldTable()
+        for number in range(300):
+            line = f'request={number}'
+            table.append(number, line.encode(), line)
+
+        self.assertEqual(table.batches[0].columns['request'].codes.typecode, 'I')
+        self.assertEqual(table.select(field_filters([('field.request', '299'), ('field.request', '3')])), [3, 299])
+        self.assertEqual(len(table.select(field_filters([('field.request!', '299')]))), 299)
+
+    def test_appended_lines_extend_cached_fields(self):
+        cache = FieldCache(1024 * 1024)
+        filters = field_filters([('field.level', 'ERROR')])
+        self.assertEqual(len(cache.search_file(self.file_path, filters)), 2)
+
+        with open(self.file_path, 'a') as f:
+            f.write('2026-01-01T10:00:04Z web2 auth[7]: ERROR locked user=carol\nlevel=error partial')
+        lines = cache.search_file(self.file_path, filters)
+
+        self.assertEqual(lines[2:], ['2026-01-01T10:00:04Z web2 auth[7]: ERROR locked user=carol',
+                                     'level=error partial'])
+        self.assertEqual((cache.misses, cache.extensions), (1, 1))
+
+        with patch('parser.fields.parse_fields') as parse:
+            cache.search_file(self.file_path, filters)
+        parse.assert_not_called()
+
+    def test_rewritten_file_is_parsed_again(self):
+        cache = FieldCache(1024 * 1024)
+        filters = field_filters([('field.level', 'ERROR')])
+        cache.search_file(self.file_path, filters)
+
+        with open(self.file_path, 'w') as f:
+            f.write('level=info replaced\n' * 10)
+
+        self.assertEqual(cache.search_file(self.file_path, filters), [])
+        self.assertEqual((cache.misses, cache.extensions), (2, 0))
+
+    def test_search_fields_in_directory(self):
+        with gzip.open(os.path.join(self.directory.name, 'app.log.1.gz'), 'wt') as f:
+            f.write('2025-12-31T23:59:59Z web1 auth[41]: ERROR disk full\n')
+
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            results = search_fields(field_filters([('field.program', 'auth'), ('field.level', 'ERROR')]))
+            self.assertEqual(results, {
+                self.file_path: [LINES[0]],
+                os.path.join(self.directory.name, 'app.log.1.gz'): ['2025-12-31T23:59:59Z web1 auth[41]: ERROR disk full'],
+            })
+            results = search_fields(field_filters([('field.level', 'ERROR')]), keyword='token')
+            self.assertEqual(results, {self.file_path: [LINES[2]]})
+            self.assertIn("ERROR", search_fields(field_filters([('field.level', 'FATAL')])))
+
+    def test_iter_search_fields_yields_file_by_file(self):
+        other_path = os.path.join(self.directory.name, 'other.log')
+        with open(other_path, 'w') as f:
+            f.write('level=error disk full\n')
+
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            records = iter_search_fields(field_filters([('field.level', 'ERROR')]))
+            first = next(records)
+            with patch('parser.search_logs.field_cache.search_file') as search_file:
+                rest = list(records)
+
+        self.assertEqual(first, (self.file_path, LINES[0]))
+        self.assertEqual(rest[0], (self.file_path, LINES[2]))
+        # The next file is only searched once the matches of the first one were consumed.
+        search_file.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser.file_catalog import FileCatalog, detect_kind
+
+
+class TestFileCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        os.mkdir(os.path.join(self.root, 'apt'))
+        self.write('syslog', b'plain ascii line\n')
+        self.write('apt/history.log', 'café line\n'.encode('utf-8'))
+        self.write('wtmp', b'\x00\x01\x02binary')
+        self.write('empty.log', b'')
+        with gzip.open(os.path.join(self.root, 'syslog.1.gz'), 'wb') as f:
+            f.write(b'old line\n')
+        self.age_directories()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data, mode='wb'):
+        with open(os.path.join(self.root, name), mode) as f:
+            f.write(data)
+
+    def age_directories(self):
+        # Directories modified within the last second are scanned again, so move them to the past.
+        for directory in (self.root, os.path.join(self.root, 'apt')):
+            os.utime(directory, (1, 1))
+
+    def test_detects_kinds(self):
+        kinds = {os.path.relpath(info.path, self.root): (info.kind, info.encoding)
+                 for info in FileCatalog(self.root).files()}
+
+        self.assertEqual(kinds, {
+            'syslog': ('text', 'ascii'),
+            'apt/history.log': ('text', 'utf-8'),
+            'wtmp': ('binary', None),
+            'empty.log': ('empty', None),
+            'syslog.1.gz': ('compressed', None),
+        })
+
+    def test_log_files_skips_binary_and_empty_files(self):
+        self.assertEqual(FileCatalog(self.root).log_files(), [
+            os.path.join(self.root, 'apt/history.log'),
+            os.path.join(self.root, 'syslog'),
+            os.path.join(self.root, 'syslog.1.gz'),
+        ])
+
+    def test_unchanged_directories_are_not_scanned_again(self):
+        catalog = FileCatalog(self.root)
+        catalog.files()
+        self.assertEqual(catalog.scans, 2)
+
+        catalog.files()
+        self.assertEqual(catalog.scans, 2)
+
+    def test_directory_change_invalidates_listing(self):
+        catalog = FileCatalog(self.root)
+        catalog.files()
+
+        self.write('new.log', b'new line\n')
+        self.assertIn(os.path.join(self.root, 'new.log'), catalog.log_files())
+        self.assertEqual(catalog.scans, 3)
+
+    def test_empty_file_is_picked_up_once_written(self):
+        catalog = FileCatalog(self.root)
+        catalog.files()
+
+        self.write('empty.log', b'first line\n', mode='ab')
+        self.assertIn(os.path.join(self.root, 'empty.log'), catalog.log_files())
+
+    def test_unreadable_file_is_picked_up_once_readable(self):
+        path = os.path.join(self.root, 'syslog')
+        catalog = FileCatalog(self.root)
+        with patch('parser.file_catalog.detect_kind', return_value=('unreadable', None)):
+            self.assertNotIn(path, catalog.log_files())
+
+        # Only the permissions change, which leaves the directory as it was.
+        os.chmod(path, 0o644)
+        self.assertIn(path, catalog.log_files())
+        self.assertEqual(catalog.scans, 2)
+
+    def test_fresh_files_have_current_size(self):
+        catalog = FileCatalog(self.root)
+        catalog.files()
+
+        self.write('syslog', b'appended\n', mode='ab')
+        sizes = {info.path: info.size for info in catalog.files(fresh=True)}
+        self.assertEqual(sizes[os.path.join(self.root, 'syslog')], len(b'plain ascii line\nappended\n'))
+
+    def test_detect_kind_unreadable(self):
+        self.assertEqual(detect_kind(os.path.join(self.root, 'missing.log'), 10), ('unreadable', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
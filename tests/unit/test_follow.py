@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import follow as follow_module
+from parser.follow import follow, subscribe, unsubscribe
+
+
+def next_event(follower, timeout=5):
+    return follower.events.get(timeout=timeout)
+
+
+def lines_of(event):
+    return [json.loads(line[len('data: '):])["line"] for line in event.splitlines() if line.startswith('data: ')]
+
+
+class TestFollow(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'syslog')
+        with open(self.file_path, 'w') as f:
+            f.write('existing line\n')
+        self.environ = patch.dict(os.environ, {'FOLLOW_POLL_INTERVAL': '0.05'})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.directory.cleanup()
+
+    def append(self, text):
+        with open(self.file_path, 'a') as f:
+            f.write(text)
+
+    def test_follow_sends_appended_lines(self):
+        follower = subscribe(self.file_path)
+        try:
+            self.append('new 1\nnew 2\npartial')
+            self.assertEqual(lines_of(next_event(follower)), ['new 1', 'new 2'])
+
+            self.append(' line\n')
+            self.assertEqual(lines_of(next_event(follower)), ['partial line'])
+        finally:
+            unsubscribe(follower)
+
+    def test_followers_share_one_watcher(self):
+        followers = [subscribe(self.file_path) for _ in range(50)]
+        try:
+            watcher = followers[0].watcher
+            self.assertTrue(all(follower.watcher is watcher for follower in followers))
+
+            self.append('shared\n')
+            for follower in followers:
+                self.assertEqual(lines_of(next_event(follower)), ['shared'])
+            self.assertEqual(watcher.reads, 1)
+        finally:
+            for follower in followers:
+                unsubscribe(follower)
+
+        self.assertTrue(watcher.stopped.is_set())
+        self.assertNotIn(watcher.file_path, follow_module._watchers)
+
+    def test_follow_detects_truncation(self):
+        follower = subscribe(self.file_path)
+        try:
+            with open(self.file_path, 'w') as f:
+                f.write('')
+            self.assertEqual(next_event(follower), f'event: truncated\ndata: {json.dumps({"file": self.file_path})}\n\n')
+
+            self.append('after truncation\n')
+            self.assertEqual(lines_of(next_event(follower)), ['after truncation'])
+        finally:
+            unsubscribe(follower)
+
+    def test_follow_detects_rotation(self):
+        follower = subscribe(self.file_path)
+        try:
+            self.append('before rotation\n')
+            self.assertEqual(lines_of(next_event(follower)), ['before rotation'])
+
+            os.rename(self.file_path, self.file_path + '.1')
+            with open(self.file_path, 'w') as f:
+                f.write('after rotation\n')
+
+            events = [next_event(follower), next_event(follower)]
+            self.assertTrue(events[0].startswith('event: rotated\n'))
+            self.assertEqual(lines_of(events[1]), ['after rotation'])
+        finally:
+            unsubscribe(follower)
+
+    @patch.dict(os.environ, {'FOLLOW_INOTIFY': '0'})
+    def test_follow_polls_without_inotify(self):
+        follower = subscribe(self.file_path)
+        try:
+            self.assertFalse(follower.watcher.uses_inotify)
+            self.append('polled\n')
+            self.assertEqual(lines_of(next_event(follower)), ['polled'])
+        finally:
+            unsubscribe(follower)
+
+    def test_follow_generator(self):
+        events = follow(self.file_path)
+        self.assertTrue(next(events).startswith(': following '))
+
+        self.append('streamed\n')
+        self.assertEqual(lines_of(next(events)), ['streamed'])
+        watcher = next(iter(follow_module._watchers.values()))
+
+        events.close()
+        self.assertTrue(watcher.stopped.is_set())
+
+    def test_follow_missing_file(self):
+        with self.assertRaises(OSError):
+            next(follow(os.path.join(self.directory.name, 'missing.log')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import read_log_lines
+from parser.line_index import LineIndexCache
+
+
+class TestLineIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'app.log')
+        with open(self.file_path, 'w') as f:
+            f.write('line 1\n\nline 3\nline 4')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lines_are_read_by_number(self):
+        cache = LineIndexCache(1024 * 1024)
+
+        self.assertEqual(cache.read_lines(self.file_path, 2, 2), (['', 'line 3'], 4))
+        self.assertEqual(cache.read_lines(self.file_path, 3, 10), (['line 3', 'line 4'], 4))
+        self.assertEqual(cache.read_lines(self.file_path, 5, 1), ([], 4))
+        self.assertEqual(list(cache.index(self.file_path).ends), [7, 8, 15])
+
+    def test_index_is_built_over_several_chunks(self):
+        with open(self.file_path, 'w') as f:
+            f.writelines(f'entry {number}\n' for number in range(1, 1001))
+        cache = LineIndexCache(1024 * 1024)
+
+        with patch('parser.line_index.INDEX_CHUNK_SIZE', 100):
+            lines, total = cache.read_lines(self.file_path, 500, 2)
+
+        self.assertEqual((lines, total), (['entry 500', 'entry 501'], 1000))
+        self.assertEqual(cache.stats()["bytes"], 8 * 1000 + 200)
+
+    def test_appended_lines_extend_index(self):
+        cache = LineIndexCache(1024 * 1024)
+        previous = cache.index(self.file_path)
+
+        with open(self.file_path, 'a') as f:
+            f.write(' continued\nline 5\n')
+        lines, total = cache.read_lines(self.file_path, 4, 2)
+
+        self.assertEqual((lines, total), (['line 4 continued', 'line 5'], 5))
+        self.assertEqual((cache.misses, cache.extensions), (1, 1))
+        # The offsets are added to the array of the previous index instead of a copy of it,
+        # and the previous index still describes the file as it was.
+        self.assertIs(cache.index(self.file_path).ends, previous.ends)
+        self.assertEqual((previous.line_count, previous.span(2, 2)), (4, (8, 21)))
+
+    def test_rewritten_file_is_indexed_again(self):
+        cache = LineIndexCache(1024 * 1024)
+        cache.index(self.file_path)
+
+        with open(self.file_path, 'w') as f:
+            f.write('other 1\nother 2\nother 3\nother 4\n')
+        lines, total = cache.read_lines(self.file_path, 1, 1)
+
+        self.assertEqual((lines, total), (['other 1'], 4))
+        self.assertEqual((cache.misses, cache.extensions), (2, 0))
+
+    def test_least_recently_used_index_is_evicted(self):
+        other_path = os.path.join(self.directory.name, 'other.log')
+        with open(other_path, 'w') as f:
+            f.write('a\nb\n')
+        cache = LineIndexCache(400)
+
+        cache.index(self.file_path)
+        cache.index(other_path)
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        cache.index(other_path)
+        self.assertEqual(cache.hits, 1)
+
+    def test_read_log_lines(self):
+        compressed_path = os.path.join(self.directory.name, 'app.log.2.gz')
+        with gzip.open(compressed_path, 'wt') as f:
+            f.write('old\n')
+
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            self.assertEqual(read_log_lines('app.log', 4, 1), {self.file_path: ['line 4'], "LINES": 4})
+            self.assertIn("ERROR", read_log_lines('app.log.2.gz', 1, 1))
+            self.assertEqual(read_log_lines('missing.log', 1, 1), "File 'missing.log' not found.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import gzip
+import os
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+from parser.log_readers import (compression_of, decompress_lines, decompression_pool, rotation_set, iter_reverse_lines,
+                                run_decompression, search_compressed, REVERSE_PAGE_LINES)
+from parser import read_n_log_entries
+from parser.timestamps import parse_time
+
+
+class TestLogReaders(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'syslog')
+        with open(self.file_path, 'w') as f:
+            f.write('new 1\nnew 2\n')
+        with open(self.file_path + '.1', 'w') as f:
+            f.write('mid 1\nmid 2\n')
+        with gzip.open(self.file_path + '.2.gz', 'wt') as f:
+            f.write('old 1\nold 2\n')
+        with open(self.file_path + '.bak', 'w') as f:
+            f.write('not part of the rotation set\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_compression_of(self):
+        self.assertEqual(compression_of('/var/log/syslog.2.gz'), '.gz')
+        self.assertEqual(compression_of('/var/log/syslog.3.bz2'), '.bz2')
+        self.assertIsNone(compression_of('/var/log/syslog.1'))
+
+    def test_rotation_set_is_newest_first(self):
+        self.assertEqual(rotation_set(self.file_path), [
+            self.file_path, self.file_path + '.1', self.file_path + '.2.gz'
+        ])
+
+    def test_decompress_lines(self):
+        self.assertEqual(decompress_lines(self.file_path + '.2.gz'), (0, ['old 1', 'old 2', '']))
+        self.assertEqual(decompress_lines(self.file_path + '.2.gz', end=2, n_lines=1), (1, ['old 2']))
+        self.assertEqual(search_compressed(self.file_path + '.2.gz', '2'), ['old 2'])
+
+    def test_decompress_lines_streams_in_chunks(self):
+        file_path = os.path.join(self.directory.name, 'big.log.gz')
+        with gzip.open(file_path, 'wb') as f:
+            f.write(b''.join(b'2026-01-01T10:%02d:%02dZ line %d\n' % (i // 60, i % 60, i) for i in range(100)))
+            f.write(b'2026-01-01T10:02:00Z bad \xff byte\n')
+
+        with patch('parser.log_readers.DECOMPRESS_CHUNK_SIZE', 64), \
+                patch.dict(os.environ, {'DECODE_ERRORS': 'skip'}):
+            first, lines = decompress_lines(file_path, n_lines=3)
+            self.assertEqual((first, lines), (99, ['2026-01-01T10:01:39Z line 99', None, '']))
+
+            first, lines = decompress_lines(file_path, since=parse_time('2026-01-01T10:00:58Z'),
+                                            until=parse_time('2026-01-01T10:00:59Z'))
+            self.assertEqual((first, lines), (0, ['2026-01-01T10:00:58Z line 58', '2026-01-01T10:00:59Z line 59']))
+
+    @patch('parser.log_readers.run_decompression', side_effect=lambda function, *args: function(*args))
+    def test_iter_reverse_lines_of_compressed_file(self, mock_run):
+
+        result = list(iter_reverse_lines(self.file_path + '.2.gz'))
+
+        self.assertEqual(result, [(2, ''), (1, 'old 2'), (0, 'old 1')])
+
+    @patch('parser.log_readers.run_decompression', side_effect=lambda function, *args: function(*args))
+    def test_iter_reverse_lines_of_whole_compressed_file(self, mock_run):
+        file_path = os.path.join(self.directory.name, 'big.log.gz')
+        with gzip.open(file_path, 'wt') as f:
+            f.write(''.join(f'line {i}\n' for i in range(3 * REVERSE_PAGE_LINES)))
+
+        whole = list(iter_reverse_lines(file_path, whole=True))
+
+        # The file is decompressed once rather than once per page, with the same positions.
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(whole, list(iter_reverse_lines(file_path)))
+        self.assertEqual(whole[:2], [(3 * REVERSE_PAGE_LINES, ''), (3 * REVERSE_PAGE_LINES - 1, f'line {3 * REVERSE_PAGE_LINES - 1}')])
+
+    def test_decompression_pool_is_replaced_after_worker_dies(self):
+        broken = decompression_pool()
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+
+        self.assertEqual(run_decompression(search_compressed, self.file_path + '.2.gz', '2'), ['old 2'])
+        self.assertIsNot(decompression_pool(), broken)
+
+    def test_read_n_log_entries_crosses_rotations(self):
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            result = read_n_log_entries('syslog', 5)
+
+        self.assertEqual(result, {self.file_path: ['new 2', 'new 1', 'mid 2', 'mid 1', 'old 2']})
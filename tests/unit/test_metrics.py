@@ -0,0 +1,110 @@
+import contextvars
+import io
+import os
+import tempfile
+import unittest
+
+from parser import metrics
+from parser.byte_search import iter_matching_lines, keyword_finder
+from parser.parse_logs import read_single_file
+from parser.reverse_reader import reverse_lines
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = list(metrics._registry)
+
+    def tearDown(self):
+        metrics._registry[:] = self.registry
+        metrics.stop_scan()
+
+    def test_counter_renders_labels(self):
+        counter = metrics.Counter('test_reads_total', 'Reads.', ('route',))
+        counter.inc(2, ('/search',))
+        counter.inc(labels=('/search',))
+        counter.inc(labels=('say "hi"\n',))
+
+        self.assertEqual(counter.render(), [
+            '# HELP test_reads_total Reads.',
+            '# TYPE test_reads_total counter',
+            'test_reads_total{route="/search"} 3',
+            'test_reads_total{route="say \\"hi\\"\\n"} 1',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.render()[2:], [
+            'test_latency_seconds_bucket{le="0.1"} 2',
+            'test_latency_seconds_bucket{le="1"} 3',
+            'test_latency_seconds_bucket{le="+Inf"} 4',
+            'test_latency_seconds_count 4',
+            'test_latency_seconds_sum 2.65',
+        ])
+
+    def test_gauge_collects_values(self):
+        gauge = metrics.Gauge('test_queue_depth', 'Depth.', ('executor',), collect=lambda: [(('pool',), 3)])
+        self.assertIn('test_queue_depth{executor="pool"} 3', gauge.render())
+
+    def test_render_includes_registered_metrics(self):
+        text = metrics.render()
+        self.assertIn('# TYPE logserver_http_request_duration_seconds histogram', text)
+        self.assertIn('# TYPE logserver_bytes_scanned_total counter', text)
+
+    def test_reads_are_recorded_for_the_current_request(self):
+        data = b'first line\nsecond line\nthird line\n'
+        scan = metrics.start_scan()
+
+        self.assertEqual(len(list(reverse_lines(io.BytesIO(data)))), 4)
+        self.assertEqual((scan.bytes, scan.lines), (len(data), 4))
+
+        self.assertEqual(list(iter_matching_lines(io.BytesIO(data), keyword_finder('second'))), ['second line'])
+        self.assertEqual((scan.bytes, scan.lines), (2 * len(data), 5))
+
+    def test_reads_without_a_request_are_not_recorded(self):
+        scan = metrics.start_scan()
+        metrics.stop_scan()
+        list(reverse_lines(io.BytesIO(b'line\n')))
+        self.assertEqual(scan.bytes, 0)
+
+    def test_reads_in_a_copied_context_are_recorded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'syslog')
+            with open(file_path, 'w') as f:
+                f.write('entry\n')
+
+            scan = metrics.start_scan()
+            contextvars.copy_context().run(read_single_file, file_path, {})
+            self.assertEqual((scan.files, scan.bytes), (1, 6))
+
+    def test_executor_queue_depth(self):
+        class Pool:
+            _pending_work_items = {1: None, 2: None, 3: None}
+            _max_workers = 1
+
+        metrics.register_executor('test', lambda: Pool())
+        try:
+            self.assertIn('logserver_executor_queue_depth{executor="test"} 2', metrics.EXECUTOR_QUEUE_DEPTH.render())
+        finally:
+            del metrics._executors['test']
+
+    def test_cache_stats(self):
+        metrics.register_cache('test', lambda: {"hits": 3, "misses": 1, "extensions": 2, "entries": 4, "bytes": 512})
+        try:
+            lookups = metrics.CACHE_LOOKUPS.render()
+            self.assertIn('logserver_cache_lookups{cache="test",result="hit"} 3', lookups)
+            self.assertIn('logserver_cache_lookups{cache="test",result="extension"} 2', lookups)
+            self.assertIn('logserver_cache_entries{cache="test"} 4', metrics.CACHE_ENTRIES.render())
+            self.assertIn('logserver_cache_bytes{cache="test"} 512', metrics.CACHE_BYTES.render())
+        finally:
+            del metrics._caches['test']
+
+    def test_caches_are_registered(self):
+        self.assertTrue({'tail', 'search', 'line_index', 'fields'} <= set(metrics._caches))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+from parser.parallel_scan import split_ranges, scan_range, parallel_search_file, scan_pool
+from parser import search_in_file
+
+
+class TestParallelScan(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'big.log')
+        self.lines = [f'line {i} {"match" if i % 7 == 0 else "other"}' for i in range(500)]
+        with open(self.file_path, 'w') as f:
+            f.write('\n'.join(self.lines) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_split_ranges_are_newline_aligned(self):
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+
+        ranges = split_ranges(self.file_path, 7)
+
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(content))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[start - 1:start], b'\n')
+
+    def test_ranges_cover_every_line_once(self):
+        found = []
+        for start, end in split_ranges(self.file_path, 5):
+            found.extend(scan_range(self.file_path, start, end, 'line'))
+
+        self.assertEqual(found, self.lines)
+
+    def test_parallel_search_matches_in_file_order(self):
+        expected = [line for line in self.lines if 'match' in line]
+
+        self.assertEqual(parallel_search_file(self.file_path, 'match', workers=3), expected)
+
+    def test_parallel_search_replaces_pool_after_worker_dies(self):
+        broken = scan_pool()
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+
+        found = parallel_search_file(self.file_path, 'match', workers=2)
+
+        self.assertEqual(found, [line for line in self.lines if 'match' in line])
+        self.assertIsNot(scan_pool(), broken)
+
+    def test_search_in_file_uses_parallel_scan_for_large_files(self):
+        results = {}
+        with patch.dict(os.environ, {'PARALLEL_SCAN_THRESHOLD': '1024', 'PARALLEL_SCAN_WORKERS': '2'}):
+            search_in_file(self.file_path, 'match', results)
+
+        self.assertEqual(results[self.file_path], [line for line in self.lines if 'match' in line])
@@ -1,22 +1,22 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 
-from parser import read_single_file, read_n_log_entries, read_all_log_files
+from parser import read_single_file, read_n_log_entries, read_all_log_files, iter_all_log_entries, read_log_page
 
 class TestParseLogs(unittest.TestCase):
 
     @patch('os.environ.get')
-    @patch('os.walk')
+    @patch('parser.file_catalog.FileCatalog.log_files')
     @patch('builtins.open', new_callable=mock_open)
-    def test_read_all_log_files_success(self, mock_open_fn, mock_os_walk, mock_environ):
+    def test_read_all_log_files_success(self, mock_open_fn, mock_log_files, mock_environ):
         
         # Mock the return values
         file_content = b'This is a log line.\nAnother log line.\nFinal log line.\n'
         current_position = len(file_content)
         mock_environ.return_value = '/mock/log/directory'
-        mock_os_walk.return_value = [
-            ('/mock/log/directory', [], ['log1.txt', 'log2.txt']),
-        ]
+        mock_log_files.return_value = ['/mock/log/directory/log1.txt', '/mock/log/directory/log2.txt']
         mock_file_handle = mock_open_fn.return_value
         mock_file_handle.seek = MagicMock()
         mock_file_handle.tell = MagicMock(return_value=len(file_content))
@@ -149,4 +149,86 @@ class TestParseLogs(unittest.TestCase):
         # Assertions
         mock_open_fn.assert_called()
         self.assertEqual(len(result), 1)
-        self.assertEqual(result["ERROR"], "There were no entries in /var/log/empty_log.txt.")
\ No newline at end of file
+        self.assertEqual(result["ERROR"], "There were no entries in /var/log/empty_log.txt.")
+
+    @patch('os.environ.get')
+    @patch('parser.file_catalog.FileCatalog.log_files')
+    @patch('parser.parse_logs._read_log_lines')
+    def test_iter_all_log_entries(self, mock_read_lines, mock_log_files, mock_environ):
+
+        # Mock the return values
+        mock_environ.return_value = '/mock/log/directory'
+        mock_log_files.return_value = ['/mock/log/directory/log1.txt', '/mock/log/directory/log2.txt']
+        mock_read_lines.side_effect = lambda file_path, *window: iter(['Final log line.', '', 'First log line.'])
+
+        result = list(iter_all_log_entries())
+
+        # Assertions
+        self.assertEqual(result, [
+            ('/mock/log/directory/log1.txt', 'Final log line.'),
+            ('/mock/log/directory/log1.txt', 'First log line.'),
+            ('/mock/log/directory/log2.txt', 'Final log line.'),
+            ('/mock/log/directory/log2.txt', 'First log line.'),
+        ])
+
+
+    def test_read_log_page_with_cursor(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            file_path = os.path.join(log_directory, 'file.log')
+            with open(file_path, 'w') as f:
+                f.write('line 1\nline 2\nline 3\nline 4\nline 5\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                first_page = read_log_page('file.log', 2)
+                second_page = read_log_page('file.log', 2, first_page['CURSOR'])
+                last_page = read_log_page('file.log', 2, second_page['CURSOR'])
+
+        self.assertEqual(first_page[file_path], ['line 5', 'line 4'])
+        self.assertEqual(second_page[file_path], ['line 3', 'line 2'])
+        self.assertEqual(last_page, {file_path: ['line 1']})
+
+    def test_read_log_page_decodes_invalid_utf8(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            file_path = os.path.join(log_directory, 'file.log')
+            with open(file_path, 'wb') as f:
+                f.write(b'2026-01-01T10:00:00Z line 1\n2026-01-01T10:00:01Z bad \xff\xfe\n2026-01-01T10:00:02Z line 3\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                first_page = read_log_page('file.log', 2)
+                second_page = read_log_page('file.log', 2, first_page['CURSOR'])
+                windowed = read_log_page('file.log', 5, since=0)
+
+        self.assertEqual(first_page[file_path], ['2026-01-01T10:00:02Z line 3', '2026-01-01T10:00:01Z bad \ufffd\ufffd'])
+        self.assertEqual(second_page, {file_path: ['2026-01-01T10:00:00Z line 1']})
+        self.assertEqual(windowed[file_path][1], '2026-01-01T10:00:01Z bad \ufffd\ufffd')
+
+    def test_read_log_page_rotation_removed(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            file_path = os.path.join(log_directory, 'file.log')
+            with open(file_path, 'w') as f:
+                f.write('line 3\n')
+            with open(file_path + '.1', 'w') as f:
+                f.write('line 1\nline 2\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                first_page = read_log_page('file.log', 2)
+                # The rotation is removed after the rotation set was listed.
+                with patch('parser.parse_logs.rotation_set', return_value=[file_path, file_path + '.1']):
+                    os.remove(file_path + '.1')
+                    result = read_log_page('file.log', 2, first_page['CURSOR'])
+
+        self.assertEqual(result, {"ERROR": f"Invalid or expired cursor for {file_path}."})
+
+    def test_read_log_page_truncated_file(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            file_path = os.path.join(log_directory, 'file.log')
+            with open(file_path, 'w') as f:
+                f.write('line 1\nline 2\nline 3\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                first_page = read_log_page('file.log', 1)
+                with open(file_path, 'w') as f:
+                    f.write('new\n')
+                result = read_log_page('file.log', 1, first_page['CURSOR'])
+
+        self.assertIn("ERROR", result)
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from parser import metrics, profiling
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.stop_scan()
+        profiling._profiles.clear()
+
+    @patch.dict(os.environ, {'PROFILE_TOKEN': 'secret'})
+    def test_authorized(self):
+        self.assertTrue(profiling.authorized('secret'))
+        self.assertFalse(profiling.authorized('wrong'))
+        self.assertFalse(profiling.authorized(None))
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_profiling_is_disabled_without_token(self):
+        self.assertFalse(profiling.authorized(''))
+        self.assertFalse(profiling.authorized('secret'))
+
+    def test_server_timing(self):
+        scan = metrics.start_scan()
+        metrics.record_phase('read', 0.012)
+        metrics.record_phase('walk', 0.001)
+        metrics.record_phase('read', 0.003)
+
+        self.assertEqual(profiling.server_timing(scan, 0.02), 'walk;dur=1.0, read;dur=15.0, total;dur=20.0')
+
+    def test_threads_without_the_request_context_are_not_recorded(self):
+        scan = metrics.start_scan()
+        threads = [threading.Thread(target=metrics.record_scan, args=(10,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual((scan.bytes, len(scan.threads)), (0, 1))
+
+    def test_sampling_profiler_samples_request_threads(self):
+        scan = metrics.start_scan()
+        profiler = profiling.SamplingProfiler(scan, interval=0.001)
+        profiler.start()
+        busy_wait(0.1)
+        stacks = profiler.stop()
+
+        self.assertIn('busy_wait (test_profiling.py', stacks)
+        stack, count = stacks.splitlines()[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+    def test_deterministic_profiler(self):
+        profiler = profiling.DeterministicProfiler()
+        profiler.start()
+        busy_wait(0.01)
+        self.assertIn('busy_wait', profiler.stop())
+
+    def test_deterministic_profiler_runs_one_at_a_time(self):
+        first = profiling.DeterministicProfiler()
+        first.start()
+        with self.assertRaises(RuntimeError):
+            profiling.DeterministicProfiler().start()
+        first.stop()
+
+        second = profiling.DeterministicProfiler()
+        second.start()
+        second.stop()
+
+    @patch.dict(os.environ, {'PROFILE_TOKEN': 'secret'})
+    def test_concurrent_cprofile_requests(self):
+        from parser.log_server import app
+        client = app.test_client()
+        headers = {'X-Profile-Token': 'secret'}
+        running = profiling.RequestProfile('cprofile', metrics.start_scan(), '/search')
+        metrics.stop_scan()
+
+        busy = client.get('/?profile=cprofile', headers=headers)
+        busy.close()
+        running.finish()
+        served = client.get('/?profile=cprofile', headers=headers)
+        # The profile is finished once the response is closed.
+        served.close()
+
+        self.assertEqual(busy.status_code, 409)
+        self.assertEqual(served.status_code, 200)
+        self.assertIn('X-Profile-Id', served.headers)
+
+    @patch.dict(os.environ, {'PROFILE_KEEP': '2'})
+    def test_profiles_are_stored_up_to_limit(self):
+        scan = metrics.start_scan()
+        ids = []
+        for _ in range(3):
+            profile = profiling.RequestProfile('cprofile', scan, '/search')
+            metrics.record_phase('match', 0.002)
+            profile.finish()
+            ids.append(profile.id)
+
+        self.assertIsNone(profiling.get_profile(ids[0]))
+        stored = profiling.get_profile(ids[2])
+        self.assertEqual((stored["mode"], stored["path"]), ('cprofile', '/search'))
+        self.assertEqual([profile["id"] for profile in profiling.list_profiles()], ids[1:])
+        self.assertNotIn('profile', profiling.list_profiles()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import pickle
+import unittest
+
+from parser.query import Query
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_single_keyword(self):
+        query = Query('error')
+
+        self.assertTrue(query.matches('an error happened'))
+        self.assertFalse(query.matches('all good'))
+
+    def test_boolean_operators(self):
+        query = Query('a AND b NOT c')
+
+        self.assertTrue(query.matches('a b'))
+        self.assertFalse(query.matches('a b c'))
+        self.assertFalse(query.matches('a'))
+
+    def test_or_and_parentheses(self):
+        query = Query('(timeout OR refused) "db pool"')
+
+        self.assertTrue(query.matches('connection refused by db pool'))
+        self.assertFalse(query.matches('connection refused'))
+        self.assertFalse(query.matches('db pool ok'))
+
+    def test_regex_terms_and_paths(self):
+        self.assertTrue(Query('/retry \\d+/').matches('retry 3 of 5'))
+        self.assertTrue(Query('/var/log').matches('wrote /var/log/syslog'))
+        self.assertTrue(Query('err(or)?s?$', regex=True).matches('3 errors'))
+
+    def test_not_only_query_has_no_prefilter(self):
+        query = Query('NOT debug')
+
+        self.assertIsNone(query.prefilter)
+        self.assertTrue(query.matches('info line'))
+        self.assertFalse(query.matches('debug line'))
+
+    def test_multiple_literals_share_one_prefilter(self):
+        query = Query('alpha OR beta OR gamma')
+
+        self.assertEqual(query.prefilter.pattern, 'alpha|beta|gamma')
+        self.assertEqual(query.stats()["patterns"], 3)
+
+    def test_invalid_queries(self):
+        for text in ['', 'a AND', '(a OR b', 'a )']:
+            with self.assertRaises(ValueError):
+                Query(text)
+        with self.assertRaises(ValueError):
+            Query('(unclosed', regex=True)
+
+    def test_query_can_be_pickled(self):
+        query = pickle.loads(pickle.dumps(Query('a NOT /b+/')))
+
+        self.assertTrue(query.matches('a'))
+        self.assertFalse(query.matches('a bb'))
@@ -1,12 +1,14 @@
+import time
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 import requests
+from concurrent.futures import Future
 
-from parser import make_remote_call
+from parser import make_remote_call, iter_remote_call
 
 class TestRemoteLogRequests(unittest.TestCase):
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remote_call(self, mock_get):
         mock_response = mock_get.return_value
         mock_response.status_code = 200
@@ -18,9 +20,9 @@ class TestRemoteLogRequests(unittest.TestCase):
             }
         })
 
-        self.assertEqual(result, {"http://test.com": {'data': 'mocked data'}})
+        self.assertEqual(result["http://test.com"], {'data': 'mocked data'})
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remote_call_single_file(self, mock_get):
         mock_response = mock_get.return_value
         mock_response.status_code = 200
@@ -33,9 +35,9 @@ class TestRemoteLogRequests(unittest.TestCase):
             }
             
         })
-        self.assertEqual(result, {"http://test.com": {'data': 'mocked data'}})
+        self.assertEqual(result["http://test.com"], {'data': 'mocked data'})
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remote_call_search(self, mock_get):
         mock_response = mock_get.return_value
         mock_response.status_code = 200
@@ -47,9 +49,9 @@ class TestRemoteLogRequests(unittest.TestCase):
                 "keyword": "mocked"
             }
         })
-        self.assertEqual(result, {"http://test.com": {'data': 'mocked data'}})
+        self.assertEqual(result["http://test.com"], {'data': 'mocked data'})
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remote_call_entries(self, mock_get):
         mock_response = mock_get.return_value
         mock_response.status_code = 200
@@ -62,7 +64,7 @@ class TestRemoteLogRequests(unittest.TestCase):
                 "entries": 10
             }
         })
-        self.assertEqual(result, {"http://test.com": {'data': 'mocked data'}})
+        self.assertEqual(result["http://test.com"], {'data': 'mocked data'})
 
 
     def test_remote_call_invalid_action(self):
@@ -84,7 +86,7 @@ class TestRemoteLogRequests(unittest.TestCase):
         })
         self.assertEqual(result["http://test.com"], {'ERROR': "Invalid parameters for entries."})
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remote_call_entries(self, mock_get):
         mock_response = mock_get.return_value
         mock_response.status_code = 400
@@ -98,4 +100,167 @@ class TestRemoteLogRequests(unittest.TestCase):
             }
         })
         self.assertEqual(result["http://test.com"], {'ERROR':"Remote host (http://test.com) returned status 400"})
-        
\ No newline at end of file
+        
+
+    @patch('requests.Session.get')
+    def test_remote_call_status(self, mock_get):
+        mock_response = mock_get.return_value
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'data': 'mocked data'}
+
+        result = make_remote_call({"test.com": {"action": "logs"}})
+
+        status = result["STATUS"]["http://test.com"]
+        self.assertEqual(status["status"], 200)
+        self.assertFalse(status["hedged"])
+        self.assertGreaterEqual(status["latency_ms"], 0)
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], 10)
+
+    @patch('requests.Session.get')
+    def test_remote_call_connection_error(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError("refused")
+
+        result = make_remote_call({"test.com": {"action": "logs"}})
+
+        self.assertIn("could not be reached", result["http://test.com"]["ERROR"])
+        self.assertEqual(result["STATUS"]["http://test.com"]["status"], "error")
+
+    @patch('requests.Session.get')
+    def test_remote_call_deadline_returns_partial_results(self, mock_get):
+        def get(url, timeout):
+            if "slow.com" in url:
+                time.sleep(0.5)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {'data': url}
+            return response
+        mock_get.side_effect = get
+
+        result = make_remote_call({
+            "fast.com": {"action": "logs"},
+            "slow.com": {"action": "logs"}
+        }, deadline_ms=100)
+
+        self.assertEqual(result["http://fast.com"], {'data': 'http://fast.com/logs'})
+        self.assertIn("did not respond within 100 ms", result["http://slow.com"]["ERROR"])
+        self.assertEqual(result["STATUS"]["http://slow.com"]["status"], "timeout")
+
+    @patch('requests.Session.get')
+    def test_remote_call_late_host_does_not_change_result(self, mock_get):
+        def get(url, timeout):
+            time.sleep(0.3)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {'data': url}
+            return response
+        mock_get.side_effect = get
+
+        result = make_remote_call({"slow.com": {"action": "logs"}}, deadline_ms=50)
+        time.sleep(0.5)
+
+        self.assertIn("did not respond within 50 ms", result["http://slow.com"]["ERROR"])
+        self.assertEqual(result["STATUS"]["http://slow.com"]["status"], "timeout")
+
+    @patch('parser.remote_logs._executor')
+    def test_remote_call_cancels_hosts_past_deadline(self, mock_executor):
+        queued = Future()
+        mock_executor.submit.return_value = queued
+
+        make_remote_call({"queued.com": {"action": "logs"}}, deadline_ms=10)
+
+        self.assertTrue(queued.cancelled())
+
+    @patch('requests.Session.get')
+    def test_remote_call_hedged(self, mock_get):
+        calls = []
+        def get(url, timeout):
+            calls.append(url)
+            # The first request is slow, the hedged one answers right away.
+            if len(calls) == 1:
+                time.sleep(0.5)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {'data': len(calls)}
+            return response
+        mock_get.side_effect = get
+
+        result = make_remote_call({"test.com": {"action": "logs"}}, hedge_ms=50)
+
+        self.assertEqual(result["http://test.com"], {'data': 2})
+        self.assertTrue(result["STATUS"]["http://test.com"]["hedged"])
+
+    @patch('requests.Session.get')
+    def test_iter_remote_call_forwards_streamed_lines(self, mock_get):
+        mock_response = mock_get.return_value
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/x-ndjson"}
+        mock_response.iter_lines.return_value = [
+            b'{"file": "/var/log/a.log", "line": "first"}',
+            b'{"file": "/var/log/a.log", "line": "second"}'
+        ]
+
+        records = list(iter_remote_call({"test.com": {"action": "logs"}}))
+
+        self.assertEqual(records[:2], [
+            {"file": "/var/log/a.log", "line": "first", "host": "http://test.com"},
+            {"file": "/var/log/a.log", "line": "second", "host": "http://test.com"}
+        ])
+        self.assertEqual(records[2]["STATUS"]["status"], 200)
+        self.assertEqual(mock_get.call_args.kwargs["stream"], True)
+        self.assertIn("application/x-ndjson", mock_get.call_args.kwargs["headers"]["Accept"])
+
+    @patch('requests.Session.get')
+    def test_iter_remote_call_invalid_record(self, mock_get):
+        mock_response = mock_get.return_value
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "application/x-ndjson"}
+        mock_response.iter_lines.return_value = [
+            b'{"file": "/var/log/a.log", "line": "first"}',
+            b'["not", "an", "object"]',
+            b'{"file": "/var/log/a.log", "line": "never sent"}'
+        ]
+
+        started = time.monotonic()
+        records = list(iter_remote_call({"test.com": {"action": "logs"}}, deadline_ms=5000))
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(records[0]["line"], "first")
+        self.assertIn("invalid record", records[1]["ERROR"])
+        self.assertEqual(records[2], {"host": "http://test.com", "STATUS": records[2]["STATUS"]})
+        self.assertEqual(records[2]["STATUS"]["status"], "error")
+
+    @patch('requests.Session.get')
+    def test_iter_remote_call_in_completion_order(self, mock_get):
+        def get(url, timeout, **kwargs):
+            if "slow.com" in url:
+                time.sleep(0.3)
+            response = MagicMock(status_code=200, headers={"Content-Type": "application/json"})
+            response.json.return_value = {'data': url}
+            return response
+        mock_get.side_effect = get
+
+        records = list(iter_remote_call({
+            "slow.com": {"action": "logs"},
+            "fast.com": {"action": "logs"}
+        }))
+
+        self.assertEqual(records[0], {"result": {'data': 'http://fast.com/logs'}, "host": "http://fast.com"})
+        self.assertEqual([record["host"] for record in records if "STATUS" in record],
+                         ["http://fast.com", "http://slow.com"])
+
+    @patch('requests.Session.get')
+    def test_iter_remote_call_deadline(self, mock_get):
+        def get(url, timeout, **kwargs):
+            time.sleep(0.5)
+            return MagicMock(status_code=200)
+        mock_get.side_effect = get
+
+        records = list(iter_remote_call({"slow.com": {"action": "logs"}}, deadline_ms=50))
+
+        self.assertEqual(records, [
+            {"host": "http://slow.com", "ERROR": "Remote host (http://slow.com) did not respond within 50 ms"},
+            {"host": "http://slow.com", "STATUS": {"status": "timeout", "latency_ms": 50.0, "hedged": False}}
+        ])
+
+    def test_iter_remote_call_invalid_action(self):
+        records = list(iter_remote_call({"test.com": {"action": "invalid_action"}}))
+
+        self.assertEqual(records[0], {"ERROR": "Unknown action invalid_action", "host": "http://test.com"})
+        self.assertEqual(records[1]["STATUS"]["status"], "invalid")
@@ -0,0 +1,35 @@
+import io
+import unittest
+from unittest.mock import patch
+
+from parser.reverse_reader import reverse_line_spans, reverse_lines
+
+
+class TestReverseReader(unittest.TestCase):
+
+    def test_reverse_lines_matches_split(self):
+        content = b'first line\nsecond line\n\nfourth line\nlast line without newline'
+        result = list(reverse_lines(io.BytesIO(content)))
+
+        self.assertEqual(result, [line.decode() for line in reversed(content.split(b'\n'))])
+
+    def test_lines_spanning_chunks(self):
+        content = b''.join(b'line %d %s\n' % (i, b'x' * (i % 13)) for i in range(200))
+
+        with patch('parser.reverse_reader.INITIAL_CHUNK_SIZE', 7), \
+             patch('parser.reverse_reader.MAX_CHUNK_SIZE', 16):
+            result = list(reverse_line_spans(io.BytesIO(content)))
+
+        self.assertEqual([line for _, line in result], list(reversed(content.split(b'\n'))))
+        for offset, line in result:
+            self.assertEqual(content[offset:offset + len(line)], line)
+
+    def test_end_and_start_bounds(self):
+        content = b'aaa\nbbb\nccc\nddd\n'
+
+        result = list(reverse_line_spans(io.BytesIO(content), end=12, start=4))
+
+        self.assertEqual(result, [(8, b'ccc'), (4, b'bbb')])
+
+    def test_empty_file(self):
+        self.assertEqual(list(reverse_lines(io.BytesIO(b''))), [])
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+from parser import metrics
+from parser.scheduler import INTERACTIVE, SCAN, Admission, run_tasks
+
+
+class TestRunTasks(unittest.TestCase):
+
+    def test_results_are_in_order_and_within_quota(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def task(number):
+            with lock:
+                running.append(number)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(number)
+            return number * 2
+
+        results = run_tasks(task, ((number,) for number in range(10)), quota=2)
+        self.assertEqual(results, [number * 2 for number in range(10)])
+        self.assertLessEqual(max(peak), 2)
+
+    def test_tasks_are_recorded_for_the_request(self):
+        scan = metrics.start_scan()
+        run_tasks(metrics.record_scan, [(10,), (20,)])
+        metrics.stop_scan()
+        self.assertEqual(scan.bytes, 30)
+
+    def test_exception_is_raised(self):
+        def task(number):
+            if number == 1:
+                raise OSError('unreadable')
+            return number
+
+        with self.assertRaises(OSError):
+            run_tasks(task, [(0,), (1,), (2,)])
+
+
+class TestAdmission(unittest.TestCase):
+
+    def acquire_in_thread(self, admission, priority, admitted):
+        thread = threading.Thread(target=lambda: admitted.append((priority, admission.acquire(priority))))
+        thread.start()
+        return thread
+
+    def wait_for_queue(self, admission, length):
+        deadline = time.monotonic() + 1
+        while len(admission._waiting) < length and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def test_requests_are_admitted_up_to_the_limit(self):
+        admission = Admission(max_active=2, max_queue=0, timeout=1, reserved=0)
+        first = admission.acquire(SCAN)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(admission.acquire(SCAN))
+        self.assertIsNone(admission.acquire(SCAN))
+
+        admission.release(first)
+        admission.release(first)
+        self.assertIsNotNone(admission.acquire(SCAN))
+        self.assertIsNone(admission.acquire(SCAN))
+
+    def test_slots_are_reserved_for_interactive_requests(self):
+        admission = Admission(max_active=2, max_queue=0, timeout=1, reserved=1)
+        self.assertIsNotNone(admission.acquire(SCAN))
+        self.assertIsNone(admission.acquire(SCAN))
+        self.assertIsNotNone(admission.acquire(INTERACTIVE))
+        self.assertEqual(admission.stats()["active"], {"interactive": 1, "scan": 1})
+
+    def test_waiting_request_is_shed_after_timeout(self):
+        admission = Admission(max_active=1, max_queue=1, timeout=0.01)
+        admission.acquire(SCAN)
+        self.assertIsNone(admission.acquire(SCAN))
+        self.assertEqual(admission.stats()["waiting"], {"interactive": 0, "scan": 0})
+        self.assertGreaterEqual(admission.retry_after(), 1)
+
+    def test_interactive_requests_are_admitted_first(self):
+        admission = Admission(max_active=1, max_queue=4, timeout=1)
+        ticket = admission.acquire(INTERACTIVE)
+        admitted = []
+        threads = [self.acquire_in_thread(admission, SCAN, admitted)]
+        self.wait_for_queue(admission, 1)
+        threads.append(self.acquire_in_thread(admission, INTERACTIVE, admitted))
+        self.wait_for_queue(admission, 2)
+
+        admission.release(ticket)
+        threads[1].join()
+        self.assertEqual([priority for priority, _ in admitted], [INTERACTIVE])
+
+        admission.release(admitted[0][1])
+        threads[0].join()
+        self.assertEqual([priority for priority, _ in admitted], [INTERACTIVE, SCAN])
+        self.assertTrue(all(admitted_ticket is not None for _, admitted_ticket in admitted))
+
+
+if __name__ == '__main__':
+    unittest.main()
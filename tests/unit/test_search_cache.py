@@ -0,0 +1,113 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import metrics
+from parser.query import Query
+from parser.search_cache import SearchCache
+from parser.search_logs import search_directory
+
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'syslog')
+        self.write('w', 'ERROR first\nok\nERROR second\n')
+        self.cache = SearchCache(1024 * 1024)
+        self.patches = [
+            patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}),
+            patch('parser.search_logs.search_cache', self.cache),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        metrics.stop_scan()
+        self.directory.cleanup()
+
+    def write(self, mode, text, file_path=None):
+        with open(file_path or self.file_path, mode) as f:
+            f.write(text)
+
+    def search(self, keyword='ERROR', query=None):
+        scan = metrics.start_scan()
+        results = search_directory(keyword, query)
+        return results, scan.bytes
+
+    def test_repeated_search_does_not_scan_again(self):
+        first, _ = self.search()
+        second, scanned = self.search()
+
+        self.assertEqual(second, {self.file_path: ['ERROR first', 'ERROR second']})
+        self.assertEqual(first, second)
+        self.assertEqual(scanned, 0)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+
+    def test_only_appended_bytes_are_scanned(self):
+        self.search()
+        self.write('a', 'ok\nERROR third\n')
+
+        results, scanned = self.search()
+        self.assertEqual(results[self.file_path], ['ERROR first', 'ERROR second', 'ERROR third'])
+        self.assertEqual(scanned, len('ok\nERROR third\n'))
+        self.assertEqual(self.cache.extensions, 1)
+
+    def test_incomplete_last_line_is_not_cached(self):
+        self.write('a', 'ERROR partial')
+        results, _ = self.search()
+        self.assertEqual(results[self.file_path][-1], 'ERROR partial')
+
+        self.write('a', ' line\nok\n')
+        results, _ = self.search()
+        self.assertEqual(results[self.file_path], ['ERROR first', 'ERROR second', 'ERROR partial line'])
+
+    def test_truncated_file_is_searched_again(self):
+        self.search()
+        # The file is truncated and grows back past the cached offset before the next search.
+        self.write('w', 'ok\nERROR after truncation\n' + 'ok\n' * 10)
+
+        results, _ = self.search()
+        self.assertEqual(results[self.file_path], ['ERROR after truncation'])
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_rotated_file_is_searched_again(self):
+        self.search()
+        os.rename(self.file_path, self.file_path + '.1')
+        self.write('w', 'ERROR rotated\n')
+
+        results, _ = self.search()
+        self.assertEqual(results[self.file_path], ['ERROR rotated'])
+        self.assertEqual(results[self.file_path + '.1'], ['ERROR first', 'ERROR second'])
+
+    def test_compressed_file_is_cached(self):
+        with gzip.open(os.path.join(self.directory.name, 'syslog.2.gz'), 'wt') as f:
+            f.write('ERROR old\n')
+        self.search()
+
+        results, scanned = self.search()
+        self.assertEqual(results[self.file_path + '.2.gz'], ['ERROR old'])
+        self.assertEqual(scanned, 0)
+
+    def test_queries_are_cached_apart(self):
+        self.search()
+        results, _ = self.search(query=Query('second'))
+        self.assertEqual(results[self.file_path], ['ERROR second'])
+
+    def test_least_recently_used_query_is_evicted(self):
+        cache = SearchCache(190)
+        for keyword in ('first', 'second', 'first', 'ok'):
+            key = cache.key(self.directory.name, keyword)
+            matches, _ = cache.search_file(self.file_path, keyword, previous=cache.lookup(key).get(self.file_path))
+            cache.store(key, {self.file_path: matches})
+
+        self.assertEqual(list(cache._entries), [cache.key(self.directory.name, 'first'), cache.key(self.directory.name, 'ok')])
+        self.assertLessEqual(cache.stats()["bytes"], 190)
+
+
+if __name__ == '__main__':
+    unittest.main()
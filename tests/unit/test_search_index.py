@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import search_index
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_directory = os.path.join(self.directory.name, 'logs')
+        os.makedirs(self.log_directory)
+        self.file_path = os.path.join(self.log_directory, 'app.log')
+        self.environ = patch.dict(os.environ, {
+            'CACHE_DIRECTORY': os.path.join(self.directory.name, 'cache'),
+            'SEARCH_INDEX': '1',
+        })
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.directory.cleanup()
+
+    def write(self, content: str, mode: str = 'w') -> None:
+        with open(self.file_path, mode) as f:
+            f.write(content)
+
+    def test_search_uses_substring_semantics(self):
+        self.write('connection error on db1\nall good\nerrors: 3 timeouts\n')
+        search_index.update_directory(self.log_directory)
+
+        result = search_index.search_file(self.file_path, 'error')
+
+        self.assertEqual(result, ['connection error on db1', 'errors: 3 timeouts'])
+
+    def test_keyword_tokens_match_parts_of_line_tokens(self):
+        lines = ['connection error on db1', 'reconnect to db10 failed', 'errors: 3 timeouts', 'all good']
+        self.write('\n'.join(lines) + '\n')
+        search_index.update_file(self.file_path)
+
+        for keyword in ('rror', 'rr', 'ection err', 'n error on db', 'nnect to db1', ' db1', 'errors:'):
+            with self.subTest(keyword=keyword):
+                self.assertEqual(search_index.search_file(self.file_path, keyword),
+                                 [line for line in lines if keyword in line])
+
+    def test_appended_lines_are_found(self):
+        self.write('first error\n')
+        search_index.update_file(self.file_path)
+        self.write('second error\nunterminated error', mode='a')
+
+        self.assertEqual(search_index.search_file(self.file_path, 'error'),
+                         ['first error', 'second error', 'unterminated error'])
+
+        search_index.update_file(self.file_path)
+        self.assertEqual(search_index.search_file(self.file_path, 'error'),
+                         ['first error', 'second error', 'unterminated error'])
+
+    def test_rotated_file_is_reindexed(self):
+        self.write('old error line\n')
+        search_index.update_file(self.file_path)
+
+        os.rename(self.file_path, self.file_path + '.1')
+        self.write('new error line\n')
+        self.assertIsNone(search_index.search_file(self.file_path, 'error'))
+
+        search_index.update_file(self.file_path)
+        self.assertEqual(search_index.search_file(self.file_path, 'error'), ['new error line'])
+
+    def test_keyword_without_tokens_is_not_answered(self):
+        self.write('--- separator ---\n')
+        search_index.update_file(self.file_path)
+
+        self.assertIsNone(search_index.search_file(self.file_path, '---'))
@@ -1,30 +1,32 @@
+import gzip
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
-from src.parser.search_logs import search_in_file, search_directory
+from src.parser.search_logs import search_in_file, search_directory, iter_search_directory, search_newest_first
+from src.parser.query import Query
 
 class TestSearchLogs(unittest.TestCase):
 
-    @patch('builtins.open', new_callable=mock_open, read_data='This is a test line with keyword\nAnother line without')
+    @patch('builtins.open', new_callable=mock_open, read_data=b'This is a test line with keyword\nAnother line without')
     def test_search_in_file_found(self, mock_file):
         results = {}
         
         search_in_file('/var/log/dummy_file', 'keyword', results)
         
         # Assertions
-        mock_file.assert_called_once_with('/var/log/dummy_file', 'r')
+        mock_file.assert_called_once_with('/var/log/dummy_file', 'rb')
         self.assertIn('/var/log/dummy_file', results)
         self.assertEqual(results['/var/log/dummy_file'], ['This is a test line with keyword'])
 
     @patch('os.environ.get')
-    @patch('os.walk')
-    @patch('builtins.open', new_callable=mock_open, read_data='This is a test line with keyword\nAnother line without')
-    def test_search_directory(self, mock_file, mock_os_walk, mock_environ):
+    @patch('src.parser.file_catalog.FileCatalog.log_files')
+    @patch('builtins.open', new_callable=mock_open, read_data=b'This is a test line with keyword\nAnother line without')
+    def test_search_directory(self, mock_file, mock_log_files, mock_environ):
         
         # Mock the return values
         mock_environ.return_value = '/var/log'
-        mock_os_walk.return_value = [
-            ('/var/log', [], ['file1.txt', 'file2.txt'])
-        ]
+        mock_log_files.return_value = ['/var/log/file1.txt', '/var/log/file2.txt']
         
         results = search_directory('keyword')
         
@@ -34,11 +36,104 @@ class TestSearchLogs(unittest.TestCase):
         self.assertEqual(results['/var/log/file1.txt'], ['This is a test line with keyword'])
         self.assertNotEqual(results['/var/log/file2.txt'], ['Another line without'])
 
-    @patch('builtins.open', new_callable=mock_open, read_data='This is a test line\nAnother line without')
+    @patch('builtins.open', new_callable=mock_open, read_data=b'This is a test line\nAnother line without')
     def test_search_in_file_not_found(self, mock_file):
         results = {}
         search_in_file('/var/log/dummy_file', 'keyword', results)
 
         # Assertions
-        mock_file.assert_called_once_with('/var/log/dummy_file', 'r')
-        self.assertNotIn('/var/log/dummy_file', results)
\ No newline at end of file
+        mock_file.assert_called_once_with('/var/log/dummy_file', 'rb')
+        self.assertNotIn('/var/log/dummy_file', results)
+
+    @patch('os.environ.get')
+    @patch('src.parser.file_catalog.FileCatalog.log_files')
+    @patch('builtins.open', new_callable=mock_open, read_data=b'This is a test line with keyword\nAnother line without')
+    def test_iter_search_directory(self, mock_file, mock_log_files, mock_environ):
+
+        # Mock the return values
+        mock_environ.return_value = '/var/log'
+        mock_log_files.return_value = ['/var/log/file1.txt', '/var/log/file2.txt']
+
+        results = list(iter_search_directory('keyword'))
+
+        # Assertions
+        self.assertEqual(results, [
+            ('/var/log/file1.txt', 'This is a test line with keyword'),
+            ('/var/log/file2.txt', 'This is a test line with keyword'),
+        ])
+
+    def test_search_newest_first_with_limit_and_cursor(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            # The most recently modified file is searched first, whatever its name.
+            for name, mtime in (('a.log', 1000), ('b.log', 2000)):
+                with open(os.path.join(log_directory, name), 'w') as f:
+                    f.write(''.join(f'{name} {i} keyword\nother line\n' for i in range(1, 4)))
+                os.utime(os.path.join(log_directory, name), (mtime, mtime))
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                first_page = search_newest_first('keyword', limit=4)
+                # A file modified in between does not change the order of the next pages.
+                os.utime(os.path.join(log_directory, 'a.log'), (3000, 3000))
+                second_page = search_newest_first('keyword', limit=4, cursor=first_page['CURSOR'])
+
+        a_log, b_log = os.path.join(log_directory, 'a.log'), os.path.join(log_directory, 'b.log')
+        self.assertEqual(first_page[b_log], ['b.log 3 keyword', 'b.log 2 keyword', 'b.log 1 keyword'])
+        self.assertEqual(first_page[a_log], ['a.log 3 keyword'])
+        self.assertTrue(first_page['TRUNCATED'])
+        self.assertEqual(second_page, {a_log: ['a.log 2 keyword', 'a.log 1 keyword'], 'TRUNCATED': False})
+
+    def test_iter_search_directory_with_limits(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            for name, mtime in (('a.log', 1000), ('b.log', 2000)):
+                with open(os.path.join(log_directory, name), 'w') as f:
+                    f.write(''.join(f'{name} {i} keyword\n' for i in range(1, 4)))
+                os.utime(os.path.join(log_directory, name), (mtime, mtime))
+
+            status = {}
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                limited = [line for _, line in iter_search_directory('keyword', limit=4, per_file_limit=2,
+                                                                     status=status)]
+
+        # Like `search_newest_first`, the newest matches of the newest file come first.
+        self.assertEqual(limited, ['b.log 3 keyword', 'b.log 2 keyword', 'a.log 3 keyword', 'a.log 2 keyword'])
+        self.assertEqual(status, {'TRUNCATED': True})
+
+    def test_search_newest_first_limit_reached_by_last_match(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            with open(os.path.join(log_directory, 'a.log'), 'w') as f:
+                f.write('1 keyword other\n2 keyword other\n3 keyword\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                result = search_newest_first('keyword', Query('keyword AND NOT other'), limit=1)
+
+        # The lines left after the limit do not match, so nothing was left out.
+        self.assertEqual(result, {os.path.join(log_directory, 'a.log'): ['3 keyword'], 'TRUNCATED': False})
+
+    def test_search_newest_first_stops_while_decompressing(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            with gzip.open(os.path.join(log_directory, 'a.log.1.gz'), 'wt') as f:
+                f.write('1 keyword\n2 keyword\n')
+
+            def expire(*args):
+                raise TimeoutError("Decompressing did not finish in time.")
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}), \
+                    patch('src.parser.log_readers.run_decompression', side_effect=expire):
+                result = search_newest_first('keyword', timeout_ms=1000)
+
+        self.assertTrue(result['TRUNCATED'])
+        self.assertIn('CURSOR', result)
+
+    def test_search_newest_first_per_file_limit(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            with open(os.path.join(log_directory, 'a.log'), 'w') as f:
+                f.write('1 keyword\n2 keyword\n3 keyword\n')
+
+            with patch.dict(os.environ, {'LOG_DIRECTORY': log_directory}):
+                result = search_newest_first('keyword', per_file_limit=1)
+
+        self.assertEqual(result, {os.path.join(log_directory, 'a.log'): ['3 keyword'], 'TRUNCATED': True})
+
+    def test_search_newest_first_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            search_newest_first('keyword', cursor='invalid')
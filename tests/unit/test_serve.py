@@ -0,0 +1,46 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import requests
+
+from parser.serve import open_socket
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src')
+
+
+class TestServe(unittest.TestCase):
+
+    def test_sockets_share_port(self):
+        reservation = open_socket('127.0.0.1', 0, listen=False)
+        port = reservation.getsockname()[1]
+        listeners = [open_socket('127.0.0.1', port, listen=True) for _ in range(2)]
+        try:
+            self.assertEqual({listener.getsockname()[1] for listener in listeners}, {port})
+        finally:
+            for sock in listeners + [reservation]:
+                sock.close()
+
+    def test_workers_serve_and_stop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            environment = dict(os.environ, PYTHONPATH=SRC, LOG_DIRECTORY=directory,
+                               CACHE_DIRECTORY=os.path.join(directory, 'cache'))
+            server = subprocess.Popen([sys.executable, '-m', 'parser.serve', '--port', '0', '--workers', '2',
+                                       '--no-access-log'], env=environment, stdout=subprocess.PIPE, text=True)
+            try:
+                line = server.stdout.readline()
+                self.assertIn('with 2 worker processes', line)
+                base_url = re.search(r'http://\S+', line).group(0)
+                for _ in range(4):
+                    self.assertEqual(requests.get(base_url + '/', timeout=10).status_code, 200)
+            finally:
+                server.terminate()
+                self.assertEqual(server.wait(timeout=10), 0)
+                server.stdout.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
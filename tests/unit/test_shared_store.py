@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser import shared_store
+from parser.file_catalog import FileCatalog
+from parser.search_cache import SearchCache
+
+
+class TestSharedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_directory = os.path.join(self.directory.name, 'logs')
+        os.makedirs(self.log_directory)
+        self.file_path = os.path.join(self.log_directory, 'syslog')
+        with open(self.file_path, 'w') as f:
+            f.write('ERROR first\nok\n')
+        self.environment = patch.dict(os.environ, {
+            'CACHE_DIRECTORY': os.path.join(self.directory.name, 'cache'), 'SHARED_CACHE': '1'
+        })
+        self.environment.start()
+
+    def tearDown(self):
+        self.environment.stop()
+        shared_store._forget_connections()
+        self.directory.cleanup()
+
+    def test_search_results_are_evicted_to_fit_budget(self):
+        shared_store.save_search_results('first', '{}', 60, 100)
+        shared_store.save_search_results('second', '{}', 30, 100)
+        shared_store.save_search_results('third', '{}', 30, 100)
+
+        self.assertIsNone(shared_store.load_search_results('first'))
+        self.assertEqual(shared_store.load_search_results('third'), '{}')
+
+    def test_search_continues_from_another_worker(self):
+        first, second = SearchCache(1024 * 1024), SearchCache(1024 * 1024)
+        key = first.key(self.log_directory, 'ERROR')
+        matches, _ = first.search_file(self.file_path, 'ERROR')
+        first.store(key, {self.file_path: matches})
+
+        with open(self.file_path, 'a') as f:
+            f.write('ERROR second\n')
+        previous = second.lookup(key)
+        matches, _ = second.search_file(self.file_path, 'ERROR', previous=previous.get(self.file_path))
+
+        self.assertEqual(matches.matches, ['ERROR first', 'ERROR second'])
+        self.assertEqual((second.misses, second.extensions), (0, 1))
+
+    def test_unchanged_results_are_not_stored_again(self):
+        cache = SearchCache(1024 * 1024)
+        key = cache.key(self.log_directory, 'ERROR')
+        matches, _ = cache.search_file(self.file_path, 'ERROR')
+        cache.store(key, {self.file_path: matches})
+
+        previous = cache.lookup(key)
+        matches, _ = cache.search_file(self.file_path, 'ERROR', previous=previous[self.file_path])
+        with patch.object(shared_store, 'save_search_results') as save:
+            cache.store(key, {self.file_path: matches}, previous)
+        save.assert_not_called()
+
+    def test_file_kinds_are_detected_once_across_workers(self):
+        FileCatalog(self.log_directory).files()
+        with patch('parser.file_catalog.detect_kind') as detect_kind:
+            infos = FileCatalog(self.log_directory).files()
+        detect_kind.assert_not_called()
+        self.assertEqual([(info.path, info.kind) for info in infos], [(self.file_path, 'text')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from parser.sketches import CountMinSketch, HyperLogLog, TopK
+
+
+class TestSketches(unittest.TestCase):
+
+    def test_count_min_never_underestimates(self):
+        sketch = CountMinSketch(width=64, depth=4)
+        for number in range(1000):
+            sketch.add(f'item{number % 100}')
+
+        self.assertEqual(sketch.total, 1000)
+        for number in range(100):
+            self.assertGreaterEqual(sketch.estimate(f'item{number}'), 10)
+        self.assertEqual(sketch.add('item0', 5), sketch.estimate('item0'))
+
+    def test_hyperloglog_estimates_distinct_items(self):
+        small, large = HyperLogLog(), HyperLogLog()
+        for number in range(50):
+            small.add(f'user{number}')
+            small.add(f'user{number}')
+        for number in range(100000):
+            large.add(number)
+
+        self.assertAlmostEqual(small.count(), 50, delta=2)
+        self.assertAlmostEqual(large.count(), 100000, delta=3000)
+
+    def test_top_k_keeps_most_frequent_items(self):
+        top = TopK(2)
+        for number in range(2000):
+            top.add(f'rare{number}')
+            if number % 2 == 0:
+                top.add('frequent')
+            if number % 4 == 0:
+                top.add('common', 1)
+
+        self.assertEqual([item for item, _ in top.items()], ['frequent', 'common'])
+        self.assertGreaterEqual(top.items()[0][1], 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser.query import Query
+from parser.stats import StreamAggregator, aggregate, parse_bucket
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'app.log')
+        with open(self.file_path, 'w') as f:
+            f.write('2026-01-01T10:00:05Z web1 auth[1]: ERROR login failed user=alice\n'
+                    '2026-01-01T10:00:40Z web1 auth[1]: INFO login ok user=bob\n'
+                    '    at login.check\n'
+                    '2026-01-01T10:01:10Z web2 cron[2]: ERROR job failed\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_bucket_is_parsed(self):
+        self.assertEqual(parse_bucket('90'), 90)
+        self.assertEqual(parse_bucket('5m'), 300)
+        self.assertEqual(parse_bucket('1d'), 86400)
+        for value in ('0', '-1', '5w', ''):
+            with self.assertRaises(ValueError):
+                parse_bucket(value)
+
+    def test_entries_are_summarized(self):
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            results = aggregate('ERROR', fields=['program', 'user'])
+
+        self.assertEqual(results["TOTAL"], 2)
+        self.assertEqual(results["FILES"], {self.file_path: 2})
+        self.assertEqual(results["HISTOGRAM"], {"2026-01-01T10:00:00Z": 1, "2026-01-01T10:01:00Z": 1})
+        self.assertEqual(results["TOP_TERMS"][0], ["ERROR", 2])
+        self.assertEqual(results["FIELDS"]["program"], {"top": [["auth", 1], ["cron", 1]], "distinct": 2})
+        self.assertEqual(results["FIELDS"]["user"], {"top": [["alice", 1]], "distinct": 1})
+
+        with patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name}):
+            results = aggregate(query=Query('login'), bucket=3600)
+        self.assertEqual((results["TOTAL"], results["BUCKET_SECONDS"]), (3, 3600))
+        # The continuation line belongs to the entry before it.
+        self.assertEqual((results["HISTOGRAM"], results["UNTIMED"]), ({"2026-01-01T10:00:00Z": 3}, 0))
+
+    def test_untimed_lines_before_the_first_entry_of_a_file(self):
+        aggregator = StreamAggregator()
+        aggregator.add('a.log', '2026-01-01T10:00:05Z start')
+        aggregator.add('b.log', 'no timestamp yet')
+        aggregator.add('b.log', '2026-01-01T10:00:06Z start')
+        aggregator.add('b.log', '  continued')
+        results = aggregator.result()
+
+        self.assertEqual((results["HISTOGRAM"], results["UNTIMED"]), ({"2026-01-01T10:00:00Z": 3}, 1))
+
+    def test_sub_second_buckets_parse_every_timestamp(self):
+        aggregator = StreamAggregator(bucket=0.5)
+        aggregator.add('app.log', '2026-01-01T10:00:00.1Z first')
+        aggregator.add('app.log', '2026-01-01T10:00:00.7Z second')
+        results = aggregator.result()
+
+        self.assertEqual(results["HISTOGRAM"], {"2026-01-01T10:00:00Z": 1, "2026-01-01T10:00:00.500Z": 1})
+
+    def test_histogram_is_widened_to_bounded_buckets(self):
+        aggregator = StreamAggregator(bucket=1)
+        with patch('parser.stats.MAX_BUCKETS', 4):
+            for second in range(10):
+                aggregator.add('app.log', f'2026-01-01T10:00:{second:02d}Z event')
+        results = aggregator.result()
+
+        self.assertEqual(results["BUCKET_SECONDS"], 4)
+        self.assertEqual(sum(results["HISTOGRAM"].values()), 10)
+        self.assertLessEqual(len(results["HISTOGRAM"]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
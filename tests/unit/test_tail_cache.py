@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from parser.tail_cache import TailCache
+
+
+class TestTailCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'app.log')
+        with open(self.file_path, 'w') as f:
+            f.write('line 1\nline 2\nline 3\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cached_request_does_not_read_file(self):
+        cache = TailCache(1024 * 1024)
+        cache.read_tail(self.file_path, 2)
+
+        with patch('builtins.open') as mock_open_fn:
+            lines, oldest_offset, _ = cache.read_tail(self.file_path, 1)
+
+        mock_open_fn.assert_not_called()
+        self.assertEqual(lines, ['line 3'])
+        self.assertEqual(oldest_offset, 14)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_invalid_utf8_follows_decode_policy(self):
+        cache = TailCache(1024 * 1024)
+        with open(self.file_path, 'ab') as f:
+            f.write(b'bad \xff\xfe\n')
+        self.assertEqual(cache.read_tail(self.file_path, 2)[0], ['bad \ufffd\ufffd', 'line 3'])
+
+        with open(self.file_path, 'ab') as f:
+            f.write(b'worse \xff\n')
+        with patch.dict(os.environ, {'DECODE_ERRORS': 'skip'}):
+            lines, _, _ = cache.read_tail(self.file_path, 2)
+        self.assertEqual(lines, ['bad \ufffd\ufffd', 'line 3'])
+
+    def test_appended_lines_extend_entry(self):
+        cache = TailCache(1024 * 1024)
+        cache.read_tail(self.file_path, 2)
+
+        with open(self.file_path, 'a') as f:
+            f.write('line 4\n\nline 5\n')
+        lines, oldest_offset, _ = cache.read_tail(self.file_path, 2)
+
+        self.assertEqual(lines, ['line 5', 'line 4'])
+        self.assertEqual(oldest_offset, 21)
+        self.assertEqual(cache.stats()["extensions"], 1)
+
+    def test_rotated_file_is_read_again(self):
+        cache = TailCache(1024 * 1024)
+        cache.read_tail(self.file_path, 2)
+
+        os.rename(self.file_path, self.file_path + '.1')
+        with open(self.file_path, 'w') as f:
+            f.write('new line\n')
+        lines, _, _ = cache.read_tail(self.file_path, 2)
+
+        self.assertEqual(lines, ['new line'])
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_eviction_keeps_cache_within_budget(self):
+        other_path = os.path.join(self.directory.name, 'other.log')
+        with open(other_path, 'w') as f:
+            f.write('other line\n')
+        cache = TailCache(200)
+
+        cache.read_tail(self.file_path, 3)
+        cache.read_tail(other_path, 1)
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], 200)
@@ -0,0 +1,139 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from parser.timestamps import line_timestamp, parse_time, time_window
+from parser import read_single_file, read_log_page, search_directory, search_newest_first
+
+BASE = datetime(2026, 10, 18, 2, 0, tzinfo=timezone.utc).timestamp()
+
+
+def make_log(n_entries: int, every: int = 1) -> bytes:
+    """Builds a log with one ISO-8601 entry per second, where every `every`-th entry has a continuation line."""
+    lines = []
+    for i in range(n_entries):
+        moment = datetime.fromtimestamp(BASE + i, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines.append(f'{moment} entry {i}\n')
+        if i % every == 0:
+            lines.append(f'    continuation of {i}\n')
+    return ''.join(lines).encode('utf-8')
+
+
+class CountingBytesIO(io.BytesIO):
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.seeks = 0
+
+    def seek(self, *args):
+        self.seeks += 1
+        return super().seek(*args)
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_line_timestamp_formats(self):
+        self.assertEqual(line_timestamp(b'2026-10-18T02:00:00Z GET /'), BASE)
+        self.assertEqual(line_timestamp(b'[2026-10-18 02:00:00,500] INFO'), BASE + 0.5)
+        self.assertEqual(line_timestamp(b'2026-10-18T04:00:00+02:00 x'), BASE)
+        self.assertEqual(line_timestamp(b'1792288800 x'), 1792288800.0)
+        self.assertEqual(line_timestamp(b'1792288800123 x'), 1792288800.123)
+        syslog = datetime.fromtimestamp(line_timestamp(b'Oct  8 02:10:00 host sshd[1]: x'), timezone.utc)
+        self.assertEqual((syslog.month, syslog.day, syslog.hour, syslog.minute), (10, 8, 2, 10))
+        self.assertIsNone(line_timestamp(b'    at Foo.bar(Foo.java:10)'))
+        self.assertIsNone(line_timestamp(b'2026-13-45T02:00:00Z invalid date'))
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('2026-10-18T02:00'), BASE)
+        self.assertEqual(parse_time(str(BASE)), BASE)
+        self.assertEqual(parse_time('2026-10-18 04:00:00+02:00'), BASE)
+        with self.assertRaises(ValueError):
+            parse_time('yesterday')
+
+    def test_time_window_matches_linear_scan(self):
+        data = make_log(5000, every=3)
+        lines = data.splitlines(keepends=True)
+        for since, until in [(BASE + 1234, BASE + 1300), (BASE - 10, BASE + 5), (BASE + 4990, None),
+                             (None, BASE + 2), (BASE + 6000, None), (BASE + 100.5, BASE + 100.7)]:
+            # The expected window, found by reading every line.
+            start, end, offset = None, None, 0
+            for line in lines:
+                timestamp = line_timestamp(line)
+                if timestamp is not None:
+                    if start is None and (since is None or timestamp >= since):
+                        start = offset
+                    if end is None and until is not None and timestamp > until:
+                        end = offset
+                offset += len(line)
+            start = len(data) if start is None else start
+            end = len(data) if end is None else end
+
+            self.assertEqual(time_window(io.BytesIO(data), since, until), (start, max(start, end)))
+
+    def test_time_window_seeks_logarithmically(self):
+        data = make_log(100000, every=10)
+        f = CountingBytesIO(data)
+
+        start, end = time_window(f, BASE + 50000, BASE + 50010)
+
+        self.assertTrue(data[start:].startswith(b'2026-10-18T15:53:20Z entry 50000\n'))
+        self.assertEqual(data[start:end].count(b'entry'), 11)
+        self.assertLess(f.seeks, 60)
+
+    def test_time_window_without_timestamps(self):
+        self.assertEqual(time_window(io.BytesIO(b'no time here\nnor here\n'), BASE, None), (0, 0))
+
+
+class TestTimeWindowQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'app.log')
+        with open(self.file_path, 'wb') as f:
+            f.write(make_log(100, every=50))
+        with gzip.open(self.file_path + '.1.gz', 'wb') as f:
+            f.write(b'2026-10-18T01:59:58Z old entry 1\n2026-10-18T01:59:59Z old entry 2\n')
+        self.environ = patch.dict(os.environ, {'LOG_DIRECTORY': self.directory.name})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.directory.cleanup()
+
+    def test_read_single_file_window(self):
+        results = {}
+        read_single_file(self.file_path, results, since=BASE + 49, until=BASE + 51)
+
+        self.assertEqual(results[self.file_path], [
+            '2026-10-18T02:00:51Z entry 51', '    continuation of 50',
+            '2026-10-18T02:00:50Z entry 50', '2026-10-18T02:00:49Z entry 49'
+        ])
+
+    def test_read_log_page_window_spans_rotations(self):
+        results = read_log_page('app.log', 10, since=BASE - 1.5, until=BASE)
+
+        self.assertEqual(results[self.file_path], [
+            '    continuation of 0', '2026-10-18T02:00:00Z entry 0', '2026-10-18T01:59:59Z old entry 2'
+        ])
+
+    def test_search_directory_window(self):
+        results = search_directory('entry', since=BASE - 1, until=BASE + 1)
+
+        self.assertEqual(results, {
+            self.file_path: ['2026-10-18T02:00:00Z entry 0', '2026-10-18T02:00:01Z entry 1'],
+            self.file_path + '.1.gz': ['2026-10-18T01:59:59Z old entry 2'],
+        })
+
+    def test_search_newest_first_window(self):
+        results = search_newest_first('entry', limit=2, since=BASE + 10, until=BASE + 20)
+
+        self.assertEqual(results[self.file_path], ['2026-10-18T02:00:20Z entry 20', '2026-10-18T02:00:19Z entry 19'])
+        self.assertTrue(results["TRUNCATED"])
+
+
+if __name__ == '__main__':
+    unittest.main()